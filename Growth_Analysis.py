@@ -1,121 +1,167 @@
+import os
 import time
 import cv2
-import numpy as np
-import firebase_admin
-from firebase_admin import credentials, storage, db
 from datetime import datetime
 from ultralytics import YOLO
-
-# Firebase Initialization
-cred = credentials.Certificate("/home/Agrisense/Thesis/venv/serviceAccountKey.json")
-firebase_admin.initialize_app(cred, {
-    'databaseURL': 'https://agrisense-6a089-default-rtdb.asia-southeast1.firebasedatabase.app/',
-    'storageBucket': 'agrisense-6a089.appspot.com'
-})
-
-# Load YOLO Model
-model = YOLO("/home/Agrisense/Thesis/best.pt")
-
-# Camera Setup
-camera = cv2.VideoCapture(0)
+from plant_tracker import PlantTracker
+from growth_classifier import StageClassifier
+from camera_calibration import CameraModel
+from leaf_segmentation import CanopyMask
+from frame_quality import FrameQualityGate
+from annotation_renderer import AnnotationRenderer
+from burst_capture import BURST_FRAMES, BurstCapture
+from firebase_client import get_client
+from runtime_config import configure_threads, warm_up, ResourceGovernor
+from replay_source import ReplaySource, open_capture_source
+from capture_journal import CaptureJournal
+from growth_analytics import GrowthAnalytics, capture_metrics
+from adaptive_resolution import AdaptiveResolution
+
+# Firebase Initialization: one shared, pooled client (USE_FIREBASE_EMULATOR=1 runs against the in-process emulator)
+firebase = get_client()
+
+# Load YOLO Model (MODEL_PATH overrides the default weights)
+model = YOLO(os.getenv("MODEL_PATH", "/home/Agrisense/Thesis/best.pt"))
+
+# Runtime setup: fixed thread pools, warm-up pass, and a governor for heat / load
+configure_threads()
+warm_up(model)
+governor = ResourceGovernor()
+
+# Per-frame imgsz: low first, escalated for small or uncertain boxes, remembered per tray
+resolution = AdaptiveResolution(governor=governor)
+
+# Camera Setup (CAPTURE_SOURCE replays a directory, video file or RTSP stream instead)
+camera = open_capture_source(lambda: cv2.VideoCapture(0))
+replay = camera if isinstance(camera, ReplaySource) else None
+if BURST_FRAMES > 1 and replay is None:
+    camera = BurstCapture(camera)  # Keep the sharpest, best exposed frame of each burst
 
 # Trigonometry Constants
 CAMERA_ANGLE = 45  # Degrees
 CAMERA_HEIGHT = 30  # cm (Height from the ground)
 FOCAL_LENGTH = 800  # Pixels (Calibrated for estimation)
 
-# Growth Stage Thresholds (Adjustable)
-GROWTH_THRESHOLDS = {
-    "seedling": {"height": 5, "leaves": 4, "leaf_area": 15},
-    "vegetative": {"height": 15, "leaves": 8, "leaf_area": 50},
-    "mature": {"height": 25, "leaves": 12, "leaf_area": 100},
-}
-
-# Function to estimate height using trigonometry
-def estimate_height(bbox):
-    pixel_height = bbox[3] - bbox[1]
-    real_height = (CAMERA_HEIGHT * pixel_height) / FOCAL_LENGTH
-    real_height /= np.tan(np.radians(CAMERA_ANGLE))
-    return round(real_height, 2)
-
-# Function to estimate leaf area
-def estimate_leaf_area(bbox):
-    pixel_width = bbox[2] - bbox[0]
-    pixel_height = bbox[3] - bbox[1]
-    pixel_area = pixel_width * pixel_height  # Approximate area in pixels
-
-    # Convert pixel area to cm² (Adjust scaling factor based on calibration)
-    scale_factor = 0.05  
-    real_area = pixel_area * scale_factor
-    return round(real_area, 2)
+# Growth Stage Thresholds (per-crop tables in growth_stages.json, reloaded when edited)
+stage_classifier = StageClassifier(crop=os.getenv("CROP_TYPE"), hot_reload=True)
+
+# Camera model: checkerboard calibration if present (camera_calibration.py), else FOCAL_LENGTH
+camera_model = CameraModel.load(CAMERA_HEIGHT, CAMERA_ANGLE, FOCAL_LENGTH)
+
+# Function to estimate height from the per-pixel scale table
+def estimate_height(bbox, view):
+    return round(view.box_height_cm(bbox), 2)
+
+# Function to estimate leaf area: green canopy pixels in the box on the ground-plane area table
+def estimate_leaf_area(bbox, view, canopy):
+    return round(canopy.box_area_cm2(bbox, view), 2)
 
 # Function to classify growth stage
 def classify_growth(height, leaf_count, leaf_area):
-    if height < GROWTH_THRESHOLDS["seedling"]["height"] and leaf_count < GROWTH_THRESHOLDS["seedling"]["leaves"] and leaf_area < GROWTH_THRESHOLDS["seedling"]["leaf_area"]:
-        return "Seedling"
-    elif height < GROWTH_THRESHOLDS["vegetative"]["height"] and leaf_count < GROWTH_THRESHOLDS["vegetative"]["leaves"] and leaf_area < GROWTH_THRESHOLDS["vegetative"]["leaf_area"]:
-        return "Vegetative"
-    else:
-        return "Mature"
+    return stage_classifier.classify_one(height, leaf_count, leaf_area)
+
+# Pre-inference gate for dark, blurred or empty frames (per-reason counts in quality_gate.stats)
+quality_gate = FrameQualityGate()
+
+# Annotated output: one reused buffer, rendered every ANNOTATE_EVERY_N captures
+renderer = AnnotationRenderer()
+
+# Per-plant tracking across captures (smooths height/area and the reported stage)
+tracker = PlantTracker(classify_many=stage_classifier.classify_names)
+
+# Write-ahead journal of each frame's pipeline state, replayed at start-up (capture_journal.py)
+journal = CaptureJournal("analysis")
+
+# Running growth rates, anomaly z-scores and stall alerts, updated per capture (growth_analytics.py)
+growth = GrowthAnalytics()
+TRAY_ID = os.getenv("TRAY_ID", "tray1")
 
 # Function to capture, process, and upload images
 def capture_and_upload():
     ret, frame = camera.read()
     if not ret:
         print("❌ Failed to capture image")
-        return
+        return False
     
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    # Replayed frames keep their recorded time so reruns produce identical records
+    timestamp = (replay.timestamp if replay else datetime.now()).strftime("%Y-%m-%d_%H-%M-%S")
+
+    # Save raw image (replayed image files are used in place, never rewritten)
+    if replay is not None and replay.path:
+        raw_image_path = replay.path
+    else:
+        raw_image_path = f"/home/Agrisense/Thesis/raw_{timestamp}.jpg"
+        cv2.imwrite(raw_image_path, frame)
+    journal.mark(timestamp, "captured", raw=raw_image_path)
+
+    analyze_and_upload(frame, timestamp, raw_image_path)
+    return True
+
+# Function to run detection on a captured frame, then upload the results
+def analyze_and_upload(frame, timestamp, raw_image_path):
+    # Frames that fail the quality gate get a small "skipped" record instead of inference and uploads
+    quality = quality_gate.check(frame)
+    if not quality.ok:
+        firebase.reference("/").update(quality_gate.skipped_update(timestamp, quality))
+        journal.mark(timestamp, "skipped", reason=quality.reason)
+        print(f"⏭️ Skipped {timestamp}: {quality.reason} {quality.metrics}")
+        return
 
-    # Save raw image
-    raw_image_path = f"/home/Agrisense/Thesis/raw_{timestamp}.jpg"
-    cv2.imwrite(raw_image_path, frame)
+    # Undistort once; the scale tables are built for undistorted pixels
+    view = camera_model.view(frame.shape)
+    frame = view.undistort(frame)
 
     # Run YOLO Object Detection
-    results = model.predict(frame)
-    detected_frame = frame.copy()  # Copy original image to draw on
+    results, _ = resolution.predict(model, frame, tray=TRAY_ID)
+    canopy = CanopyMask(frame)  # Vegetation mask for per-box leaf area
 
     # Extract growth parameters
-    leaf_count = 0
-    total_leaf_area = 0
-    estimated_height = 0
-
+    boxes = []
+    detections = []
     for result in results:
         for bbox in result.boxes.xyxy:
             bbox = bbox.cpu().numpy().astype(int)  # Convert to integer
+            boxes.append(bbox)
+            detections.append((bbox, estimate_height(bbox, view), estimate_leaf_area(bbox, view, canopy)))
 
-            estimated_height = estimate_height(bbox)
-            leaf_area = estimate_leaf_area(bbox)
-            total_leaf_area += leaf_area
-            leaf_count += 1
-
-            # Classify Growth Stage
-            growth_stage = classify_growth(estimated_height, leaf_count, total_leaf_area)
+    leaf_count = len(boxes)
+    detections = [detection + (leaf_count,) for detection in detections]
 
-            # Draw bounding box
-            cv2.rectangle(detected_frame, (bbox[0], bbox[1]), (bbox[2], bbox[3]), (0, 255, 0), 2)
+    # Link boxes to plants seen in earlier captures; stages come from the smoothed state
+    tracks = tracker.update(detections)
+    summary = tracker.summary()
 
-            # Label the bounding box with Growth Stage
-            label = f"{growth_stage} ({estimated_height}cm)"
-            cv2.putText(detected_frame, label, (bbox[0], bbox[1] - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+    # Annotated copy (boxes + stage labels in one pass), skipped on decimated cycles
+    detected_image_path = None
+    if renderer.should_render():
+        labels = [f"#{track.track_id} {track.stage} ({round(track.height, 2)}cm)" for track in tracks]
+        detected_image_path = renderer.write(f"/home/Agrisense/Thesis/detected_{timestamp}.jpg", frame, boxes, labels)
 
-    # Save detected image
-    detected_image_path = f"/home/Agrisense/Thesis/detected_{timestamp}.jpg"
-    cv2.imwrite(detected_image_path, detected_frame)
-
-    # Upload images to Firebase Storage
-    bucket = storage.bucket()
-
-    raw_blob = bucket.blob(f"raw_images/raw_{timestamp}.jpg")
-    raw_blob.upload_from_filename(raw_image_path)
-    raw_blob.make_public()
-    raw_image_url = raw_blob.public_url
+    measurements = {
+        "growth_stage": summary["growth_stage"],
+        "estimated_height_cm": summary["height_cm"],
+        "leaf_count": leaf_count,
+        "total_leaf_area_cm2": summary["leaf_area_cm2"]
+    }
 
-    detected_blob = bucket.blob(f"detected_images/detected_{timestamp}.jpg")
-    detected_blob.upload_from_filename(detected_image_path)
-    detected_blob.make_public()
-    detected_image_url = detected_blob.public_url
+    # Fold the capture into the running trends; alerts are known before anything is uploaded
+    metrics = capture_metrics(len(boxes), summary["height_cm"], summary["leaf_area_cm2"], leaf_count)
+    trend = growth.update(timestamp, metrics, series=TRAY_ID)
+    measurements["growth_rate_per_day"] = {name: stats["rate_per_day"] for name, stats in trend["metrics"].items()}
+    measurements["growth_alerts"] = trend["alerts"]
+    if trend["alerts"]:
+        print(f"⚠️ Growth alerts for {timestamp}: {', '.join(trend['alerts'])}")
+    journal.mark(timestamp, "inferred", measurements=measurements, detected=detected_image_path)
+    upload_results(timestamp, raw_image_path, detected_image_path, measurements)
+
+# Function to upload images and the analysis record, then read the record back
+def upload_results(timestamp, raw_image_path, detected_image_path, measurements):
+    # Upload images to Firebase Storage (public on upload, no separate make_public() request)
+    raw_image_url = firebase.upload_public(f"raw_images/raw_{timestamp}.jpg", raw_image_path)
+
+    detected_image_url = None
+    if detected_image_path:
+        detected_image_url = firebase.upload_public(f"detected_images/detected_{timestamp}.jpg", detected_image_path)
 
     print(f"📤 Uploaded to Firebase: {raw_image_url} & {detected_image_url}")
 
@@ -124,20 +170,47 @@ def capture_and_upload():
         "timestamp": timestamp,
         "raw_image_url": raw_image_url,
         "detected_image_url": detected_image_url,
-        "growth_stage": growth_stage,
-        "estimated_height_cm": estimated_height,
-        "leaf_count": leaf_count,
-        "total_leaf_area_cm2": total_leaf_area
+        **measurements
     }
-    ref = db.reference("/plant_analysis")
-    ref.push(data)
+    # Keyed by timestamp rather than push(), so a resumed upload overwrites instead of duplicating
+    ref = firebase.reference("/plant_analysis").child(timestamp)
+    ref.set(data)
+    journal.mark(timestamp, "uploaded")
     print("📡 Data successfully sent to Firebase!")
 
+    if ref.child("timestamp").get() == timestamp:
+        journal.mark(timestamp, "verified")
+
+# Function to finish frames a crash or power loss left unfinished
+def resume_unfinished():
+    for entry in journal.recover():
+        timestamp = entry["frame"]
+        try:
+            if entry["state"] == "captured":
+                frame = cv2.imread(entry["raw"])
+                if frame is None:
+                    journal.mark(timestamp, "dropped")
+                    continue
+                analyze_and_upload(frame, timestamp, entry["raw"])
+            elif entry["state"] == "uploaded" and firebase.reference("/plant_analysis").child(timestamp).child("timestamp").get() == timestamp:
+                journal.mark(timestamp, "verified")
+            else:
+                upload_results(timestamp, entry["raw"], entry["detected"], entry["measurements"])
+        except Exception as e:
+            print(f"❌ Error resuming {timestamp}: {e}")
+    journal.sync()
+
+resume_unfinished()
+
 # Run process every 1 minute
 try:
     while True:
-        capture_and_upload()
-        time.sleep(60)
+        if not capture_and_upload() and replay is not None:
+            print(f"🏁 Replay finished after {replay.frames_read} frames")
+            break
+        governor.update()
+        (replay.sleep if replay else time.sleep)(governor.interval(60))
 except KeyboardInterrupt:
     print("🛑 Stopping capture process")
     camera.release()
+    journal.close()
@@ -0,0 +1,360 @@
+import os
+import time
+import cv2
+import numpy as np
+from datetime import datetime
+from functools import partial
+from frame_bus import FrameBus, run_stages
+from runtime_config import ResourceGovernor
+from capture_journal import CaptureJournal
+
+# Growth_Analysis.py split into four processes on a shared-memory frame bus (frame_bus.py):
+#   capture (this process) -> inference -> post-processing -> upload
+# Frames stay in the bus slots; only slot numbers and small JSON headers cross processes.
+# Each stage loads only what it uses, inside its own process (the model in inference,
+# Firebase in upload). Records and storage paths are the same as Growth_Analysis.py.
+#
+# Every stage appends to the same write-ahead journal (capture_journal.py) as it finishes its
+# step: captured (raw JPEG on disk), inferred (measurements ready), uploaded, verified. The
+# journal is recovered and compacted once at start-up, before any stage process exists;
+# unfinished frames re-enter the bus at inference or go straight to the upload stage.
+
+BASE_DIR = "/home/Agrisense/Thesis"
+CAPTURE_INTERVAL = 60  # Seconds between captures
+# Largest frame the bus holds ("WxH"); smaller frames use part of a slot. Empty = sized at
+# start-up from the first captured frame and any frames being resumed.
+BUS_FRAME_SIZE = os.getenv("BUS_FRAME_SIZE", "")
+FALLBACK_FRAME_SIZE = (1280, 1280)  # Used only if the first capture fails (the repo's frames are 1280x1280)
+# Servo stops per capture cycle, e.g. "45,90,135" (servo_controller.py); empty = fixed camera.
+# Each stop is its own view: tracked, trended and resolution-tuned separately.
+SCAN_ANGLES = [int(angle) for angle in os.getenv("SCAN_ANGLES", "").split(",") if angle.strip()]
+SCAN_DWELL = float(os.getenv("SCAN_DWELL", "0.2"))  # Seconds at each stop before the frame (auto-exposure)
+TRAY_ID = os.getenv("TRAY_ID", "tray1")
+
+# Trigonometry Constants
+CAMERA_ANGLE = 45  # Degrees
+CAMERA_HEIGHT = 30  # cm (Height from the ground)
+FOCAL_LENGTH = 800  # Pixels (Calibrated for estimation)
+
+# Bus stage indices; plane 1 of a slot holds the undistorted frame when the lens needs it
+INFERENCE, POSTPROCESS, UPLOAD = 1, 2, 3
+RAW_PLANE, UNDISTORTED_PLANE = 0, 1
+JOURNAL_SCHEMA = "pipeline"  # capture_journal_pipeline.jsonl
+
+
+class Context:
+    def __init__(self, **resources):
+        self.__dict__.update(resources)
+
+    def close(self):
+        journal = self.__dict__.get("journal")
+        if journal is not None:
+            journal.close()
+
+
+# Function to open a stage's handle on the shared journal. Several processes append to the
+# same file, so none may compact it while running (a rename would orphan the others' handles).
+def open_journal():
+    return CaptureJournal(JOURNAL_SCHEMA, max_bytes=float("inf"))
+
+
+def working_frame(bus, slot, meta):
+    return bus.frame(slot, UNDISTORTED_PLANE if meta.get("undistorted") else RAW_PLANE)
+
+
+# Inference process: quality gate, undistortion into the slot's second plane, YOLO
+def setup_inference():
+    from ultralytics import YOLO
+    from camera_calibration import CameraModel
+    from frame_quality import FrameQualityGate
+    from runtime_config import configure_threads, warm_up
+    from adaptive_resolution import AdaptiveResolution
+
+    model = YOLO(os.getenv("MODEL_PATH", os.path.join(BASE_DIR, "best.pt")))
+    governor = ResourceGovernor()
+    configure_threads()
+    warm_up(model)
+    return Context(model=model, camera_model=CameraModel.load(CAMERA_HEIGHT, CAMERA_ANGLE, FOCAL_LENGTH),
+                   quality_gate=FrameQualityGate(), governor=governor,
+                   resolution=AdaptiveResolution(governor=governor))
+
+
+def run_inference(bus, slot, context):
+    frame = bus.frame(slot, RAW_PLANE)
+    timestamp = bus.timestamp(slot)
+
+    quality = context.quality_gate.check(frame)
+    if not quality.ok:
+        bus.set_meta(slot, dict(bus.meta(slot), skipped=quality.reason, metrics=quality.metrics,
+                                update=context.quality_gate.skipped_update(timestamp, quality)))
+        return UPLOAD
+
+    # Undistort straight into shared memory; later stages read the same plane
+    view = context.camera_model.view(frame.shape)
+    undistorted = view.has_distortion
+    if undistorted:
+        cv2.remap(frame, view.map1, view.map2, cv2.INTER_LINEAR, dst=bus.frame(slot, UNDISTORTED_PLANE))
+
+    context.governor.update()
+    frame = bus.frame(slot, UNDISTORTED_PLANE if undistorted else RAW_PLANE)
+    results, _ = context.resolution.predict(context.model, frame, tray=bus.meta(slot).get("view", TRAY_ID),
+                                            verbose=False)
+    boxes = [bbox.cpu().numpy().astype(int).tolist() for result in results for bbox in result.boxes.xyxy]
+    bus.set_meta(slot, dict(bus.meta(slot), undistorted=undistorted, boxes=boxes))
+    return POSTPROCESS
+
+
+# Post-processing process: canopy mask, per-box measurements, tracking, trends, annotation
+def setup_postprocess():
+    from camera_calibration import CameraModel
+    from growth_classifier import StageClassifier
+    from plant_tracker import PlantTracker
+    from annotation_renderer import AnnotationRenderer
+    from growth_analytics import GrowthAnalytics
+
+    stage_classifier = StageClassifier(crop=os.getenv("CROP_TYPE"), hot_reload=True)
+    return Context(camera_model=CameraModel.load(CAMERA_HEIGHT, CAMERA_ANGLE, FOCAL_LENGTH),
+                   new_tracker=lambda: PlantTracker(classify_many=stage_classifier.classify_names), trackers={},
+                   renderer=AnnotationRenderer(), growth=GrowthAnalytics(), journal=open_journal())
+
+
+def run_postprocess(bus, slot, context):
+    from leaf_segmentation import CanopyMask
+    from growth_analytics import capture_metrics
+
+    meta = bus.meta(slot)
+    frame = working_frame(bus, slot, meta)
+    timestamp = bus.timestamp(slot)
+    view = context.camera_model.view(frame.shape)
+    canopy = CanopyMask(frame)
+    # Plants are tracked per view: each scan stop sees a different part of the tray
+    scene = meta.get("view", TRAY_ID)
+    if scene not in context.trackers:
+        context.trackers[scene] = context.new_tracker()
+    tracker = context.trackers[scene]
+
+    boxes = [np.array(bbox) for bbox in meta["boxes"]]
+    leaf_count = len(boxes)
+    detections = [(bbox, round(view.box_height_cm(bbox), 2), round(canopy.box_area_cm2(bbox, view), 2), leaf_count)
+                  for bbox in boxes]
+    tracks = tracker.update(detections)
+    summary = tracker.summary()
+
+    detected_image_path = None
+    if context.renderer.should_render():
+        labels = [f"#{track.track_id} {track.stage} ({round(track.height, 2)}cm)" for track in tracks]
+        detected_image_path = context.renderer.write(os.path.join(BASE_DIR, f"detected_{timestamp}.jpg"),
+                                                     frame, boxes, labels)
+
+    measurements = {
+        "growth_stage": summary["growth_stage"],
+        "estimated_height_cm": summary["height_cm"],
+        "leaf_count": leaf_count,
+        "total_leaf_area_cm2": summary["leaf_area_cm2"]
+    }
+    metrics = capture_metrics(len(boxes), summary["height_cm"], summary["leaf_area_cm2"], leaf_count)
+    trend = context.growth.update(meta.get("time", timestamp), metrics, series=scene)
+    measurements["growth_rate_per_day"] = {name: stats["rate_per_day"] for name, stats in trend["metrics"].items()}
+    measurements["growth_alerts"] = trend["alerts"]
+    if trend["alerts"]:
+        print(f"⚠️ Growth alerts for {timestamp}: {', '.join(trend['alerts'])}")
+
+    # Measurements exist from here on; a crash after this only repeats the upload
+    context.journal.mark(timestamp, "inferred", measurements=measurements, detected=detected_image_path)
+    bus.set_meta(slot, dict(meta, measurements=measurements, detected=detected_image_path))
+    return UPLOAD
+
+
+# Upload process: the slot is freed first (the raw JPEG is already on disk), then the network calls run
+def setup_upload(resume=()):
+    from firebase_client import get_client
+    context = Context(firebase=get_client(), journal=open_journal())
+    for entry in resume:
+        try:
+            if entry["state"] == "uploaded" and verify_upload(context.firebase, entry["frame"]):
+                context.journal.mark(entry["frame"], "verified")
+            else:
+                upload_results(context, entry["frame"], entry["raw"], entry["detected"], entry["measurements"])
+        except Exception as e:
+            print(f"❌ Error resuming {entry['frame']}: {e}")
+    return context
+
+
+def verify_upload(firebase, timestamp):
+    return firebase.reference("/plant_analysis").child(timestamp).child("timestamp").get() == timestamp
+
+
+def upload_results(context, timestamp, raw_image_path, detected_image_path, measurements):
+    firebase, journal = context.firebase, context.journal
+    raw_image_url = firebase.upload_public(f"raw_images/raw_{timestamp}.jpg", raw_image_path)
+    detected_image_url = None
+    if detected_image_path:
+        detected_image_url = firebase.upload_public(f"detected_images/detected_{timestamp}.jpg", detected_image_path)
+    print(f"📤 Uploaded to Firebase: {raw_image_url} & {detected_image_url}")
+
+    firebase.reference("/plant_analysis").child(timestamp).set({
+        "timestamp": timestamp, "raw_image_url": raw_image_url, "detected_image_url": detected_image_url,
+        **measurements
+    })
+    journal.mark(timestamp, "uploaded")
+    if verify_upload(firebase, timestamp):
+        journal.mark(timestamp, "verified")
+
+
+def run_upload(bus, slot, context):
+    meta = bus.meta(slot)
+    timestamp = bus.timestamp(slot)
+    bus.release(slot)  # Everything below works from the metadata and files on disk
+
+    if meta.get("skipped"):
+        context.firebase.reference("/").update(meta["update"])
+        context.journal.mark(timestamp, "skipped", reason=meta["skipped"])
+        print(f"⏭️ Skipped {timestamp}: {meta['skipped']} {meta['metrics']}")
+        return None
+
+    upload_results(context, timestamp, meta["raw"], meta["detected"], meta["measurements"])
+    return None
+
+
+# Function to copy a frame into an acquired slot and hand it to inference
+def publish(bus, journal, slot, frame, timestamp, meta):
+    try:
+        bus.write(slot, frame, timestamp, meta=meta)
+    except ValueError as e:
+        bus.release(slot)
+        journal.mark(timestamp, "dropped", reason="frame_too_large")  # Retrying would fail the same way
+        print(e)
+        return
+    bus.send(slot, INFERENCE)
+
+
+# Function to take a free slot, save + journal the raw frame and publish it
+def store_frame(bus, journal, frame, timestamp, raw_image_path=None, view=TRAY_ID, capture_time=None, block=False):
+    slot = bus.acquire(block=block)
+    if slot is None:
+        print(f"⚠️ Dropped {timestamp}: every bus slot is still in use downstream")
+        return
+    if raw_image_path is None:
+        raw_image_path = os.path.join(BASE_DIR, f"raw_{timestamp}.jpg")
+        cv2.imwrite(raw_image_path, frame)
+    meta = {"raw": raw_image_path, "view": view, "time": capture_time or timestamp}
+    journal.mark(timestamp, "captured", **meta)
+    publish(bus, journal, slot, frame, timestamp, meta)
+
+
+class ScanSink:
+    """frame_queue for servo_controller.ScanPlan: each stop's frame goes straight onto the bus.
+
+    ScanPlan starts the move to the next stop before calling put(), so the camera travels
+    while this stop's frame is saved here and inferred in the stage processes.
+    """
+
+    def __init__(self, bus, journal, cycle_timestamp):
+        self.bus = bus
+        self.journal = journal
+        self.cycle_timestamp = cycle_timestamp
+
+    def put(self, item):
+        angle, _, frame = item
+        store_frame(self.bus, self.journal, frame, f"{self.cycle_timestamp}_{angle:03d}deg",
+                    view=f"{TRAY_ID}@{angle}", capture_time=self.cycle_timestamp)
+
+
+def open_camera():
+    from replay_source import ReplaySource, open_capture_source
+    from burst_capture import BURST_FRAMES, BurstCapture
+
+    camera = open_capture_source(lambda: cv2.VideoCapture(0))
+    replay = camera if isinstance(camera, ReplaySource) else None
+    if BURST_FRAMES > 1 and replay is None:
+        camera = BurstCapture(camera)
+    return camera, replay
+
+
+# Function to size bus slots: BUS_FRAME_SIZE if set, else the largest of the given frames
+def bus_frame_shape(frames):
+    if BUS_FRAME_SIZE:
+        width, height = (int(v) for v in BUS_FRAME_SIZE.split("x"))
+        return height, width, 3
+    shapes = [frame.shape for frame in frames if frame is not None]
+    if not shapes:
+        return FALLBACK_FRAME_SIZE[1], FALLBACK_FRAME_SIZE[0], 3
+    return max(shape[0] for shape in shapes), max(shape[1] for shape in shapes), 3
+
+
+# Capture loop (main process): raw JPEG + journal entry, then one copy into a free slot.
+# first is the (ret, frame) already read to size the bus; resume is [(entry, frame)].
+# With SCAN_ANGLES each cycle is a servo scan, one frame per stop (live camera only).
+def capture(bus, camera, replay, first, resume=()):
+    journal = open_journal()
+
+    # Frames captured before a crash or power loss go back through inference first
+    for entry, frame in resume:
+        if frame is None:
+            journal.mark(entry["frame"], "dropped")
+            continue
+        meta = {"raw": entry["raw"], "view": entry.get("view", TRAY_ID), "time": entry.get("time", entry["frame"])}
+        publish(bus, journal, bus.acquire(block=True), frame, entry["frame"], meta)
+
+    scan = None
+    if SCAN_ANGLES and replay is None:
+        from servo_controller import ScanPlan, ServoController
+        scan = ScanPlan(SCAN_ANGLES, dwell=SCAN_DWELL)
+        servo = ServoController()
+        first = None  # Taken before the servo was positioned
+
+        def read_at(angle):
+            ret, frame = camera.read()
+            if not ret:
+                print(f"❌ Failed to capture image at {angle}°")
+            return frame if ret else None
+
+    governor = ResourceGovernor()
+    try:
+        while True:
+            if scan is not None:
+                cycle_timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+                scan.run(servo, read_at, ScanSink(bus, journal, cycle_timestamp))
+                governor.update()
+                time.sleep(governor.interval(CAPTURE_INTERVAL))
+                continue
+
+            ret, frame = first if first is not None else camera.read()
+            first = None
+            if not ret:
+                if replay is not None:
+                    print(f"🏁 Replay finished after {replay.frames_read} frames")
+                    return
+                print("❌ Failed to capture image")
+            else:
+                timestamp = (replay.timestamp if replay else datetime.now()).strftime("%Y-%m-%d_%H-%M-%S")
+                # Replayed image files are used in place; replays wait for a slot instead of dropping
+                store_frame(bus, journal, frame, timestamp, replay.path if replay is not None else None,
+                            block=replay is not None)
+            governor.update()
+            (replay.sleep if replay else time.sleep)(governor.interval(CAPTURE_INTERVAL))
+    finally:
+        if scan is not None:
+            servo.close()
+        camera.release()
+        journal.close()
+
+
+if __name__ == "__main__":
+    # Recover (and compact) the journal once, before any stage process appends to it
+    recovery = CaptureJournal(JOURNAL_SCHEMA)
+    pending = recovery.recover()
+    recovery.close()
+    resume_capture = [(entry, cv2.imread(entry["raw"])) for entry in pending if entry["state"] == "captured"]
+    resume_upload = [entry for entry in pending if entry["state"] in ("inferred", "uploaded")]
+
+    # Slots are sized from real frames, so whatever the camera delivers fits
+    camera, replay = open_camera()
+    first = camera.read()
+    bus = FrameBus(bus_frame_shape([first[1]] + [frame for _, frame in resume_capture]), planes=2, stages=4)
+    print(f"Frame bus: {bus.slots} slot(s) of {bus.frame_shape}")
+    run_stages(bus, [
+        ("inference", run_inference, setup_inference),
+        ("postprocess", run_postprocess, setup_postprocess),
+        ("upload", run_upload, partial(setup_upload, resume_upload)),
+    ], partial(capture, camera=camera, replay=replay, first=first, resume=resume_capture))
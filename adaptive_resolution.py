@@ -0,0 +1,151 @@
+import os
+import json
+import threading
+from collections import Counter
+
+# Per-frame inference resolution.
+#
+# Each frame is first run at the tray's current level (the lowest one at first). If more than
+# ESCALATE_FRACTION of the boxes are small at that input size, or more than that fraction are
+# barely above the caller's confidence threshold, the same frame is run again one level up, up to the largest level the frame can use. An
+# empty frame (bare tray, nothing planted yet) is not escalated. Of the passes run, the one
+# with the most boxes (then the highest mean confidence) is returned. Each tray remembers
+# its level: an escalation whose kept pass was larger raises it at once, and after
+# PROBE_AFTER frames in a row without that the next frame tries one level lower, which
+# becomes the tray's level if it holds. Seedlings get full resolution; mature canopies, whose boxes are
+# large and confident, settle at the cheapest level. Levels are saved so restarts keep them.
+#
+# The ResourceGovernor (runtime_config.py) still scales whatever level is chosen when hot.
+
+BASE_DIR = "/home/Agrisense/Thesis"
+ADAPTIVE_RESOLUTION = os.getenv("ADAPTIVE_RESOLUTION", "1") == "1"  # 0 = fixed FIXED_IMGSZ
+ADAPTIVE_STATE_PATH = os.getenv("ADAPTIVE_STATE_PATH", os.path.join(BASE_DIR, "adaptive_resolution.json"))
+IMGSZ_LEVELS = tuple(int(v) for v in os.getenv("IMGSZ_LEVELS", "320,480,640,960,1280").split(","))
+FIXED_IMGSZ = 640
+MIN_BOX_INPUT_PX = 24  # A box whose short side is below this at the model input counts as small
+# Boxes within this much of the caller's conf threshold trigger a retry (conf=0.5 -> below 0.65)
+ESCALATE_MARGIN = float(os.getenv("ESCALATE_MARGIN", "0.15"))
+# Share of the boxes that must be small / uncertain; one odd box in a full tray doesn't count
+ESCALATE_FRACTION = float(os.getenv("ESCALATE_FRACTION", "0.25"))
+DEFAULT_CONF = 0.25  # Ultralytics' own default when the caller passes no conf
+PROBE_AFTER = 10  # Frames at a level without escalation before trying one level lower
+STRIDE = 32
+
+
+# Function to list (xyxy, conf) for every box in a YOLO result list
+def result_boxes(results):
+    boxes = []
+    for result in results:
+        for bbox, conf in zip(result.boxes.xyxy, result.boxes.conf):
+            boxes.append((bbox.cpu().numpy().tolist(), float(conf)))
+    return boxes
+
+
+# Function to give the reason a result is not good enough at this input size, or None
+def escalation_reason(boxes, frame_shape, imgsz, min_confidence, fraction=ESCALATE_FRACTION):
+    if not boxes:
+        return None  # Nothing to refine; a larger input on an empty tray only costs time
+    scale = imgsz / float(max(frame_shape[0], frame_shape[1]))  # Letterbox scale of the long side
+    limit = fraction * len(boxes)
+    if sum(1 for (x1, y1, x2, y2), _ in boxes if min(x2 - x1, y2 - y1) * scale < MIN_BOX_INPUT_PX) > limit:
+        return "small"
+    if sum(1 for _, conf in boxes if conf < min_confidence) > limit:
+        return "low_confidence"
+    return None
+
+
+# Function to rank a pass: more boxes first, then higher mean confidence
+def pass_score(boxes):
+    return len(boxes), (sum(conf for _, conf in boxes) / len(boxes) if boxes else 0.0)
+
+
+class AdaptiveResolution:
+    def __init__(self, levels=IMGSZ_LEVELS, state_path=ADAPTIVE_STATE_PATH, enabled=ADAPTIVE_RESOLUTION,
+                 governor=None):
+        self.levels = sorted(levels)
+        self.state_path = state_path
+        self.enabled = enabled
+        self.governor = governor
+        self.trays = {}  # tray -> {"level": index, "streak": frames without escalation}
+        self.stats = Counter()  # Passes per imgsz plus escalation reasons
+        self.last = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read adaptive resolution state ({e}); starting at {self.levels[0]}")
+            return
+        for tray, imgsz in saved.items():
+            if imgsz in self.levels:
+                self.trays[tray] = {"level": self.levels.index(imgsz), "streak": 0}
+
+    def save(self):
+        if not self.state_path:
+            return
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({tray: self.levels[state["level"]] for tray, state in self.trays.items()}, f)
+        os.replace(temp_path, self.state_path)
+
+    def _imgsz(self, level):
+        imgsz = self.levels[level]
+        return self.governor.imgsz(imgsz, STRIDE) if self.governor else imgsz
+
+    def _top_level(self, frame_shape):
+        # Past the frame's own long side a larger input only upsamples
+        long_side = -(-max(frame_shape[0], frame_shape[1]) // STRIDE) * STRIDE
+        fitting = [index for index, imgsz in enumerate(self.levels) if imgsz <= long_side]
+        return fitting[-1] if fitting else 0
+
+    def predict(self, model, frame, tray="default", **kwargs):
+        """Run model.predict at the tray's level, escalating on small/uncertain boxes.
+
+        Returns (results, imgsz) for the best pass; self.last describes all of them.
+        """
+        if not self.enabled:
+            imgsz = self.governor.imgsz(FIXED_IMGSZ, STRIDE) if self.governor else FIXED_IMGSZ
+            return model.predict(frame, imgsz=imgsz, **kwargs), imgsz
+
+        top = self._top_level(frame.shape)
+        with self._lock:
+            state = self.trays.setdefault(tray, {"level": 0, "streak": 0})
+            start = min(state["level"], top)
+            probing = start > 0 and state["streak"] >= PROBE_AFTER
+            if probing:
+                start -= 1
+
+        min_confidence = min(kwargs.get("conf", DEFAULT_CONF) + ESCALATE_MARGIN, 1.0)
+        level, passes, best = start, [], None
+        while True:
+            imgsz = self._imgsz(level)
+            results = model.predict(frame, imgsz=imgsz, **kwargs)
+            boxes = result_boxes(results)
+            reason = escalation_reason(boxes, frame.shape, imgsz, min_confidence)
+            self.stats[imgsz] += 1
+            passes.append({"imgsz": imgsz, "escalate": reason})
+            if best is None or pass_score(boxes) > best[0]:
+                best = (pass_score(boxes), results, imgsz, level)
+            if reason is None or level >= top:
+                break
+            self.stats[reason] += 1
+            level += 1
+
+        with self._lock:
+            previous = state["level"]
+            if best[3] > start:
+                state["level"], state["streak"] = best[3], 0  # A larger input gave the better result
+            elif probing:
+                state["level"], state["streak"] = start, 0  # One level lower held
+            else:
+                state["streak"] += 1
+            if state["level"] != previous:
+                print(f"Adaptive resolution: {tray} now starts at {self.levels[state['level']]}")
+                self.save()
+        self.last = {"tray": tray, "passes": passes, "kept": best[2]}
+        return best[1], best[2]
@@ -0,0 +1,81 @@
+import os
+import numpy as np
+import cv2
+
+# Single-pass annotation: YOLO boxes, growth-stage labels and leaf contours are drawn
+# together onto one reused buffer, replacing results.plot() + a separate contour copy.
+# Rendering can be decimated (every Nth capture) unless someone is watching, i.e. the
+# ANNOTATE_WATCH_FLAG file exists (a viewer creates it, or `touch` it by hand). The frame is
+# scaled down to ANNOTATE_MAX_SIDE before drawing, so the one JPEG encode of the cycle is
+# already preview-sized (frame_archive.py keeps annotated frames only as previews).
+
+BASE_DIR = "/home/Agrisense/Thesis"
+ANNOTATE_EVERY_N = int(os.getenv("ANNOTATE_EVERY_N", "1"))  # 0 = only when watching
+# A file rather than a flag in memory: Growth_Pipeline renders in a separate stage process
+ANNOTATE_WATCH_FLAG = os.getenv("ANNOTATE_WATCH_FLAG", os.path.join(BASE_DIR, "annotate_watch"))
+ANNOTATE_QUALITY = 85  # JPEG quality of the annotated frame
+ANNOTATE_MAX_SIDE = int(os.getenv("ANNOTATE_MAX_SIDE", "480"))  # Long side in pixels, 0 = full resolution
+
+BOX_COLOR = (0, 255, 0)
+CONTOUR_COLOR = (255, 200, 0)
+LABEL_COLOR = (0, 255, 0)
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+class AnnotationRenderer:
+    def __init__(self, every_n=ANNOTATE_EVERY_N, quality=ANNOTATE_QUALITY, max_side=ANNOTATE_MAX_SIDE,
+                 watch_flag=ANNOTATE_WATCH_FLAG):
+        self.every_n = every_n
+        self.quality = quality
+        self.max_side = max_side
+        self.watch_flag = watch_flag
+        self._buffer = None
+        self._frames = 0
+        self.rendered = 0
+
+    # Someone is watching while the flag file exists: every frame renders
+    @property
+    def watching(self):
+        return bool(self.watch_flag) and os.path.exists(self.watch_flag)
+
+    # Decide once per capture whether to spend a copy + encode on annotation
+    def should_render(self):
+        self._frames += 1
+        if self.watching:
+            return True
+        return self.every_n > 0 and (self._frames - 1) % self.every_n == 0
+
+    # Copy (or shrink) the frame into the reused buffer; returns the buffer and the scale applied
+    def _prepare(self, frame):
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.max_side / float(max(height, width))) if self.max_side else 1.0
+        shape = (int(round(height * scale)), int(round(width * scale))) + frame.shape[2:]
+        if self._buffer is None or self._buffer.shape != shape or self._buffer.dtype != frame.dtype:
+            self._buffer = np.empty(shape, frame.dtype)
+        if scale < 1.0:
+            cv2.resize(frame, (shape[1], shape[0]), dst=self._buffer, interpolation=cv2.INTER_AREA)
+        else:
+            np.copyto(self._buffer, frame)
+        return self._buffer, scale
+
+    def render(self, frame, boxes=(), labels=(), contours=None):
+        """Draw everything in one pass. The returned buffer is reused on the next call."""
+        canvas, scale = self._prepare(frame)
+        if contours:
+            if scale < 1.0:
+                contours = [(contour * scale).astype(np.int32) for contour in contours]
+            cv2.drawContours(canvas, contours, -1, CONTOUR_COLOR, 2)
+        for i, box in enumerate(boxes):
+            x1, y1, x2, y2 = (int(v * scale) for v in box[:4])
+            cv2.rectangle(canvas, (x1, y1), (x2, y2), BOX_COLOR, 2)
+            if i < len(labels) and labels[i]:
+                cv2.putText(canvas, labels[i], (x1, max(y1 - 10, 12)), FONT, 0.5, LABEL_COLOR, 2)
+        self.rendered += 1
+        return canvas
+
+    # Render and encode straight to disk (the only JPEG encode of the cycle)
+    def write(self, path, frame, boxes=(), labels=(), contours=None):
+        canvas = self.render(frame, boxes, labels, contours)
+        if not cv2.imwrite(path, canvas, [cv2.IMWRITE_JPEG_QUALITY, self.quality]):
+            raise IOError(f"ERROR: could not write annotated frame to {path}")
+        return path
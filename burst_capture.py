@@ -0,0 +1,107 @@
+import os
+import numpy as np
+import cv2
+
+# Burst capture: grab K frames from an already-open camera session, score sharpness and
+# exposure on small thumbnails, and hand only the best (or a median-fused) frame to
+# inference, so one blurred or badly exposed shot no longer wastes a whole cycle.
+
+BURST_FRAMES = int(os.getenv("BURST_FRAMES", "1"))  # 1 = single shot (burst off)
+BURST_MODE = os.getenv("BURST_MODE", "best")  # "best" or "median"
+SCORE_WIDTH = 320  # Thumbnail width used for scoring
+TARGET_BRIGHTNESS = 118  # Mean grey level of a well exposed frame
+CLIP_LOW, CLIP_HIGH = 8, 247  # Grey levels counted as crushed / blown out
+MEDIAN_SHARPNESS_RATIO = 0.6  # Frames this close to the sharpest one are fused in median mode
+
+
+class Picamera2Session:
+    """Persistent Picamera2 session exposing the cv2.VideoCapture read() interface."""
+
+    def __init__(self, width=1024, height=768):
+        from picamera2 import Picamera2
+        self.camera = Picamera2()
+        # Picamera2's "RGB888" is B,G,R in memory, i.e. the order OpenCV expects ("BGR888" is R,G,B)
+        config = self.camera.create_still_configuration(main={"size": (width, height), "format": "RGB888"})
+        self.camera.configure(config)
+        self.camera.start()
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        try:
+            return True, self.camera.capture_array()
+        except Exception as e:
+            print(f"Error capturing frame: {e}")
+            return False, None
+
+    def release(self):
+        self.camera.stop()
+        self.camera.close()
+
+
+# Function to open a persistent camera session: Picamera2 on the Pi, V4L2/OpenCV elsewhere
+def open_camera_session(width=1024, height=768, device=0):
+    try:
+        return Picamera2Session(width, height)
+    except (ImportError, RuntimeError) as e:
+        print(f"Picamera2 unavailable ({e}), using cv2.VideoCapture({device})")
+    camera = cv2.VideoCapture(device)
+    camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    return camera
+
+
+# Function to score one frame on a downsampled grey copy
+def score_frame(frame, width=SCORE_WIDTH):
+    height = max(1, int(frame.shape[0] * width / frame.shape[1]))
+    thumb = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY) if thumb.ndim == 3 else thumb
+
+    sharpness = cv2.Laplacian(gray, cv2.CV_32F).var()
+    mean = float(gray.mean())
+    clipped = float(np.count_nonzero((gray <= CLIP_LOW) | (gray >= CLIP_HIGH))) / gray.size
+    exposure = max(0.0, 1.0 - abs(mean - TARGET_BRIGHTNESS) / TARGET_BRIGHTNESS - 2.0 * clipped)
+
+    return {"sharpness": float(sharpness), "brightness": mean, "clipped": clipped, "exposure": exposure,
+            "score": float(sharpness) * exposure}
+
+
+class BurstCapture:
+    """Wraps a camera session; read() returns the best of a K-frame burst."""
+
+    def __init__(self, session, frames=BURST_FRAMES, mode=BURST_MODE):
+        if mode not in ("best", "median"):
+            raise ValueError(f"ERROR: unknown BURST_MODE '{mode}'")
+        self.session = session
+        self.frames = max(1, frames)
+        self.mode = mode
+        self.last_scores = []
+
+    def isOpened(self):
+        return self.session.isOpened()
+
+    def read(self):
+        burst, scores = [], []
+        for _ in range(self.frames):
+            ok, frame = self.session.read()
+            if ok and frame is not None:
+                burst.append(frame)
+                scores.append(score_frame(frame))
+        self.last_scores = scores
+        if not burst:
+            return False, None
+
+        best = max(range(len(burst)), key=lambda i: scores[i]["score"])
+        if self.mode == "best" or len(burst) < 3:
+            return True, burst[best]
+
+        # Median of the sharp, well exposed frames suppresses noise and transient motion
+        cutoff = scores[best]["score"] * MEDIAN_SHARPNESS_RATIO
+        keep = [frame for frame, score in zip(burst, scores) if score["score"] >= cutoff]
+        if len(keep) < 3:
+            return True, burst[best]
+        return True, np.median(np.stack(keep), axis=0).astype(np.uint8)
+
+    def release(self):
+        self.session.release()
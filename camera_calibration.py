@@ -0,0 +1,266 @@
+import os
+import sys
+import glob
+import hashlib
+import numpy as np
+import cv2
+
+# Camera calibration: intrinsics/distortion from checkerboard shots, cached undistortion
+# maps, and per-pixel ground-plane scale tables so metric conversions are lookups.
+
+CALIBRATION_DIR = os.getenv(
+    "CALIBRATION_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "Calibration")
+)
+CALIBRATION_FILE = os.path.join(CALIBRATION_DIR, "camera_calibration.npz")
+
+# Checkerboard used for calibration (inner corners per row/column, square size)
+CHECKERBOARD_SIZE = (9, 6)
+CHECKERBOARD_SQUARE_CM = 2.5
+
+MIN_RAY_DEPRESSION = np.radians(2)  # Rays flatter than this are clamped (at/above the horizon)
+
+# Uncalibrated (FOCAL_LENGTH-only) cameras keep the scale the old estimate_height /
+# estimate_leaf_area formulas gave at the image centre, so heights and areas stay on the
+# scale growth_stages.json was tuned for; only the variation across the frame is new.
+LEGACY_AREA_CM2_PER_PIXEL = 0.05
+
+
+class CameraCalibration:
+    """Camera intrinsics and lens distortion for one capture resolution."""
+
+    def __init__(self, camera_matrix, dist_coeffs, image_size, rms=None):
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+        self.dist_coeffs = np.asarray(dist_coeffs, dtype=np.float64).ravel()
+        self.image_size = (int(image_size[0]), int(image_size[1]))  # (width, height)
+        self.rms = rms
+
+    # Pinhole model from the old FOCAL_LENGTH constant: centred, no distortion
+    @classmethod
+    def from_focal_length(cls, focal_length, image_size):
+        width, height = image_size
+        camera_matrix = [[focal_length, 0, width / 2.0], [0, focal_length, height / 2.0], [0, 0, 1]]
+        return cls(camera_matrix, np.zeros(5), image_size)
+
+    @classmethod
+    def from_checkerboard(cls, image_paths, pattern_size=CHECKERBOARD_SIZE, square_size=CHECKERBOARD_SQUARE_CM):
+        pattern = np.zeros((pattern_size[0] * pattern_size[1], 3), np.float32)
+        pattern[:, :2] = np.mgrid[0:pattern_size[0], 0:pattern_size[1]].T.reshape(-1, 2) * square_size
+
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+        object_points, image_points, image_size = [], [], None
+        for path in image_paths:
+            gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                print(f"Skipping unreadable image {path}")
+                continue
+            if image_size is None:
+                image_size = (gray.shape[1], gray.shape[0])
+            elif image_size != (gray.shape[1], gray.shape[0]):
+                print(f"Skipping {path}: resolution differs from the first image")
+                continue
+
+            found, corners = cv2.findChessboardCorners(gray, pattern_size, None)
+            if not found:
+                print(f"Checkerboard not found in {path}")
+                continue
+            corners = cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria)
+            object_points.append(pattern)
+            image_points.append(corners)
+
+        if len(image_points) < 3:
+            raise ValueError(f"ERROR: need at least 3 checkerboard views, found {len(image_points)}")
+
+        rms, camera_matrix, dist_coeffs, _, _ = cv2.calibrateCamera(
+            object_points, image_points, image_size, None, None
+        )
+        print(f"Calibrated from {len(image_points)} views, RMS reprojection error {rms:.3f}px")
+        return cls(camera_matrix, dist_coeffs, image_size, rms)
+
+    def save(self, path=CALIBRATION_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, camera_matrix=self.camera_matrix, dist_coeffs=self.dist_coeffs,
+                 image_size=np.array(self.image_size), rms=np.array(self.rms if self.rms is not None else -1.0))
+        print(f"Calibration saved to {path}")
+
+    @classmethod
+    def load(cls, path=CALIBRATION_FILE):
+        if not os.path.exists(path):
+            return None
+        data = np.load(path)
+        rms = float(data["rms"])
+        return cls(data["camera_matrix"], data["dist_coeffs"], tuple(data["image_size"]), rms if rms >= 0 else None)
+
+    # Same lens at another capture resolution: scale the intrinsics
+    def scaled_to(self, image_size):
+        if tuple(image_size) == self.image_size:
+            return self
+        sx = image_size[0] / float(self.image_size[0])
+        sy = image_size[1] / float(self.image_size[1])
+        camera_matrix = self.camera_matrix.copy()
+        camera_matrix[0] *= sx
+        camera_matrix[1] *= sy
+        return CameraCalibration(camera_matrix, self.dist_coeffs, image_size, self.rms)
+
+    def cache_key(self, *extra):
+        digest = hashlib.sha1()
+        for array in (self.camera_matrix, self.dist_coeffs, np.array(self.image_size), np.array(extra, dtype=np.float64)):
+            digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+        return digest.hexdigest()[:16]
+
+
+class CameraView:
+    """Undistortion maps and metric lookup tables for one capture resolution."""
+
+    def __init__(self, calibration, camera_height, camera_angle, cache_dir=CALIBRATION_DIR, legacy_scale=False):
+        self.calibration = calibration
+        self.camera_height = camera_height
+        self.camera_angle = camera_angle
+        self.cache_dir = cache_dir
+        self.legacy_scale = legacy_scale
+        self.has_distortion = bool(np.any(calibration.dist_coeffs != 0))
+
+        self.map1 = self.map2 = None
+        if self.has_distortion:
+            self.map1, self.map2 = self._load_or_build(
+                f"undistort_{calibration.cache_key()}.npz", self._build_undistort_maps, ("map1", "map2")
+            )
+        self.height_lut, self.area_integral = self._load_or_build(
+            f"scale_lut_{calibration.cache_key(camera_height, camera_angle, legacy_scale)}.npz", self._build_scale_lut,
+            ("height_lut", "area_integral"),
+        )
+
+    def _load_or_build(self, filename, build, names):
+        path = os.path.join(self.cache_dir, filename) if self.cache_dir else None
+        if path and os.path.exists(path):
+            try:
+                data = np.load(path)
+                return tuple(data[name] for name in names)
+            except (OSError, KeyError, ValueError) as e:
+                print(f"Rebuilding corrupt calibration cache {path}: {e}")
+
+        arrays = build()
+        if path:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = path + ".tmp.npz"
+            np.savez(tmp_path, **dict(zip(names, arrays)))
+            os.replace(tmp_path, path)
+        return arrays
+
+    def _build_undistort_maps(self):
+        calibration = self.calibration
+        # Keep the original camera matrix so the scale tables apply to undistorted frames
+        return cv2.initUndistortRectifyMap(
+            calibration.camera_matrix, calibration.dist_coeffs, None, calibration.camera_matrix,
+            calibration.image_size, cv2.CV_16SC2,
+        )
+
+    def _build_scale_lut(self):
+        width, height = self.calibration.image_size
+        fx, fy = self.calibration.camera_matrix[0, 0], self.calibration.camera_matrix[1, 1]
+        cx, cy = self.calibration.camera_matrix[0, 2], self.calibration.camera_matrix[1, 2]
+        tilt = np.radians(self.camera_angle)
+
+        # Normalised ray for every pixel (undistorted coordinates)
+        x, y = np.meshgrid((np.arange(width, dtype=np.float64) - cx) / fx,
+                           (np.arange(height, dtype=np.float64) - cy) / fy)
+
+        # Camera tilted down by `tilt`; world Z is up, Y is forward along the ground
+        down = y * np.cos(tilt) + np.sin(tilt)  # -Z component of the ray
+        down = np.maximum(down, np.sin(MIN_RAY_DEPRESSION))
+        t = self.camera_height / down
+        ground_x = t * x
+        ground_y = t * (np.cos(tilt) - y * np.sin(tilt))
+
+        # Height LUT: cm per vertical pixel for an upright plant standing at this ground point
+        ray_length = np.sqrt(x ** 2 + y ** 2 + 1.0)
+        depression = np.arcsin(np.clip(down / ray_length, -1.0, 1.0))
+        distance = t * ray_length
+        height_lut = (distance / (fy * np.cos(depression))).astype(np.float32)
+
+        # Area LUT: ground-plane cm² covered by each pixel (Jacobian of pixel -> ground mapping)
+        dxdu = np.gradient(ground_x, axis=1)
+        dydv = np.gradient(ground_y, axis=0)
+        dxdv = np.gradient(ground_x, axis=0)
+        dydu = np.gradient(ground_y, axis=1)
+        area_per_pixel = np.abs(dxdu * dydv - dxdv * dydu)
+
+        if self.legacy_scale:
+            # Pin the optical centre to camera_height * px / (f * tan(angle)) and 0.05 cm²/px
+            u = min(max(int(round(cx)), 0), width - 1)
+            v = min(max(int(round(cy)), 0), height - 1)
+            legacy_height = self.camera_height / (fy * np.tan(max(tilt, MIN_RAY_DEPRESSION)))
+            height_lut *= np.float32(legacy_height / height_lut[v, u])
+            area_per_pixel *= LEGACY_AREA_CM2_PER_PIXEL / area_per_pixel[v, u]
+
+        # Summed-area table so any box's area is four lookups
+        area_integral = cv2.integral(area_per_pixel, sdepth=cv2.CV_64F)
+        return height_lut, area_integral
+
+    # One remap per frame; no-op for a distortion-free camera
+    def undistort(self, frame):
+        if not self.has_distortion:
+            return frame
+        return cv2.remap(frame, self.map1, self.map2, cv2.INTER_LINEAR)
+
+    def _clip_box(self, bbox):
+        width, height = self.calibration.image_size
+        x1 = min(max(int(bbox[0]), 0), width)
+        y1 = min(max(int(bbox[1]), 0), height)
+        x2 = min(max(int(bbox[2]), x1), width)
+        y2 = min(max(int(bbox[3]), y1), height)
+        return x1, y1, x2, y2
+
+    # Plant height: pixel height x the scale where the plant meets the ground (box bottom centre)
+    def box_height_cm(self, bbox):
+        x1, y1, x2, y2 = self._clip_box(bbox)
+        if y2 <= y1:
+            return 0.0
+        height, width = self.height_lut.shape
+        u = min((x1 + x2) // 2, width - 1)
+        v = min(y2, height) - 1
+        return float((y2 - y1) * self.height_lut[v, u])
+
+    # Ground-plane area covered by a box, in cm²
+    def box_area_cm2(self, bbox):
+        x1, y1, x2, y2 = self._clip_box(bbox)
+        table = self.area_integral
+        return float(table[y2, x2] - table[y1, x2] - table[y2, x1] + table[y1, x1])
+
+
+class CameraModel:
+    """Calibration plus camera mounting; hands out a cached CameraView per resolution."""
+
+    def __init__(self, camera_height, camera_angle, focal_length, calibration=None, cache_dir=CALIBRATION_DIR):
+        self.camera_height = camera_height
+        self.camera_angle = camera_angle
+        self.focal_length = focal_length
+        self.calibration = calibration
+        self.cache_dir = cache_dir
+        self._views = {}
+
+    @classmethod
+    def load(cls, camera_height, camera_angle, focal_length, path=CALIBRATION_FILE):
+        calibration = CameraCalibration.load(path)
+        if calibration is None:
+            print(f"No camera calibration at {path}, using FOCAL_LENGTH={focal_length}px without undistortion")
+        return cls(camera_height, camera_angle, focal_length, calibration, os.path.dirname(path))
+
+    def view(self, image_shape):
+        image_size = (int(image_shape[1]), int(image_shape[0]))
+        if image_size not in self._views:
+            if self.calibration is not None:
+                calibration = self.calibration.scaled_to(image_size)
+            else:
+                calibration = CameraCalibration.from_focal_length(self.focal_length, image_size)
+            self._views[image_size] = CameraView(calibration, self.camera_height, self.camera_angle, self.cache_dir,
+                                                 legacy_scale=self.calibration is None)
+        return self._views[image_size]
+
+
+# Usage: python camera_calibration.py "Calibration/checkerboard/*.jpg"
+if __name__ == "__main__":
+    pattern = sys.argv[1] if len(sys.argv) > 1 else os.path.join(CALIBRATION_DIR, "checkerboard", "*.jpg")
+    paths = sorted(glob.glob(pattern))
+    if not paths:
+        raise FileNotFoundError(f"ERROR: no checkerboard images match {pattern}")
+    CameraCalibration.from_checkerboard(paths).save()
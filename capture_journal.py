@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import threading
+
+# Write-ahead journal of per-frame pipeline state.
+#
+# Each frame moves captured -> inferred -> uploaded -> verified (or skipped / dropped), and every transition is
+# appended as one JSON line before the next step starts. Lines are flushed immediately but
+# fsynced in batches (every JOURNAL_SYNC_EVERY records or JOURNAL_SYNC_INTERVAL seconds);
+# a power loss can only drop the last unsynced transitions, whose steps are then redone.
+# That is safe because every upload is keyed by the capture timestamp, so a redone upload
+# overwrites rather than duplicates.
+#
+# At start-up recover() replays the log, returns the unfinished frames with the data each
+# resume step needs, and compacts the file down to just those frames.
+#
+# Each script keeps its own journal (capture_journal_<schema>.jsonl) because the resume data
+# differs: test_inference_v8 stores parameters/images, Growth_Analysis and Growth_Pipeline
+# store raw/detected/measurements. Every line also carries its schema, so if JOURNAL_PATH
+# points several scripts at one file, each recovers only its own frames and leaves the rest.
+
+BASE_DIR = "/home/Agrisense/Thesis"
+JOURNAL_PATH = os.getenv("JOURNAL_PATH")  # Unset = one file per schema in BASE_DIR
+JOURNAL_SYNC_EVERY = int(os.getenv("JOURNAL_SYNC_EVERY", "8"))
+JOURNAL_SYNC_INTERVAL = float(os.getenv("JOURNAL_SYNC_INTERVAL", "2"))
+JOURNAL_MAX_BYTES = 4 * 1024 * 1024  # Compact in place once the log grows past this
+
+# skipped: rejected by the quality gate; dropped: unrecoverable, e.g. raw file lost
+STATES = ("captured", "inferred", "uploaded", "verified", "skipped", "dropped")
+FINAL_STATES = ("verified", "skipped", "dropped")
+STATE_RANK = {state: rank for rank, state in enumerate(STATES)}
+
+
+def journal_path(schema):
+    return JOURNAL_PATH or os.path.join(BASE_DIR, f"capture_journal_{schema}.jsonl")
+
+
+class CaptureJournal:
+    def __init__(self, schema, path=None, sync_every=JOURNAL_SYNC_EVERY, sync_interval=JOURNAL_SYNC_INTERVAL,
+                 max_bytes=JOURNAL_MAX_BYTES):
+        self.schema = schema
+        path = path or journal_path(schema)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._compact_at = max_bytes
+        self.sync_every = max(1, sync_every)
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a")
+
+    def mark(self, frame, state, sync=False, **data):
+        """Record that frame reached state; data is kept for resuming the next step."""
+        if state not in STATE_RANK:
+            raise ValueError(f"ERROR: unknown journal state '{state}'")
+        line = json.dumps({"frame": str(frame), "state": state, "schema": self.schema, "time": time.time(), **data})
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self._unsynced += 1
+            if (sync or self._unsynced >= self.sync_every
+                    or time.monotonic() - self._last_sync >= self.sync_interval):
+                self._sync_locked()
+            if self._file.tell() > self._compact_at:
+                self._compact_locked()  # Drop verified frames so start-up replay stays short
+
+    def _sync_locked(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        with self._lock:
+            if self._unsynced:
+                self._sync_locked()
+
+    @staticmethod
+    def replay(path):
+        """Latest state per frame ({(schema, frame): entry}), merging the data of earlier transitions."""
+        frames = {}
+        if not os.path.exists(path):
+            return frames
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # Torn final line from a crash mid-write
+                key = (entry.get("schema"), entry["frame"])
+                previous = frames.get(key)
+                if previous is not None and STATE_RANK[entry["state"]] < STATE_RANK[previous["state"]]:
+                    continue
+                frames[key] = dict(previous or {}, **entry)
+        return frames
+
+    def _compact_locked(self):
+        self._file.close()
+        frames = self.replay(self.path)
+        pending = [entry for entry in frames.values() if entry["state"] not in FINAL_STATES]  # First-seen order
+
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            for entry in pending:
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+        self._file = open(self.path, "a")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        # If unfinished frames alone fill the log (e.g. a long outage), back off instead of compacting every mark
+        self._compact_at = max(self.max_bytes, 2 * os.path.getsize(self.path))
+        return pending
+
+    def compact(self):
+        with self._lock:
+            return self._compact_locked()
+
+    def recover(self):
+        """This schema's unfinished frames in capture order; compacts the journal to unfinished frames."""
+        pending = [entry for entry in self.compact() if entry.get("schema") == self.schema]
+        if pending:
+            counts = {}
+            for entry in pending:
+                counts[entry["state"]] = counts.get(entry["state"], 0) + 1
+            print(f"Journal recovery: {len(pending)} unfinished frame(s) {counts}")
+        return pending
+
+    def close(self):
+        with self._lock:
+            self._sync_locked()
+            self._file.close()
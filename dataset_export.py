@@ -0,0 +1,301 @@
+import os
+import io
+import sys
+import json
+import time
+import zlib
+import tarfile
+import multiprocessing
+from collections import Counter, deque
+import numpy as np
+import cv2
+from camera_calibration import CALIBRATION_FILE, CameraCalibration
+from detection_index import DetectionIndex
+
+# Retraining dataset export from the detection index (detection_index.py).
+#
+# Frames are streamed from the index one page at a time, lowest box confidence first
+# (hard examples), and each frame goes through two parallel steps in a worker pool:
+#   1. a 64-bit dHash from a 1/8-scale greyscale JPEG decode, checked against the hashes
+#      already kept, so near-identical captures of a static tray are exported once;
+#   2. for frames that survive, the JPEG that matches the stored boxes (undistorted with
+#      the camera calibration, since boxes are in undistorted pixels; raw bytes otherwise).
+# Samples are written in order as YOLO label files plus images, either as WebDataset tar
+# shards ({key}.jpg / {key}.txt / {key}.json) or as a YOLO images/ labels/ tree. Only a
+# bounded number of frames is in flight, so memory does not grow with the archive.
+# Frames without detections are left out: an empty label would teach that no plant is there.
+#
+#     python dataset_export.py [output_dir] [webdataset|yolo] [limit]
+
+BASE_DIR = "/home/Agrisense/Thesis"
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(BASE_DIR, "Export"))
+EXPORT_FORMAT = os.getenv("EXPORT_FORMAT", "webdataset")  # "webdataset" or "yolo"
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", str(os.cpu_count() or 2)))
+EXPORT_MAX_CONFIDENCE = os.getenv("EXPORT_MAX_CONFIDENCE")  # Only frames with a box at or below this
+EXPORT_CLASS_NAMES = os.getenv("EXPORT_CLASS_NAMES", "")  # Comma-separated, in class-id order (best.pt names)
+DEDUP_DISTANCE = int(os.getenv("EXPORT_DEDUP_DISTANCE", "3"))  # Max dHash bit difference for a duplicate (<= 3)
+VAL_PERCENT = int(os.getenv("EXPORT_VAL_PERCENT", "10"))  # Stable split by capture key
+SHARD_MAX_SAMPLES = 1000
+SHARD_MAX_BYTES = 256 * 1024 * 1024
+JPEG_QUALITY = 95  # Only used when frames have to be undistorted and re-encoded
+IN_FLIGHT_PER_WORKER = 4  # Queued frames per worker at each step
+
+HASH_BANDS = 4  # 16-bit bands: any hash within 3 bits shares at least one band exactly
+
+
+# Function to compute a 64-bit difference hash; the reduced decode skips most of the JPEG work
+def dhash(path):
+    gray = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if gray is None:
+        return None
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class HashDeduplicator:
+    """Near-duplicate check over kept hashes, bucketed by band so lookups stay small."""
+
+    def __init__(self, distance=DEDUP_DISTANCE):
+        if distance >= HASH_BANDS:
+            raise ValueError(f"ERROR: dedup distance must be below {HASH_BANDS} with {HASH_BANDS} bands")
+        self.distance = distance
+        self.buckets = [dict() for _ in range(HASH_BANDS)]
+
+    @staticmethod
+    def _bands(value):
+        return [(value >> (16 * band)) & 0xFFFF for band in range(HASH_BANDS)]
+
+    def add_if_new(self, value):
+        bands = self._bands(value)
+        for bucket, key in zip(self.buckets, bands):
+            for kept in bucket.get(key, ()):
+                if bin(kept ^ value).count("1") <= self.distance:
+                    return False
+        for bucket, key in zip(self.buckets, bands):
+            bucket.setdefault(key, []).append(value)
+        return True
+
+
+_undistort_maps = {}
+_calibration = None
+
+
+def _init_worker(calibration_path):
+    global _calibration
+    _calibration = CameraCalibration.load(calibration_path)
+
+
+# Function to produce the JPEG bytes the stored boxes refer to, plus the frame size
+def encode_sample(path, size=None):
+    calibration = _calibration
+    if calibration is None or not np.any(calibration.dist_coeffs != 0):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if size is None:  # Older records without a stored frame size
+            image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+            if image is None:
+                return None
+            size = (image.shape[1], image.shape[0])
+        return data, size[0], size[1]
+
+    image = cv2.imread(path)
+    if image is None:
+        return None
+    size = (image.shape[1], image.shape[0])
+    if size not in _undistort_maps:
+        scaled = calibration.scaled_to(size)
+        # Same maps as CameraView: original camera matrix, so boxes line up with the capture path
+        _undistort_maps[size] = cv2.initUndistortRectifyMap(
+            scaled.camera_matrix, scaled.dist_coeffs, None, scaled.camera_matrix, size, cv2.CV_16SC2)
+    map1, map2 = _undistort_maps[size]
+    ok, encoded = cv2.imencode(".jpg", cv2.remap(image, map1, map2, cv2.INTER_LINEAR),
+                               [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return (encoded.tobytes(), size[0], size[1]) if ok else None
+
+
+# Function to turn stored xyxy boxes into YOLO label lines (class cx cy w h, normalised)
+def yolo_label(boxes, width, height):
+    lines = []
+    for box in boxes:
+        x1, y1, x2, y2 = (float(v) for v in box["xyxy"])
+        x1, x2 = max(0.0, min(x1, width)), max(0.0, min(x2, width))
+        y1, y2 = max(0.0, min(y1, height)), max(0.0, min(y2, height))
+        if x2 <= x1 or y2 <= y1:
+            continue
+        lines.append(f"{int(box.get('cls', 0))} {(x1 + x2) / 2 / width:.6f} {(y1 + y2) / 2 / height:.6f} "
+                     f"{(x2 - x1) / width:.6f} {(y2 - y1) / height:.6f}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+# Function to build a sample key that is safe as a file name and a WebDataset key (no dots)
+def sample_key(item):
+    key = f"{item['node_id']}__{item['capture_key']}" if item.get("node_id") else str(item["capture_key"])
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in key)
+
+
+def split_for(key, val_percent=VAL_PERCENT):
+    return "val" if zlib.crc32(key.encode()) % 100 < val_percent else "train"
+
+
+class WebDatasetWriter:
+    """Tar shards per split, rolled over by sample count or size."""
+
+    def __init__(self, output_dir, max_samples=SHARD_MAX_SAMPLES, max_bytes=SHARD_MAX_BYTES):
+        self.output_dir = output_dir
+        self.max_samples = max_samples
+        self.max_bytes = max_bytes
+        self.shards = {}  # split -> [tarfile, samples, bytes, index]
+        self.paths = []
+
+    def _add_member(self, archive, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        archive.addfile(info, io.BytesIO(data))
+
+    def write(self, split, key, image_bytes, label, metadata):
+        shard = self.shards.get(split)
+        if shard is None or shard[1] >= self.max_samples or shard[2] >= self.max_bytes:
+            index = shard[3] + 1 if shard else 0
+            if shard:
+                shard[0].close()
+            path = os.path.join(self.output_dir, f"{split}-{index:06d}.tar")
+            self.paths.append(path)
+            shard = self.shards[split] = [tarfile.open(path, "w"), 0, 0, index]
+        archive = shard[0]
+        self._add_member(archive, f"{key}.jpg", image_bytes)
+        self._add_member(archive, f"{key}.txt", label.encode())
+        self._add_member(archive, f"{key}.json", json.dumps(metadata).encode())
+        shard[1] += 1
+        shard[2] += len(image_bytes)
+
+    def close(self):
+        for shard in self.shards.values():
+            shard[0].close()
+        return [os.path.basename(path) for path in self.paths]
+
+
+class YoloDirectoryWriter:
+    """Ultralytics layout: images/{split}/{key}.jpg and labels/{split}/{key}.txt."""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def write(self, split, key, image_bytes, label, metadata):
+        for kind, name, data in (("images", f"{key}.jpg", image_bytes), ("labels", f"{key}.txt", label.encode())):
+            directory = os.path.join(self.output_dir, kind, split)
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(data)
+
+    def close(self):
+        return ["images", "labels"]
+
+
+def write_data_yaml(output_dir, class_names):
+    lines = [f"path: {os.path.abspath(output_dir)}", "train: images/train", "val: images/val", "names:"]
+    lines += [f"  {class_id}: {json.dumps(name)}" for class_id, name in enumerate(class_names)]
+    with open(os.path.join(output_dir, "data.yaml"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def export_dataset(output_dir=EXPORT_DIR, fmt=EXPORT_FORMAT, limit=None, index=None, workers=EXPORT_WORKERS,
+                   max_confidence=EXPORT_MAX_CONFIDENCE, class_names=None, calibration_path=CALIBRATION_FILE,
+                   **filters):
+    """Export up to limit frames, hardest first; filters go to DetectionIndex.query (stage, start, end, tray...)."""
+    if fmt not in ("webdataset", "yolo"):
+        raise ValueError(f"ERROR: unknown export format '{fmt}'")
+    os.makedirs(output_dir, exist_ok=True)
+    index = index or DetectionIndex()
+    records = index.iter_query(order="confidence", page_size=500, max_confidence=(
+        float(max_confidence) if max_confidence is not None else None), **filters)
+    writer = WebDatasetWriter(output_dir) if fmt == "webdataset" else YoloDirectoryWriter(output_dir)
+    deduplicator = HashDeduplicator()
+    stats = Counter()
+    classes = Counter()
+    in_flight = max(1, workers) * IN_FLIGHT_PER_WORKER
+    hashing, encoding = deque(), deque()
+    start = time.perf_counter()
+
+    def full():
+        return limit is not None and stats["train"] + stats["val"] + len(encoding) >= limit
+
+    def finish_hash():
+        item, job = hashing.popleft()
+        value = job.get()
+        if value is None:
+            stats["missing"] += 1
+        elif full():
+            return
+        elif not deduplicator.add_if_new(value):
+            stats["duplicates"] += 1
+        else:
+            size = (item["image_width"], item["image_height"]) if item["image_width"] and item["image_height"] else None
+            encoding.append((item, value, pool.apply_async(encode_sample, (item["images"]["raw"], size))))
+
+    def finish_encode():
+        item, value, job = encoding.popleft()
+        sample = job.get()
+        if sample is None:
+            stats["missing"] += 1
+            return
+        image_bytes, width, height = sample
+        label = yolo_label(item["boxes"] or [], width, height)
+        key = sample_key(item)
+        split = split_for(key)
+        metadata = {field: item[field] for field in ("capture_key", "node_id", "timestamp", "tray", "model_version",
+                                                     "growth_stage", "min_confidence", "boxes")}
+        metadata["dhash"] = f"{value:016x}"
+        writer.write(split, key, image_bytes, label, metadata)
+        classes.update(int(box.get("cls", 0)) for box in item["boxes"] or [])
+        stats[split] += 1
+
+    with multiprocessing.Pool(max(1, workers), initializer=_init_worker, initargs=(calibration_path,)) as pool:
+        for item in records:
+            if full():
+                break
+            stats["scanned"] += 1
+            raw_path = (item.get("images") or {}).get("raw")
+            if not raw_path:
+                stats["no_image"] += 1
+                continue
+            hashing.append((item, pool.apply_async(dhash, (raw_path,))))
+            # Results are taken in submission order, so the hardest of a duplicate group is the one kept
+            while len(hashing) >= in_flight:
+                finish_hash()
+            while encoding and (len(encoding) >= in_flight or encoding[0][2].ready()):
+                finish_encode()
+        while hashing:
+            finish_hash()
+        while encoding:
+            finish_encode()
+
+    names = class_names or [str(class_id) for class_id in range(max(classes) + 1 if classes else 0)]
+    manifest = {
+        "format": fmt,
+        "files": writer.close(),
+        "samples": {"train": stats["train"], "val": stats["val"]},
+        "skipped": {reason: stats[reason] for reason in ("duplicates", "missing", "no_image")},
+        "scanned": stats["scanned"],
+        "boxes_per_class": {str(class_id): count for class_id, count in sorted(classes.items())},
+        "names": names,
+        "order": "min_confidence ascending",
+        "dedup_distance": deduplicator.distance,
+        "seconds": round(time.perf_counter() - start, 1),
+    }
+    with open(os.path.join(output_dir, "dataset.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    if fmt == "yolo":
+        write_data_yaml(output_dir, names)
+    return manifest
+
+
+if __name__ == "__main__":
+    output_dir, fmt, limit = (sys.argv[1:] + [None, None, None])[:3]
+    manifest = export_dataset(output_dir or EXPORT_DIR, fmt or EXPORT_FORMAT, int(limit) if limit else None,
+                              class_names=[name.strip() for name in EXPORT_CLASS_NAMES.split(",") if name.strip()])
+    print(json.dumps(manifest, indent=2))
@@ -0,0 +1,275 @@
+import os
+import sys
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+# Local query index over detection history.
+#
+# Every capture's growth parameters go into one SQLite table indexed on timestamp, stage,
+# tray and model version, with the archived image paths in a joined table. Queries are
+# keyset-paginated, so "all Mature frames in March" stays a sub-second index range scan
+# no matter how many years of captures are stored.
+
+BASE_DIR = "/home/Agrisense/Thesis"
+DETECTION_INDEX_PATH = os.getenv("DETECTION_INDEX_PATH", os.path.join(BASE_DIR, "detections.sqlite3"))
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Capture timestamps used across the scripts
+TIMESTAMP_FORMATS = ("%Y%m%d_%H%M%S", "%Y-%m-%d_%H-%M-%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    capture_key TEXT NOT NULL,
+    node_id TEXT NOT NULL DEFAULT '',
+    timestamp TEXT NOT NULL,
+    tray TEXT,
+    model_version TEXT,
+    growth_stage TEXT,
+    height_cm REAL,
+    leaf_count INTEGER,
+    leaf_area_cm2 REAL,
+    plant_count INTEGER,
+    min_confidence REAL,
+    boxes TEXT,
+    image_width INTEGER,
+    image_height INTEGER,
+    UNIQUE (node_id, capture_key)
+);
+CREATE INDEX IF NOT EXISTS idx_det_time ON detections (timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_det_stage_time ON detections (growth_stage, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_det_tray_time ON detections (tray, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_det_model_time ON detections (model_version, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_det_confidence ON detections (min_confidence);
+CREATE TABLE IF NOT EXISTS images (
+    detection_id INTEGER NOT NULL REFERENCES detections (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (detection_id, kind)
+);
+"""
+
+# Keyset orderings: capture time, or lowest box confidence first (hard examples)
+ORDER_COLUMNS = {"timestamp": "timestamp", "confidence": "min_confidence"}
+
+COLUMNS = ("id", "capture_key", "node_id", "timestamp", "tray", "model_version", "growth_stage", "height_cm",
+           "leaf_count", "leaf_area_cm2", "plant_count", "min_confidence", "boxes", "image_width", "image_height")
+
+
+# Function to normalise any capture timestamp to sortable ISO text
+def normalize_timestamp(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%dT%H:%M:%S")
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(str(value), fmt).strftime("%Y-%m-%dT%H:%M:%S")
+        except ValueError:
+            continue
+    raise ValueError(f"ERROR: unrecognised timestamp '{value}'")
+
+
+class DetectionIndex:
+    def __init__(self, path=DETECTION_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _row_values(record):
+        boxes = record.get("boxes")
+        confidences = [box["conf"] for box in boxes or [] if box.get("conf") is not None]
+        capture_key = str(record["timestamp"])
+        return (
+            capture_key,
+            record.get("node_id", ""),
+            normalize_timestamp(capture_key),
+            record.get("tray"),
+            record.get("model_version"),
+            record.get("growth_stage"),
+            record.get("height_cm"),
+            record.get("leaf_count"),
+            record.get("leaf_area_cm2"),
+            record.get("plant_count", len(record.get("plants") or {})),
+            record.get("min_confidence", min(confidences) if confidences else None),
+            json.dumps(boxes) if boxes is not None else None,
+            record.get("image_width"),
+            record.get("image_height"),
+        )
+
+    def add_many(self, records):
+        """Upsert records (dicts with at least 'timestamp'); optional 'images': {kind: path}."""
+        with self._lock, self.db:
+            for record in records:
+                values = self._row_values(record)
+                self.db.execute(
+                    f"INSERT INTO detections ({', '.join(COLUMNS[1:])}) VALUES ({', '.join('?' * len(values))}) "
+                    "ON CONFLICT (node_id, capture_key) DO UPDATE SET "
+                    + ", ".join(f"{column} = excluded.{column}" for column in COLUMNS[3:]),
+                    values,
+                )
+                row_id = self.db.execute(
+                    "SELECT id FROM detections WHERE node_id = ? AND capture_key = ?", (values[1], values[0])
+                ).fetchone()[0]
+                for kind, image_path in (record.get("images") or {}).items():
+                    self.db.execute("INSERT OR REPLACE INTO images VALUES (?, ?, ?)", (row_id, kind, image_path))
+        return len(records)
+
+    def add(self, record, images=None):
+        if images:
+            record = dict(record, images=images)
+        self.add_many([record])
+
+    def attach_image(self, capture_key, kind, image_path, node_id=""):
+        with self._lock, self.db:
+            row = self.db.execute(
+                "SELECT id FROM detections WHERE node_id = ? AND capture_key = ?", (node_id, str(capture_key))
+            ).fetchone()
+            if row is None:
+                return False
+            self.db.execute("INSERT OR REPLACE INTO images VALUES (?, ?, ?)", (row[0], kind, image_path))
+        return True
+
+    def _to_dict(self, row, images):
+        item = {column: row[column] for column in COLUMNS}
+        item["boxes"] = json.loads(item["boxes"]) if item["boxes"] else None
+        item["images"] = images.get(row["id"], {})
+        return item
+
+    def _images_for(self, ids):
+        images = {}
+        if not ids:
+            return images
+        rows = self.db.execute(
+            f"SELECT detection_id, kind, path FROM images WHERE detection_id IN ({', '.join('?' * len(ids))})", ids
+        )
+        for detection_id, kind, image_path in rows:
+            images.setdefault(detection_id, {})[kind] = image_path
+        return images
+
+    def query(self, stage=None, start=None, end=None, tray=None, model_version=None, node_id=None,
+              max_confidence=None, page_size=DEFAULT_PAGE_SIZE, cursor=None, descending=False, order="timestamp"):
+        """One page of detections with their image paths.
+
+        start/end accept any capture timestamp format (end is exclusive). Pass the returned
+        'next' cursor back in to get the following page; it is None on the last page.
+        order="confidence" walks frames with detections by lowest box confidence first.
+        """
+        if order not in ORDER_COLUMNS:
+            raise ValueError(f"ERROR: unknown order '{order}'")
+        order_column = ORDER_COLUMNS[order]
+        page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+        where, params = [], []
+        for column, value in (("growth_stage", stage), ("tray", tray), ("model_version", model_version),
+                              ("node_id", node_id)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if start is not None:
+            where.append("timestamp >= ?")
+            params.append(normalize_timestamp(start))
+        if end is not None:
+            where.append("timestamp < ?")
+            params.append(normalize_timestamp(end))
+        if max_confidence is not None:
+            where.append("min_confidence <= ?")
+            params.append(max_confidence)
+        elif order == "confidence":
+            where.append("min_confidence IS NOT NULL")
+
+        # Keyset pagination on (order column, id): no OFFSET scans on deep pages
+        if cursor:
+            cursor_value, cursor_id = cursor.rsplit("|", 1)
+            where.append(f"({order_column}, id) < (?, ?)" if descending else f"({order_column}, id) > (?, ?)")
+            params.extend([float(cursor_value) if order == "confidence" else cursor_value, int(cursor_id)])
+
+        direction = "DESC" if descending else "ASC"
+        sql = (f"SELECT {', '.join(COLUMNS)} FROM detections"
+               + (f" WHERE {' AND '.join(where)}" if where else "")
+               + f" ORDER BY {order_column} {direction}, id {direction} LIMIT ?")
+
+        with self._lock:
+            rows = self.db.execute(sql, params + [page_size + 1]).fetchall()
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
+            images = self._images_for([row["id"] for row in rows])
+
+        items = [self._to_dict(row, images) for row in rows]
+        next_cursor = f"{rows[-1][order_column]}|{rows[-1]['id']}" if has_more else None
+        return {"items": items, "next": next_cursor}
+
+    # Generator over every matching record, one page at a time
+    def iter_query(self, **filters):
+        cursor = None
+        while True:
+            page = self.query(cursor=cursor, **filters)
+            yield from page["items"]
+            cursor = page["next"]
+            if cursor is None:
+                return
+
+    def get(self, capture_key, node_id=""):
+        with self._lock:
+            row = self.db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM detections WHERE node_id = ? AND capture_key = ?",
+                (node_id, str(capture_key)),
+            ).fetchone()
+            if row is None:
+                return None
+            return self._to_dict(row, self._images_for([row["id"]]))
+
+    def count_by_stage(self, start=None, end=None, tray=None):
+        where, params = [], []
+        if start is not None:
+            where.append("timestamp >= ?")
+            params.append(normalize_timestamp(start))
+        if end is not None:
+            where.append("timestamp < ?")
+            params.append(normalize_timestamp(end))
+        if tray is not None:
+            where.append("tray = ?")
+            params.append(tray)
+        sql = "SELECT growth_stage, COUNT(*) FROM detections" + (f" WHERE {' AND '.join(where)}" if where else "")
+        with self._lock:
+            return dict(self.db.execute(sql + " GROUP BY growth_stage", params).fetchall())
+
+    # Backfill from a Firebase export: detections/{timestamp}/growth_parameters and /plant_analysis
+    def import_firebase_export(self, export, tray=None, model_version=None):
+        records = []
+        for timestamp, node in (export.get("detections") or {}).items():
+            parameters = node.get("growth_parameters") if isinstance(node, dict) else None
+            if parameters:
+                records.append(dict(parameters, timestamp=timestamp, tray=tray, model_version=model_version))
+        for entry in (export.get("plant_analysis") or {}).values():
+            records.append({
+                "timestamp": entry["timestamp"],
+                "tray": tray,
+                "model_version": model_version,
+                "growth_stage": entry.get("growth_stage"),
+                "height_cm": entry.get("estimated_height_cm"),
+                "leaf_count": entry.get("leaf_count"),
+                "leaf_area_cm2": entry.get("total_leaf_area_cm2"),
+                "images": {"raw_url": entry.get("raw_image_url"), "detected_url": entry.get("detected_image_url")},
+            })
+        for record in records:
+            record["images"] = {kind: path for kind, path in (record.get("images") or {}).items() if path}
+        return self.add_many(records)
+
+    def close(self):
+        self.db.close()
+
+
+# Usage: python detection_index.py Mature 2025-03-01 2025-04-01
+if __name__ == "__main__":
+    index = DetectionIndex()
+    stage, start, end = (sys.argv[1:] + [None, None, None])[:3]
+    for item in index.iter_query(stage=stage, start=start, end=end):
+        print(item["capture_key"], item["growth_stage"], item["height_cm"], item["images"])
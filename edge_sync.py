@@ -0,0 +1,267 @@
+import os
+import gzip
+import json
+import time
+import base64
+import threading
+from datetime import datetime
+from runtime_config import upload_slots, pin_stage
+
+# Two-tier sync to Firebase.
+#   immediate: every capture writes its full detail (growth parameters + images) right away.
+#   two_tier:  only a compact summary goes up in real time; the full detail is spooled
+#              locally and uploaded as gzip-compressed batches during an off-peak window,
+#              throttled so the uplink use stays predictable.
+
+BASE_DIR = "/home/Agrisense/Thesis"
+SYNC_MODE = os.getenv("SYNC_MODE", "immediate")  # "immediate" or "two_tier"
+SYNC_SPOOL_DIR = os.getenv("SYNC_SPOOL_DIR", os.path.join(BASE_DIR, "Sync"))
+SYNC_OFFPEAK = os.getenv("SYNC_OFFPEAK", "01:00-05:00")  # Local time window, may cross midnight
+SYNC_BANDWIDTH = float(os.getenv("SYNC_BANDWIDTH_KBPS", "256")) * 1024  # Average bytes/second over batches, 0 = off
+SYNC_BATCH_MAX_BYTES = 4 * 1024 * 1024  # Spooled bytes per batch (RTDB caps a single write at 16 MB)
+SYNC_CHECK_INTERVAL = 60  # Seconds between off-peak checks in the background thread
+
+SUMMARY_PATH = "plant_summary"
+DETAIL_PATH = "detections"
+BULK_PATH = "detections_bulk"
+
+
+# Function to parse "HH:MM-HH:MM" into minutes since midnight
+def parse_window(window):
+    start, end = window.split("-")
+    to_minutes = lambda hhmm: int(hhmm.split(":")[0]) * 60 + int(hhmm.split(":")[1])
+    return to_minutes(start), to_minutes(end)
+
+
+def in_window(window, now=None):
+    start, end = parse_window(window)
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute
+    if start <= end:
+        return start <= minute < end
+    return minute >= start or minute < end
+
+
+class TokenBucket:
+    """Average-rate throttle: callers wait until enough bytes have accrued.
+
+    Each bulk batch is one database write, so this spaces batches out (a 4 MB batch at
+    256 KiB/s waits ~16 s before it goes); it caps the average rate, not the rate during
+    a single request, which runs at whatever the link gives it.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, nbytes):
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= nbytes
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class EdgeSync:
+    def __init__(self, db, mode=SYNC_MODE, spool_dir=SYNC_SPOOL_DIR, offpeak=SYNC_OFFPEAK,
+                 bandwidth=SYNC_BANDWIDTH, batch_max_bytes=SYNC_BATCH_MAX_BYTES):
+        if mode not in ("immediate", "two_tier"):
+            raise ValueError(f"ERROR: unknown SYNC_MODE '{mode}'")
+        self.db = db
+        self.mode = mode
+        self.spool_dir = spool_dir
+        self.offpeak = offpeak
+        self.batch_max_bytes = batch_max_bytes
+        self.throttle = TokenBucket(bandwidth)
+        self.spool_path = os.path.join(spool_dir, "pending.jsonl")
+        self.cursor_path = os.path.join(spool_dir, "pending.cursor")
+        self.index_path = os.path.join(spool_dir, "pending.index")  # Timestamps in the current spool
+        self.stats = {"summaries": 0, "spooled": 0, "already_spooled": 0, "batches": 0, "bytes_uploaded": 0}
+        self._spool_lock = threading.Lock()  # Held only for appends, so captures never wait on uploads
+        self._sync_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        os.makedirs(spool_dir, exist_ok=True)
+        self._spooled = self._load_index()
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                return set(line.strip() for line in f if line.strip())
+        # Spool from before the index existed: rebuild it once
+        spooled = set()
+        if os.path.exists(self.spool_path):
+            with open(self.spool_path, "r") as f:
+                for line in f:
+                    try:
+                        spooled.add(json.loads(line)["timestamp"])
+                    except (ValueError, KeyError):
+                        break  # Torn final record
+            with open(self.index_path, "w") as f:
+                f.writelines(f"{timestamp}\n" for timestamp in spooled)
+        return spooled
+
+    # Compact record for the real-time dashboard
+    @staticmethod
+    def summarize(timestamp, parameters):
+        return {
+            "timestamp": timestamp,
+            "growth_stage": parameters.get("growth_stage"),
+            "height_cm": parameters.get("height_cm"),
+            "leaf_count": parameters.get("leaf_count"),
+            "leaf_area_cm2": parameters.get("leaf_area_cm2"),
+            "plant_count": len(parameters.get("plants") or {}),
+        }
+
+    def publish(self, timestamp, parameters, images=None):
+        """Send one capture. parameters: growth-parameter dict; images: {image_type: path}."""
+        images = images or {}
+        if self.mode == "immediate":
+            self.db.reference(f"{DETAIL_PATH}/{timestamp}/growth_parameters").set(parameters)
+            for image_type, path in images.items():
+                self.db.reference(f"{DETAIL_PATH}/{timestamp}/{image_type}").set(self._encode_image(path))
+            return
+
+        # Keyed by timestamp so a retried publish overwrites instead of duplicating
+        self.db.reference(f"{SUMMARY_PATH}/{timestamp}").set(self.summarize(timestamp, parameters))
+        self.stats["summaries"] += 1
+
+        # A capture resumed after a crash may already be spooled; the detail goes up only once
+        with self._spool_lock:
+            if str(timestamp) in self._spooled:
+                self.stats["already_spooled"] += 1
+                return
+        record = {
+            "timestamp": timestamp,
+            "growth_parameters": parameters,
+            "images": {image_type: self._encode_image(path) for image_type, path in images.items()},
+        }
+        with self._spool_lock:
+            with open(self.spool_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            # Indexed after the record is durable: a crash in between re-spools once, never loses it
+            with open(self.index_path, "a") as f:
+                f.write(f"{timestamp}\n")
+            self._spooled.add(str(timestamp))
+        self.stats["spooled"] += 1
+
+    # Read back the record publish() wrote synchronously (detail or summary, depending on mode)
+    def verify(self, timestamp):
+        path = f"{DETAIL_PATH}/{timestamp}/growth_parameters" if self.mode == "immediate" else f"{SUMMARY_PATH}/{timestamp}"
+        return self.db.reference(path).get() is not None
+
+    @staticmethod
+    def _encode_image(path):
+        with open(path, "rb") as image_file:
+            return base64.b64encode(image_file.read()).decode("utf-8")
+
+    def _read_cursor(self):
+        try:
+            with open(self.cursor_path, "r") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_cursor(self, offset):
+        tmp_path = self.cursor_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.cursor_path)
+
+    def _upload_batch(self, lines):
+        payload = gzip.compress(b"".join(lines))
+        batch_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        encoded = base64.b64encode(payload).decode("ascii")
+        self.throttle.consume(len(encoded))
+        with upload_slots:
+            self.db.reference(f"{BULK_PATH}/{batch_id}").set({
+                "encoding": "gzip+base64 jsonl",
+                "records": len(lines),
+                "data": encoded,
+            })
+        self.stats["batches"] += 1
+        self.stats["bytes_uploaded"] += len(encoded)
+
+    def sync_pending(self, force=False):
+        """Upload spooled detail in compressed batches. Returns the number of records sent."""
+        if self.mode != "two_tier" or (not force and not in_window(self.offpeak)):
+            return 0
+
+        sent = 0
+        with self._sync_lock:
+            if not os.path.exists(self.spool_path):
+                return 0
+            offset = self._read_cursor()
+            with open(self.spool_path, "rb") as f:
+                f.seek(offset)
+                batch, batch_bytes = [], 0
+                while not self._stop.is_set():
+                    line = f.readline()
+                    if line and not line.endswith(b"\n"):
+                        line = b""  # Partially written record; leave it for next time
+                    # Budget on the uncompressed size; for JPEG-heavy records gzip + base64 comes out about the same
+                    if batch and (not line or batch_bytes + len(line) > self.batch_max_bytes):
+                        try:
+                            self._upload_batch(batch)
+                        except Exception as e:
+                            print(f"Error uploading sync batch: {e}")
+                            break
+                        offset += batch_bytes
+                        self._write_cursor(offset)
+                        sent += len(batch)
+                        batch, batch_bytes = [], 0
+                    if not line:
+                        break
+                    batch.append(line)
+                    batch_bytes += len(line)
+
+            # Everything synced: start a fresh spool (re-checked under the append lock)
+            with self._spool_lock:
+                if offset >= os.path.getsize(self.spool_path):
+                    os.remove(self.spool_path)
+                    self._write_cursor(0)
+                    if os.path.exists(self.index_path):
+                        os.remove(self.index_path)
+                    self._spooled.clear()
+
+        if sent:
+            print(f"Synced {sent} spooled captures to Firebase ({self.stats['bytes_uploaded'] / 1024:.0f} KiB total)")
+        return sent
+
+    def pending_bytes(self):
+        if not os.path.exists(self.spool_path):
+            return 0
+        return os.path.getsize(self.spool_path) - self._read_cursor()
+
+    def _run(self):
+        pin_stage("upload")
+        while not self._stop.wait(SYNC_CHECK_INTERVAL):
+            try:
+                self.sync_pending()
+            except Exception as e:
+                print(f"Error during off-peak sync: {e}")
+
+    def start(self):
+        if self.mode == "two_tier" and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="edge-sync", daemon=True)
+            self._thread.start()
+
+    # Stop the off-peak thread; a batch already uploading finishes and its cursor is written first
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,254 @@
+import os
+import json
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+# Shared Firebase client for the process.
+#
+# One app and one credential per process (initialised once, never deleted and re-created),
+# one keep-alive connection pool mounted on the client's own authorized session, which
+# carries both the Realtime Database REST calls and Cloud Storage, cached references and bucket, and a background thread that
+# refreshes the OAuth token before it expires so no request on the capture path ever
+# waits on a token fetch. Public uploads use predefined_acl="publicRead", one request
+# instead of upload + make_public().
+#
+#     from firebase_client import get_client
+#     firebase = get_client()
+#     firebase.reference("plant_analysis").child(key).set(data)
+#     url = firebase.upload_public("raw_images/raw.jpg", path)
+#
+# USE_FIREBASE_EMULATOR=1 hands out the in-process emulator behind the same interface.
+
+dotenv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "venv", ".env")
+load_dotenv(dotenv_path)
+
+FIREBASE_DB_URL = os.getenv("FIREBASE_DB_URL")
+FIREBASE_STORAGE_BUCKET = os.getenv("FIREBASE_STORAGE_BUCKET", "agrisense-6a089.appspot.com")
+SERVICE_ACCOUNT_PATH = os.getenv("SERVICE_ACCOUNT_PATH", "/home/Agrisense/Thesis/venv/serviceAccountKey.json")
+USE_FIREBASE_EMULATOR = os.getenv("USE_FIREBASE_EMULATOR") == "1"
+
+POOL_CONNECTIONS = 4  # Distinct hosts kept in the pool (database, storage, token endpoint)
+POOL_MAXSIZE = 8  # Keep-alive connections per host (>= UPLOAD_CONCURRENCY + background sync)
+TOKEN_REFRESH_MARGIN = 300  # Seconds before expiry at which the token is refreshed
+TOKEN_CHECK_INTERVAL = 60  # Upper bound on the refresh thread's sleep
+TOKEN_RETRY_INTERVAL = 30  # Wait after a failed refresh (the current token may still be valid)
+REFERENCE_CACHE_SIZE = 256
+DB_TIMEOUT = 30  # Seconds per Realtime Database request
+
+
+class Reference:
+    """Realtime Database reference over the REST API, on the client's pooled session.
+
+    Same surface as firebase_admin.db.Reference (and the emulator's) for what this repo uses.
+    """
+
+    def __init__(self, session, db_url, parts):
+        self._session = session
+        self._db_url = db_url
+        self._parts = parts
+
+    @property
+    def key(self):
+        return self._parts[-1] if self._parts else None
+
+    @property
+    def path(self):
+        return "/" + "/".join(self._parts)
+
+    @property
+    def parent(self):
+        if not self._parts:
+            return None
+        return Reference(self._session, self._db_url, self._parts[:-1])
+
+    def child(self, path):
+        return Reference(self._session, self._db_url, self._parts + split_path(path))
+
+    def _request(self, method, value=None):
+        data = None if value is None else json.dumps(value)
+        response = self._session.request(method, f"{self._db_url}{self.path}.json", data=data, timeout=DB_TIMEOUT)
+        response.raise_for_status()
+        return response.json() if response.content else None
+
+    def get(self):
+        return self._request("GET")
+
+    def set(self, value):
+        self._request("PUT", value)
+
+    def push(self, value=""):
+        return self.child(self._request("POST", value)["name"])
+
+    def update(self, value):
+        if not isinstance(value, dict) or not value:
+            raise ValueError("Value argument must be a non-empty dictionary.")
+        self._request("PATCH", value)
+
+    def delete(self):
+        self._request("DELETE")
+
+
+def split_path(path):
+    return [part for part in str(path).split("/") if part]
+
+
+class FirebaseClient:
+    def __init__(self, db_url=FIREBASE_DB_URL, bucket_name=FIREBASE_STORAGE_BUCKET,
+                 service_account_path=SERVICE_ACCOUNT_PATH, emulator=USE_FIREBASE_EMULATOR):
+        self.emulator = emulator
+        self.bucket_name = bucket_name
+        self.stats = Counter()
+        self._references = OrderedDict()
+        self._lock = threading.Lock()
+        self._bucket = None
+        self._stop = threading.Event()
+
+        if emulator:
+            import firebase_emulator
+            self._db = firebase_emulator.db
+            self._storage = firebase_emulator.storage
+            print("Using in-process Firebase emulator")
+            return
+
+        if not db_url:
+            raise ValueError("❌ ERROR: FIREBASE_DB_URL is missing from .env!")
+        if not os.path.exists(service_account_path):
+            raise ValueError(f"ERROR: Service account key not found at {service_account_path}")
+        self._init_app(db_url, service_account_path)
+
+    def _init_app(self, db_url, service_account_path):
+        import firebase_admin
+        from firebase_admin import credentials
+        import requests
+        from google.auth.transport.requests import AuthorizedSession
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        # Reuse an app another module already initialised instead of tearing it down
+        try:
+            self.app = firebase_admin.get_app()
+        except ValueError:
+            self.app = firebase_admin.initialize_app(credentials.Certificate(service_account_path), {
+                "databaseURL": db_url,
+                "storageBucket": self.bucket_name,
+            })
+            self.stats["app_initializations"] += 1
+        self.db_url = db_url.rstrip("/")
+        self.credential = self.app.credential.get_credential()
+
+        # One pool for every Firebase host; retries match firebase_admin's own defaults
+        retry = Retry(connect=1, read=1, status=4, status_forcelist=[500, 503], raise_on_status=False,
+                      backoff_factor=0.5)
+        self.adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+
+        # Database and Storage requests share this session (and its pool); it adds the bearer token
+        self.session = AuthorizedSession(self.credential)
+        self._mount(self.session)
+
+        self._token_session = requests.Session()
+        self._mount(self._token_session)
+        self.refresh_token()
+        self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._refresher.start()
+
+    def _mount(self, session):
+        session.mount("https://", self.adapter)
+        session.mount("http://", self.adapter)
+
+    # Realtime Database reference, cached by path (references are immutable, so sharing is safe)
+    def reference(self, path="/"):
+        with self._lock:
+            ref = self._references.get(path)
+            if ref is not None:
+                self._references.move_to_end(path)
+                self.stats["reference_hits"] += 1
+                return ref
+        if self.emulator:
+            ref = self._db.reference(path)
+        else:
+            ref = Reference(self.session, self.db_url, split_path(path))
+        with self._lock:
+            self._references[path] = ref
+            if len(self._references) > REFERENCE_CACHE_SIZE:
+                self._references.popitem(last=False)
+        return ref
+
+    def bucket(self):
+        with self._lock:
+            if self._bucket is None:
+                self._bucket = self._create_bucket()
+            return self._bucket
+
+    def _create_bucket(self):
+        if self.emulator:
+            return self._storage.bucket()
+        from google.cloud import storage
+
+        project = self.app.project_id or getattr(self.credential, "project_id", None)
+        client = storage.Client(project=project, credentials=self.credential, _http=self.session)
+        return client.bucket(self.bucket_name)
+
+    # Upload a file readable by URL in one request (no make_public() ACL round trip)
+    def upload_public(self, blob_name, filename, content_type="image/jpeg"):
+        blob = self.bucket().blob(blob_name)
+        blob.upload_from_filename(filename, content_type=content_type, predefined_acl="publicRead")
+        self.stats["uploads"] += 1
+        return blob.public_url
+
+    def refresh_token(self):
+        from google.auth.transport.requests import Request
+        self.credential.refresh(Request(session=self._token_session))
+        self.stats["token_refreshes"] += 1
+
+    def _seconds_to_expiry(self):
+        expiry = getattr(self.credential, "expiry", None)
+        if expiry is None:
+            return 0
+        if expiry.tzinfo is None:
+            expiry = expiry.replace(tzinfo=timezone.utc)  # google-auth keeps expiry as naive UTC
+        return (expiry - datetime.now(timezone.utc)).total_seconds()
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            remaining = self._seconds_to_expiry()
+            if remaining <= TOKEN_REFRESH_MARGIN:
+                try:
+                    self.refresh_token()
+                    continue
+                except Exception as e:
+                    self.stats["token_refresh_errors"] += 1
+                    print(f"Token refresh failed: {e}")
+                    self._stop.wait(TOKEN_RETRY_INTERVAL)
+                    continue
+            self._stop.wait(max(1, min(TOKEN_CHECK_INTERVAL, remaining - TOKEN_REFRESH_MARGIN)))
+
+    # Counters, including connections actually opened by the shared pool
+    def connection_stats(self):
+        stats = dict(self.stats)
+        if self.emulator:
+            import firebase_emulator
+            stats.update(firebase_emulator.get_emulator().stats)
+            return stats
+        pools = [self.adapter.poolmanager.pools[key] for key in self.adapter.poolmanager.pools.keys()]
+        stats["connection_setups"] = sum(pool.num_connections for pool in pools)
+        stats["http_requests"] = sum(pool.num_requests for pool in pools)
+        stats["token_expires_in"] = round(self._seconds_to_expiry())
+        return stats
+
+    def close(self):
+        self._stop.set()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+# Function to get the process-wide client (created on first use)
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = FirebaseClient()
+        return _client
@@ -0,0 +1,405 @@
+import os
+import json
+import time
+import random
+import threading
+from urllib.parse import quote
+
+# In-process stand-in for the parts of firebase_admin.db and firebase_admin.storage
+# used by the capture scripts. Lets upload throughput, batching and queuing be
+# tested on a dev box without network access or a service account.
+#
+# Drop-in usage:
+#     from firebase_emulator import db, storage
+#     db.reference("/plant_analysis").push({...})
+#     blob = storage.bucket().blob("raw_images/raw.jpg")
+
+# Emulator settings (override with environment variables)
+EMULATOR_LATENCY = float(os.getenv("FIREBASE_EMULATOR_LATENCY", "0.0"))  # seconds per request
+EMULATOR_JITTER = float(os.getenv("FIREBASE_EMULATOR_JITTER", "0.0"))  # +/- seconds added to latency
+EMULATOR_BANDWIDTH = float(os.getenv("FIREBASE_EMULATOR_BANDWIDTH", "0"))  # bytes/second, 0 = unlimited
+EMULATOR_FAILURE_RATE = float(os.getenv("FIREBASE_EMULATOR_FAILURE_RATE", "0.0"))  # 0.0 - 1.0
+EMULATOR_STORAGE_DIR = os.getenv("FIREBASE_EMULATOR_STORAGE_DIR")  # keep uploaded blobs on disk if set
+EMULATOR_BUCKET = os.getenv("FIREBASE_STORAGE_BUCKET", "agrisense-emulator.appspot.com")
+
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+
+class EmulatorError(Exception):
+    """Raised when the emulator injects a request failure."""
+
+
+def _split_path(path):
+    return [part for part in (path or "").split("/") if part]
+
+
+# Server value {".sv": {"increment": n}}: resolved against the stored value, like the real database
+def _resolve_server_value(value, current):
+    if isinstance(value, dict) and set(value) == {".sv"} and isinstance(value[".sv"], dict):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        return base + value[".sv"]["increment"]
+    return value
+
+
+class FirebaseEmulator:
+    def __init__(self, latency=EMULATOR_LATENCY, jitter=EMULATOR_JITTER, bandwidth=EMULATOR_BANDWIDTH,
+                 failure_rate=EMULATOR_FAILURE_RATE, storage_dir=EMULATOR_STORAGE_DIR,
+                 bucket_name=EMULATOR_BUCKET, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.storage_dir = storage_dir
+        self.bucket_name = bucket_name
+
+        self._random = random.Random(seed)
+        self._tree = {}
+        self._blobs = {}
+        self._data_lock = threading.Lock()
+        self._link_lock = threading.Lock()
+        self._link_free_at = 0.0
+        self._forced_failures = 0
+        self._last_push_time = 0
+        self._last_push_suffix = []
+
+        self.stats = {
+            "requests": 0,
+            "failures": 0,
+            "bytes_sent": 0,
+            "bytes_received": 0,
+            "busy_seconds": 0.0,
+        }
+
+        if self.storage_dir:
+            os.makedirs(self.storage_dir, exist_ok=True)
+
+        self.db = _DatabaseModule(self)
+        self.storage = _StorageModule(self)
+
+    # Force the next n requests to fail, regardless of failure_rate
+    def fail_next(self, n=1):
+        with self._data_lock:
+            self._forced_failures += n
+
+    # Drop all stored data and counters
+    def reset(self):
+        with self._data_lock:
+            self._tree = {}
+            self._blobs = {}
+            self._forced_failures = 0
+            for key in self.stats:
+                self.stats[key] = 0.0 if key == "busy_seconds" else 0
+
+    # Simulate one round trip carrying nbytes over a single shared uplink
+    def _request(self, nbytes_sent=0, nbytes_received=0):
+        start = time.monotonic()
+        delay = self.latency
+        if self.jitter:
+            delay = max(0.0, delay + self._random.uniform(-self.jitter, self.jitter))
+
+        # Transfers queue behind each other on the link, like a real uplink
+        nbytes = nbytes_sent + nbytes_received
+        if self.bandwidth and nbytes:
+            with self._link_lock:
+                begin = max(start, self._link_free_at)
+                self._link_free_at = begin + nbytes / self.bandwidth
+                done_at = self._link_free_at
+            delay += done_at - start
+
+        if delay > 0:
+            time.sleep(delay)
+
+        with self._data_lock:
+            self.stats["requests"] += 1
+            self.stats["busy_seconds"] += time.monotonic() - start
+            fail = self._forced_failures > 0 or (self.failure_rate and self._random.random() < self.failure_rate)
+            if self._forced_failures > 0:
+                self._forced_failures -= 1
+            if fail:
+                self.stats["failures"] += 1
+            else:
+                self.stats["bytes_sent"] += nbytes_sent
+                self.stats["bytes_received"] += nbytes_received
+
+        if fail:
+            raise EmulatorError("Injected failure (emulated network error)")
+
+    # Firebase push IDs: 8 chars of millisecond timestamp + 12 chars that increment on collisions
+    def _push_id(self):
+        now = int(time.time() * 1000)
+        with self._data_lock:
+            if now == self._last_push_time:
+                suffix = self._last_push_suffix
+                for i in range(11, -1, -1):
+                    if suffix[i] != 63:
+                        suffix[i] += 1
+                        break
+                    suffix[i] = 0
+            else:
+                self._last_push_time = now
+                self._last_push_suffix = [self._random.randrange(64) for _ in range(12)]
+            suffix = list(self._last_push_suffix)
+
+        prefix = []
+        for _ in range(8):
+            prefix.append(PUSH_CHARS[now % 64])
+            now //= 64
+        return "".join(reversed(prefix)) + "".join(PUSH_CHARS[i] for i in suffix)
+
+    def _get(self, parts):
+        with self._data_lock:
+            node = self._tree
+            for part in parts:
+                if not isinstance(node, dict) or part not in node:
+                    return None
+                node = node[part]
+            return json.loads(json.dumps(node))
+
+    def _set(self, parts, value):
+        with self._data_lock:
+            if not parts:
+                self._tree = value if isinstance(value, dict) else {}
+                return
+            node = self._tree
+            for part in parts[:-1]:
+                if not isinstance(node.get(part), dict):
+                    if value is None:
+                        return
+                    node[part] = {}
+                node = node[part]
+            value = _resolve_server_value(value, node.get(parts[-1]))
+            if value is None:
+                node.pop(parts[-1], None)
+            else:
+                node[parts[-1]] = value
+
+
+class _DatabaseModule:
+    def __init__(self, emulator):
+        self._emulator = emulator
+
+    def reference(self, path="/", app=None, url=None):
+        return Reference(self._emulator, _split_path(path))
+
+
+class Reference:
+    def __init__(self, emulator, parts):
+        self._emulator = emulator
+        self._parts = parts
+
+    @property
+    def key(self):
+        return self._parts[-1] if self._parts else None
+
+    @property
+    def path(self):
+        return "/" + "/".join(self._parts)
+
+    @property
+    def parent(self):
+        if not self._parts:
+            return None
+        return Reference(self._emulator, self._parts[:-1])
+
+    def child(self, path):
+        return Reference(self._emulator, self._parts + _split_path(path))
+
+    def get(self):
+        value = self._emulator._get(self._parts)
+        self._emulator._request(nbytes_received=len(json.dumps(value)))
+        return value
+
+    def set(self, value):
+        # Round-trip through JSON so non-serializable values fail like the real SDK
+        payload = json.dumps(value)
+        self._emulator._request(nbytes_sent=len(payload))
+        self._emulator._set(self._parts, json.loads(payload))
+
+    def push(self, value=""):
+        ref = self.child(self._emulator._push_id())
+        ref.set(value)
+        return ref
+
+    def update(self, value):
+        if not isinstance(value, dict) or not value:
+            raise ValueError("Value argument must be a non-empty dictionary.")
+        payload = json.dumps(value)
+        self._emulator._request(nbytes_sent=len(payload))
+        for key, child_value in json.loads(payload).items():
+            self._emulator._set(self._parts + _split_path(key), child_value)
+
+    def delete(self):
+        self._emulator._request()
+        self._emulator._set(self._parts, None)
+
+
+class _StorageModule:
+    def __init__(self, emulator):
+        self._emulator = emulator
+
+    def bucket(self, name=None, app=None):
+        return Bucket(self._emulator, name or self._emulator.bucket_name)
+
+
+class Bucket:
+    def __init__(self, emulator, name):
+        self._emulator = emulator
+        self.name = name
+
+    def blob(self, blob_name):
+        return Blob(self._emulator, self, blob_name)
+
+    def get_blob(self, blob_name):
+        blob = self.blob(blob_name)
+        return blob if blob.exists() else None
+
+    def list_blobs(self, prefix=""):
+        with self._emulator._data_lock:
+            names = sorted(name for (bucket, name) in self._emulator._blobs if bucket == self.name)
+        return [self.blob(name) for name in names if name.startswith(prefix)]
+
+
+class Blob:
+    def __init__(self, emulator, bucket, name):
+        self._emulator = emulator
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def _key(self):
+        return (self.bucket.name, self.name)
+
+    @property
+    def public_url(self):
+        return f"https://storage.googleapis.com/{self.bucket.name}/{quote(self.name)}"
+
+    @property
+    def size(self):
+        entry = self._emulator._blobs.get(self._key)
+        return len(entry["data"]) if entry else None
+
+    def exists(self):
+        self._emulator._request()
+        return self._key in self._emulator._blobs
+
+    def upload_from_string(self, data, content_type=None, predefined_acl=None, **kwargs):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._emulator._request(nbytes_sent=len(data))
+        with self._emulator._data_lock:
+            self._emulator._blobs[self._key] = {
+                "data": data,
+                "content_type": content_type,
+                "public": predefined_acl == "publicRead",
+            }
+        if self._emulator.storage_dir:
+            local_path = os.path.join(self._emulator.storage_dir, self.bucket.name, self.name)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            with open(local_path, "wb") as f:
+                f.write(data)
+
+    def upload_from_filename(self, filename, content_type=None, **kwargs):
+        with open(filename, "rb") as f:
+            data = f.read()
+        self.upload_from_string(data, content_type=content_type, **kwargs)
+
+    def download_as_bytes(self):
+        entry = self._emulator._blobs.get(self._key)
+        if entry is None:
+            self._emulator._request()
+            raise EmulatorError(f"No such object: {self.bucket.name}/{self.name}")
+        self._emulator._request(nbytes_received=len(entry["data"]))
+        return entry["data"]
+
+    def download_to_filename(self, filename):
+        data = self.download_as_bytes()
+        with open(filename, "wb") as f:
+            f.write(data)
+
+    def make_public(self):
+        self._emulator._request()
+        with self._emulator._data_lock:
+            entry = self._emulator._blobs.get(self._key)
+            if entry is None:
+                raise EmulatorError(f"No such object: {self.bucket.name}/{self.name}")
+            entry["public"] = True
+
+    def delete(self):
+        self._emulator._request()
+        with self._emulator._data_lock:
+            self._emulator._blobs.pop(self._key, None)
+
+
+# Process-wide default emulator, shared by the db and storage stand-ins below
+_default_emulator = None
+_default_lock = threading.Lock()
+
+
+def get_emulator():
+    global _default_emulator
+    with _default_lock:
+        if _default_emulator is None:
+            _default_emulator = FirebaseEmulator()
+        return _default_emulator
+
+
+class _DefaultDatabase:
+    def reference(self, path="/", app=None, url=None):
+        return get_emulator().db.reference(path)
+
+
+class _DefaultStorage:
+    def bucket(self, name=None, app=None):
+        return get_emulator().storage.bucket(name)
+
+
+db = _DefaultDatabase()
+storage = _DefaultStorage()
+
+
+# No-op stand-in for firebase_admin.initialize_app
+def initialize_app(credential=None, options=None, name="[DEFAULT]"):
+    return get_emulator()
+
+
+# Quick offline load test: N uploads of a payload from several threads
+def run_load_test(uploads=200, payload_kb=150, threads=4, **emulator_options):
+    emulator = FirebaseEmulator(**emulator_options)
+    payload = os.urandom(payload_kb * 1024)
+    counter = iter(range(uploads))
+    counter_lock = threading.Lock()
+    errors = []
+
+    def worker():
+        bucket = emulator.storage.bucket()
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            try:
+                bucket.blob(f"load_test/{i}.jpg").upload_from_string(payload)
+                emulator.db.reference(f"load_test/{i}").set({"size": len(payload)})
+            except EmulatorError as e:
+                errors.append(e)
+
+    start = time.monotonic()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.monotonic() - start
+
+    ok = uploads - len(errors)
+    print(f"Uploads: {ok}/{uploads} ok, {len(errors)} failed in {elapsed:.2f}s "
+          f"({ok / elapsed:.1f} uploads/s, {emulator.stats['bytes_sent'] / elapsed / 1024:.1f} KiB/s)")
+    return emulator.stats
+
+
+if __name__ == "__main__":
+    run_load_test(
+        latency=EMULATOR_LATENCY or 0.05,
+        bandwidth=EMULATOR_BANDWIDTH or 2 * 1024 * 1024,
+        failure_rate=EMULATOR_FAILURE_RATE,
+    )
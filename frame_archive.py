@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import cv2
+
+# Local frame archive: per-class retention, hash deduplication, a disk-usage cap and an
+# append-only index file, so the capture loop never has to scan Captured/ or Detected/.
+
+BASE_DIR = "/home/Agrisense/Thesis"
+ARCHIVE_INDEX_PATH = os.getenv("ARCHIVE_INDEX_PATH", os.path.join(BASE_DIR, "archive_index.jsonl"))
+ARCHIVE_MAX_BYTES = int(float(os.getenv("ARCHIVE_MAX_MB", "2048")) * 1024 * 1024)
+
+# Retention per frame class. preview: re-encode small on arrival. dedupe: hard-link identical copies.
+RETENTION_POLICY = {
+    "raw": {"max_age_days": 30, "preview": False, "dedupe": True},
+    "detected": {"max_age_days": 30, "preview": True, "dedupe": True},
+    "retrieved": {"max_age_days": 2, "preview": False, "dedupe": True},
+}
+# When over the cap, delete from the cheapest class first (classes no longer in the policy go before all of them)
+EVICTION_ORDER = ["retrieved", "detected", "raw"]
+
+PREVIEW_MAX_SIDE = 480
+PREVIEW_QUALITY = 70
+COMPACT_RATIO = 2  # Rewrite the index once it holds this many lines per live entry
+
+
+# Function to hash a file without reading it into memory at once
+def file_sha1(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Function to read a JPEG's (width, height) from its frame header without decoding it
+def jpeg_size(path):
+    with open(path, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            return None
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+                continue  # Markers without a length field
+            length = int.from_bytes(f.read(2), "big")
+            if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                header = f.read(5)  # Precision, height, width
+                return int.from_bytes(header[3:5], "big"), int.from_bytes(header[1:3], "big")
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+# Function to shrink an annotated frame in place to a small JPEG preview
+def make_preview(path, max_side=PREVIEW_MAX_SIDE, quality=PREVIEW_QUALITY):
+    size = jpeg_size(path)
+    if size is not None and max(size) <= max_side:
+        return True  # Written at preview size already (AnnotationRenderer): no second encode
+    image = cv2.imread(path)
+    if image is None:
+        return False
+    height, width = image.shape[:2]
+    scale = max_side / float(max(height, width))
+    if scale < 1.0:
+        image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    tmp_path = path + ".tmp.jpg"
+    if not cv2.imwrite(tmp_path, image, [cv2.IMWRITE_JPEG_QUALITY, quality]):
+        return False
+    os.replace(tmp_path, path)
+    return True
+
+
+class FrameArchive:
+    def __init__(self, index_path=ARCHIVE_INDEX_PATH, max_bytes=ARCHIVE_MAX_BYTES, policy=None):
+        self.index_path = index_path
+        self.max_bytes = max_bytes
+        self.policy = policy or RETENTION_POLICY
+        self.entries = {}  # path -> {"kind", "sha1", "size", "created", "link_of"}
+        self.hashes = {}  # sha1 -> path of the stored copy
+        self.paths_by_hash = {}  # sha1 -> {path: None} for every entry with that content (insertion-ordered)
+        self.total_bytes = 0
+        self._log_lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    # Rebuild the in-memory index by replaying the append-only log
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line after a crash
+                self._log_lines += 1
+                if record["op"] == "add":
+                    self._apply_add(record["path"], record["entry"])
+                elif record["op"] == "remove":
+                    self._apply_remove(record["path"])
+
+    def _apply_add(self, path, entry):
+        self._apply_remove(path)
+        self.entries[path] = entry
+        self.paths_by_hash.setdefault(entry["sha1"], {})[path] = None
+        if entry["link_of"] is None:
+            self.total_bytes += entry["size"]
+            self.hashes.setdefault(entry["sha1"], path)
+
+    def _apply_remove(self, path):
+        entry = self.entries.pop(path, None)
+        if entry is None:
+            return
+        peers = self.paths_by_hash.get(entry["sha1"], {})
+        peers.pop(path, None)
+        if not peers:
+            self.paths_by_hash.pop(entry["sha1"], None)
+        if self.hashes.get(entry["sha1"]) == path:
+            del self.hashes[entry["sha1"]]
+        if entry["link_of"] is not None:
+            return
+        self.total_bytes -= entry["size"]
+
+        # Hard links outlive the original: the first one now owns the blocks
+        new_original = None
+        for link_path in peers:
+            link_entry = self.entries[link_path]
+            if link_entry["link_of"] != path:
+                continue
+            if new_original is None:
+                new_original = link_path
+                link_entry["link_of"] = None
+                self.total_bytes += link_entry["size"]
+                self.hashes.setdefault(link_entry["sha1"], link_path)
+            else:
+                link_entry["link_of"] = new_original
+
+    def _append(self, records):
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        with open(self.index_path, "a") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        self._log_lines += len(records)
+        if self._log_lines > COMPACT_RATIO * max(len(self.entries), 64):
+            self._compact()
+
+    # Rewrite the log with only the live entries
+    def _compact(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for path, entry in self.entries.items():
+                f.write(json.dumps({"op": "add", "path": path, "entry": entry}) + "\n")
+        os.replace(tmp_path, self.index_path)
+        self._log_lines = len(self.entries)
+
+    def add(self, path, kind, created=None):
+        """Register a frame that was just written. Returns the path (unchanged)."""
+        if kind not in self.policy:
+            raise ValueError(f"ERROR: unknown frame class '{kind}'")
+        rules = self.policy[kind]
+        path = os.path.abspath(path)
+
+        if rules.get("preview"):
+            make_preview(path)
+
+        sha1 = file_sha1(path)
+        entry = {
+            "kind": kind,
+            "sha1": sha1,
+            "size": os.path.getsize(path),
+            "created": created if created is not None else time.time(),
+            "link_of": None,
+        }
+
+        with self._lock:
+            original = self.hashes.get(sha1)
+            if rules.get("dedupe") and original and original != path and os.path.exists(original):
+                # Identical bytes already archived: keep the path but share the blocks
+                tmp_path = path + ".link"
+                try:
+                    os.link(original, tmp_path)
+                    os.replace(tmp_path, path)
+                    entry["link_of"] = original
+                except OSError:
+                    pass
+            self._apply_add(path, entry)
+            self._append([{"op": "add", "path": path, "entry": entry}])
+        return path
+
+    def _delete(self, paths, removed):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error removing {path}: {e}")
+                continue
+            self._apply_remove(path)
+            removed.append({"op": "remove", "path": path})
+
+    def prune(self, now=None):
+        """Apply retention and the disk cap. Returns the number of frames removed."""
+        now = now if now is not None else time.time()
+        removed = []
+        with self._lock:
+            expired = []
+            for path, entry in self.entries.items():
+                max_age_days = self.policy.get(entry["kind"], {}).get("max_age_days")
+                if max_age_days is not None and now - entry["created"] > max_age_days * 86400:
+                    expired.append(path)
+            self._delete(expired, removed)
+
+            if self.total_bytes > self.max_bytes:
+                rank = {kind: i for i, kind in enumerate(EVICTION_ORDER)}
+                candidates = sorted(
+                    (path for path, entry in self.entries.items() if entry["link_of"] is None),
+                    key=lambda p: (rank.get(self.entries[p]["kind"], -1), self.entries[p]["created"]),
+                )
+                for path in candidates:
+                    if self.total_bytes <= self.max_bytes:
+                        break
+                    if path not in self.entries:
+                        continue
+                    # Blocks are only freed once every hard link to them is gone
+                    links = [p for p in self.paths_by_hash.get(self.entries[path]["sha1"], ())
+                             if self.entries[p]["link_of"] == path]
+                    self._delete(links + [path], removed)
+
+            if removed:
+                self._append(removed)
+        if removed:
+            print(f"Archive pruned {len(removed)} frames, {self.total_bytes / 1024 / 1024:.1f} MB in use")
+        return len(removed)
+
+    def list(self, kind=None, since=None, until=None):
+        with self._lock:
+            items = [
+                (path, entry) for path, entry in self.entries.items()
+                if (kind is None or entry["kind"] == kind)
+                and (since is None or entry["created"] >= since)
+                and (until is None or entry["created"] < until)
+            ]
+        return sorted(items, key=lambda item: item[1]["created"])
+
+    def usage(self):
+        with self._lock:
+            by_kind = {}
+            for entry in self.entries.values():
+                if entry["link_of"] is None:
+                    by_kind[entry["kind"]] = by_kind.get(entry["kind"], 0) + entry["size"]
+            return {"total_bytes": self.total_bytes, "frames": len(self.entries), "bytes_by_kind": by_kind}
+
+    # One-off: index frames already on disk (the only directory scan the archive does)
+    def import_directory(self, directory, kind, pattern=".jpg"):
+        added = 0
+        with os.scandir(directory) as it:
+            for item in sorted(it, key=lambda e: e.stat().st_mtime):
+                if item.is_file() and item.name.endswith(pattern) and os.path.abspath(item.path) not in self.entries:
+                    # Leaf-contour overlays from older scripts are annotated frames like detected_*
+                    item_kind = "detected" if item.name.endswith("_contours" + pattern) else kind
+                    self.add(item.path, item_kind, created=item.stat().st_mtime)
+                    added += 1
+        return added
+
+
+if __name__ == "__main__":
+    archive = FrameArchive()
+    for directory, kind in [
+        (os.path.join(BASE_DIR, "Captured", "Raw"), "raw"),
+        (os.path.join(BASE_DIR, "Detected", "Detected"), "detected"),
+        (os.path.join(BASE_DIR, "Captured", "Retrieved"), "retrieved"),
+        (os.path.join(BASE_DIR, "Detected", "Retrieved"), "retrieved"),
+    ]:
+        if os.path.isdir(directory):
+            print(f"Indexed {archive.import_directory(directory, kind)} frames from {directory}")
+    archive.prune()
+    print(archive.usage())
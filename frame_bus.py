@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from runtime_config import pin_stage
+
+# Shared-memory frame bus between pipeline processes.
+#
+# One shared_memory block holds BUS_SLOTS ring slots. Each slot is a fixed header (sequence
+# number, frame shape, capture time, timestamp and a small JSON metadata area) followed by
+# one or more frame planes sized for the largest frame. A frame is written into a slot once
+# and every later stage works on a numpy view of that memory; the only things passed between
+# processes are (slot, sequence) pairs on per-stage queues. Whichever stage holds a slot is
+# its only writer, so headers need no locks.
+#
+# Live capture never waits: if every slot is still in use downstream, the frame is dropped and
+# counted (replays may wait instead). Stages hand slots on without waiting for each other.
+# Stage processes are forked (Linux), so they inherit the mapping rather than re-attaching.
+#
+#     bus = FrameBus(frame_shape=(960, 1280, 3), stages=3)
+#     run_stages(bus, [("inference", infer, load_model), ("upload", upload, None)], capture)
+#
+# A stage handler(bus, slot, context) returns the next stage's index, or None once it has
+# released the slot; Growth_Pipeline.py is the capture/inference/post-processing/upload chain.
+
+BUS_SLOTS = int(os.getenv("BUS_SLOTS", "6"))
+META_BYTES = 16 * 1024  # JSON metadata per slot (boxes, measurements, file paths)
+STOP = None  # Queue sentinel: this stage is done, pass it on
+CONTEXT = multiprocessing.get_context("fork")
+
+HEADER_DTYPE = np.dtype([
+    ("seq", "<u8"),
+    ("height", "<u4"),
+    ("width", "<u4"),
+    ("channels", "<u4"),
+    ("capture_time", "<f8"),
+    ("timestamp", "S32"),
+    ("meta_len", "<u4"),
+    ("meta", f"S{META_BYTES}"),
+])
+
+
+class SlotExpired(Exception):
+    """A queued slot was recycled before its stage read it (sequence mismatch)."""
+
+
+class FrameBus:
+    def __init__(self, frame_shape, slots=BUS_SLOTS, planes=1, stages=2, name=None):
+        self.frame_shape = tuple(frame_shape)
+        self.slots = slots
+        self.planes = planes
+        self.stages = stages
+        self.plane_bytes = int(np.prod(self.frame_shape))
+        self.slot_bytes = HEADER_DTYPE.itemsize + planes * self.plane_bytes
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=slots * self.slot_bytes)
+        self.owner = os.getpid()
+        # Stage inputs (stage 0 gets free slots). SimpleQueue writes straight to the pipe; it
+        # never holds more than one message per slot, so a put cannot block.
+        self.queues = [CONTEXT.SimpleQueue() for _ in range(stages)]
+        self.dropped = CONTEXT.Value("L", 0)
+        self._sequence = 0
+        for slot in range(slots):
+            self.queues[0].put(slot)
+        self._attach()
+
+    def _attach(self):
+        self._headers = [np.ndarray((), HEADER_DTYPE, self.shm.buf, slot * self.slot_bytes) for slot in range(self.slots)]
+
+    def header(self, slot):
+        return self._headers[slot]
+
+    def frame(self, slot, plane=0):
+        """Writable view of one frame plane, shaped as published (full plane before publishing)."""
+        header = self._headers[slot]
+        shape = (int(header["height"]), int(header["width"]), int(header["channels"])) if header["seq"] else self.frame_shape
+        offset = slot * self.slot_bytes + HEADER_DTYPE.itemsize + plane * self.plane_bytes
+        return np.ndarray(shape, np.uint8, self.shm.buf, offset)
+
+    def meta(self, slot):
+        header = self._headers[slot]
+        return json.loads(header["meta"][()][:int(header["meta_len"])] or b"{}")
+
+    def set_meta(self, slot, meta):
+        data = json.dumps(meta).encode()
+        if len(data) > META_BYTES:
+            raise ValueError(f"ERROR: slot metadata is {len(data)} bytes, limit {META_BYTES}")
+        header = self._headers[slot]
+        header["meta"] = data
+        header["meta_len"] = len(data)
+
+    # Capture side: a free slot, or None when every slot is still downstream (blocks only if asked)
+    def acquire(self, block=False):
+        if not block and self.queues[0].empty():  # Capture is the only consumer, so this cannot race
+            with self.dropped.get_lock():
+                self.dropped.value += 1
+            return None
+        return self.queues[0].get()
+
+    def write(self, slot, frame, timestamp, meta=None, plane=0):
+        """Copy a captured frame into a slot (the one copy it gets) and stamp the header."""
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        if height * width * channels > self.plane_bytes:
+            raise ValueError(f"ERROR: frame {frame.shape} does not fit bus slots of {self.frame_shape}")
+        self._sequence += 1
+        header = self._headers[slot]
+        header["seq"] = self._sequence
+        header["height"], header["width"], header["channels"] = height, width, channels
+        header["capture_time"] = time.time()
+        header["timestamp"] = str(timestamp).encode()
+        self.set_meta(slot, meta or {})
+        np.copyto(self.frame(slot, plane), frame.reshape(height, width, channels))
+
+    def timestamp(self, slot):
+        return self._headers[slot]["timestamp"][()].decode()
+
+    def send(self, slot, stage):
+        """Hand a slot to a stage (1..stages-1) without copying the frame."""
+        self.queues[stage].put((slot, int(self._headers[slot]["seq"])))
+
+    def receive(self, stage):
+        """Next slot for a stage; STOP when the upstream stage has finished."""
+        message = self.queues[stage].get()
+        if message is STOP:
+            return STOP
+        slot, seq = message
+        if int(self._headers[slot]["seq"]) != seq:
+            raise SlotExpired(f"slot {slot} was reused before stage {stage} read it")
+        return slot
+
+    def release(self, slot):
+        self._headers[slot]["seq"] = 0
+        self.queues[0].put(slot)
+
+    def stop(self, stage):
+        self.queues[stage].put(STOP)
+
+    def close(self):
+        self._headers = []
+        self.shm.close()
+        if os.getpid() == self.owner:
+            self.shm.unlink()
+
+
+def _run_stage(bus, index, name, handler, setup):
+    pin_stage(name)
+    context = None
+    try:
+        context = setup() if setup else None
+        while True:
+            try:
+                slot = bus.receive(index)
+            except SlotExpired as e:
+                print(f"❌ {name}: {e}")
+                continue
+            if slot is STOP:
+                break
+            seq = int(bus.header(slot)["seq"])
+            try:
+                next_stage = handler(bus, slot, context)
+            except Exception as e:
+                print(f"❌ {name} failed: {e}")
+                if int(bus.header(slot)["seq"]) == seq:  # Not yet released by the handler
+                    bus.release(slot)
+                continue
+            if next_stage is not None:
+                bus.send(slot, next_stage)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if index + 1 < bus.stages:
+            bus.stop(index + 1)
+        if context is not None and hasattr(context, "close"):
+            context.close()
+
+
+def run_stages(bus, stages, capture):
+    """Run each (name, handler, setup) stage in its own process and capture in this one.
+
+    capture(bus) loops until it returns; every later stage then drains its queue and
+    stops in order. setup() runs inside the stage's process (model loads, clients).
+    """
+    processes = [
+        CONTEXT.Process(target=_run_stage, args=(bus, index, name, handler, setup), name=name, daemon=True)
+        for index, (name, handler, setup) in enumerate(stages, start=1)
+    ]
+    for process in processes:
+        process.start()
+    pin_stage("capture")
+    try:
+        capture(bus)
+    except KeyboardInterrupt:
+        print("🛑 Stopping capture process")
+    finally:
+        bus.stop(1)
+        for process in processes:
+            process.join()
+        print(f"Frame bus: {bus.dropped.value} frame(s) dropped with every slot busy")
+        bus.close()
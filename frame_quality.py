@@ -0,0 +1,94 @@
+import os
+from collections import Counter
+import cv2
+from leaf_segmentation import green_mask
+
+# Pre-inference quality gate: brightness, sharpness and green fraction measured on a small
+# thumbnail, so dark (night), blurred or empty frames are rejected before they cost a YOLO
+# pass, contour counting and uploads. Each check has its own reject reason and counter.
+#
+# "dark" means an unlit frame the camera's auto-exposure could not recover. The late
+# captures in Captured/Raw (20250315_222113, _222406) are auto-exposed under room light
+# (mean grey 89-111) and show the wall, not the tray, so they are rejected as no_vegetation.
+# That is the accurate reason; raising MIN_BRIGHTNESS far enough to call them "dark" would
+# also reject the daytime frames (mean grey 89-122).
+
+QUALITY_GATE = os.getenv("QUALITY_GATE", "1") == "1"
+THUMB_WIDTH = 256  # Pixels; small enough to keep the gate far below an inference, detailed enough for blur
+MIN_BRIGHTNESS = float(os.getenv("QUALITY_MIN_BRIGHTNESS", "35"))  # Mean grey level of an unlit frame is far below this
+MAX_BRIGHTNESS = float(os.getenv("QUALITY_MAX_BRIGHTNESS", "235"))  # Blown-out frames
+MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "100"))  # Laplacian variance on the thumbnail
+MIN_GREEN_FRACTION = float(os.getenv("QUALITY_MIN_GREEN_FRACTION", "0.02"))  # Share of canopy pixels (empty tray ~0.01)
+
+REASONS = ("dark", "overexposed", "blurred", "no_vegetation")
+SKIPPED_PATH = "skipped_frames"  # One small record per rejected frame
+COUNTS_PATH = "frame_quality/reject_counts"
+
+
+# Realtime Database server value: add n to the stored number atomically, whoever else writes it
+def increment(n=1):
+    return {".sv": {"increment": n}}
+
+
+# Function to measure one frame on a nearest-neighbour thumbnail (no filtering pass over the full frame)
+def measure_frame(frame, width=THUMB_WIDTH):
+    height = max(1, int(frame.shape[0] * width / frame.shape[1]))
+    thumb = cv2.resize(frame, (width, height), interpolation=cv2.INTER_NEAREST)
+    gray = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+    _, deviation = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_16S))
+    return {
+        "brightness": round(float(cv2.mean(gray)[0]), 1),
+        "sharpness": round(float(deviation[0, 0]) ** 2, 1),
+        "green_fraction": round(cv2.countNonZero(green_mask(thumb)) / float(width * height), 4),
+    }
+
+
+class QualityResult:
+    def __init__(self, reason, metrics):
+        self.reason = reason  # None when the frame passed
+        self.metrics = metrics
+
+    @property
+    def ok(self):
+        return self.reason is None
+
+    def to_record(self, timestamp):
+        return {"timestamp": timestamp, "skipped": self.reason, **self.metrics}
+
+
+class FrameQualityGate:
+    def __init__(self, enabled=QUALITY_GATE, min_brightness=MIN_BRIGHTNESS, max_brightness=MAX_BRIGHTNESS,
+                 min_sharpness=MIN_SHARPNESS, min_green_fraction=MIN_GREEN_FRACTION):
+        self.enabled = enabled
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.min_sharpness = min_sharpness
+        self.min_green_fraction = min_green_fraction
+        self.stats = Counter()  # "passed" plus one counter per reject reason
+
+    def check(self, frame):
+        if not self.enabled:
+            return QualityResult(None, {})
+        metrics = measure_frame(frame)
+        # Ordered: a dark frame is also blurred and green-free, but "dark" is the useful reason
+        if metrics["brightness"] < self.min_brightness:
+            reason = "dark"
+        elif metrics["brightness"] > self.max_brightness:
+            reason = "overexposed"
+        elif metrics["sharpness"] < self.min_sharpness:
+            reason = "blurred"
+        elif metrics["green_fraction"] < self.min_green_fraction:
+            reason = "no_vegetation"
+        else:
+            reason = None
+        self.stats[reason or "passed"] += 1
+        return QualityResult(reason, metrics)
+
+    def reject_counts(self):
+        return {reason: self.stats[reason] for reason in REASONS}
+
+    # Multi-path update for one rejected frame: its record plus a server-side increment of its reason's counter
+    # (several processes and nodes reject frames, so writing this process's own totals would overwrite theirs)
+    def skipped_update(self, timestamp, result):
+        return {f"{SKIPPED_PATH}/{timestamp}": result.to_record(timestamp),
+                f"{COUNTS_PATH}/{result.reason}": increment()}
@@ -0,0 +1,181 @@
+import os
+import json
+import math
+import threading
+from datetime import datetime
+
+# Streaming growth analytics: every capture updates a constant-size running state per
+# metric in O(1), and that state is persisted so restarts carry on where they left off.
+#
+# Per metric (height, leaf area, leaf count) the state holds exponentially time-weighted
+# least-squares sums, so the windowed slope (growth per day) is read off directly, plus an
+# exponentially weighted variance of the residuals around that trend, so a new sample gets
+# an anomaly z-score against where the trend says it should be. A stall alert fires when
+# height growth stays below STALL_RATE over a long enough history.
+
+BASE_DIR = "/home/Agrisense/Thesis"
+GROWTH_STATE_PATH = os.getenv("GROWTH_STATE_PATH", os.path.join(BASE_DIR, "growth_analytics_state.json"))
+WINDOW_DAYS = float(os.getenv("GROWTH_WINDOW_DAYS", "1"))  # Time constant of the exponential window (slopes span ~3x this)
+MIN_SAMPLES = 5  # Samples before z-scores and alerts are reported
+Z_THRESHOLD = 3.5  # |z| above this is an anomaly
+STALL_METRIC = "height_cm"
+STALL_RATE = float(os.getenv("GROWTH_STALL_RATE", "0.1"))  # cm/day; slower than this counts as stalled
+STALL_MIN_DAYS = 2.0  # History needed before a stall is called
+
+TIMESTAMP_FORMATS = ("%Y%m%d_%H%M%S", "%Y-%m-%d_%H-%M-%S")
+SECONDS_PER_DAY = 86400.0
+
+
+def parse_timestamp(timestamp):
+    if isinstance(timestamp, datetime):
+        return timestamp
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(timestamp, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"ERROR: unrecognised timestamp '{timestamp}'")
+
+
+# Function to build one capture's metrics. A frame with no detected plants (occluded,
+# misframed, lights off) carries no growth signal, so it adds nothing rather than zeros
+# that would drag the trend down and fire false alerts. detections is the number of YOLO
+# boxes, which is not always leaf_count (v8 counts canopy contours).
+def capture_metrics(detections, height_cm, leaf_area_cm2, leaf_count):
+    if not detections:
+        return {}
+    return {"height_cm": height_cm, "leaf_area_cm2": leaf_area_cm2, "leaf_count": leaf_count}
+
+
+class MetricStream:
+    """Running trend and residual statistics for one metric.
+
+    Sample times are stored relative to the newest sample (t = 0, in days), so the sums are
+    re-centred on every update instead of growing with absolute time.
+    """
+
+    FIELDS = ("last_time", "first_time", "count", "s0", "st", "stt", "sx", "stx", "residual_var")
+
+    def __init__(self, window_days=WINDOW_DAYS, state=None):
+        self.window_days = window_days
+        self.last_time = None  # Epoch seconds of the newest sample
+        self.first_time = None
+        self.count = 0
+        self.s0 = self.st = self.stt = self.sx = self.stx = 0.0
+        self.residual_var = 0.0
+        for field, value in (state or {}).items():
+            setattr(self, field, value)
+
+    def to_state(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def _trend(self):
+        denominator = self.s0 * self.stt - self.st * self.st
+        if self.count < 2 or denominator <= 1e-12:
+            return None, (self.sx / self.s0 if self.s0 else None)
+        slope = (self.s0 * self.stx - self.st * self.sx) / denominator
+        return slope, (self.sx - slope * self.st) / self.s0  # Slope per day, level at t = 0
+
+    def update(self, time_seconds, value):
+        if self.last_time is not None and time_seconds <= self.last_time:
+            return None  # Replayed or out-of-order sample: the state already includes it
+
+        days = (time_seconds - self.last_time) / SECONDS_PER_DAY if self.last_time is not None else 0.0
+        decay = math.exp(-days / self.window_days)
+
+        # Age the sums, then move the time origin to the new sample
+        s0, st, stt, sx, stx = (v * decay for v in (self.s0, self.st, self.stt, self.sx, self.stx))
+        self.stt = stt - 2 * days * st + days * days * s0
+        self.st = st - days * s0
+        self.stx = stx - days * sx
+        self.s0, self.sx = s0, sx
+
+        # Score the sample against the trend's prediction before it joins the fit
+        slope, predicted = self._trend()
+        z = None
+        if predicted is not None:
+            residual = value - predicted
+            if self.count >= MIN_SAMPLES and self.residual_var > 1e-12:
+                z = residual / math.sqrt(self.residual_var)
+            weight = max(1.0 - decay, 1.0 / self.count)
+            self.residual_var += weight * (residual * residual - self.residual_var)
+
+        self.s0 += 1.0
+        self.sx += value
+        self.count += 1
+        self.last_time = time_seconds
+        if self.first_time is None:
+            self.first_time = time_seconds
+
+        slope, level = self._trend()
+        return {
+            "value": value,
+            "level": round(level, 3) if level is not None else None,
+            "rate_per_day": round(slope, 4) if slope is not None else None,
+            "relative_rate_pct_per_day": round(100 * slope / level, 2) if slope is not None and level else None,
+            "z": round(z, 2) if z is not None else None,
+            "anomaly": z is not None and abs(z) > Z_THRESHOLD,
+        }
+
+    @property
+    def history_days(self):
+        if self.first_time is None:
+            return 0.0
+        return (self.last_time - self.first_time) / SECONDS_PER_DAY
+
+
+class GrowthAnalytics:
+    def __init__(self, state_path=GROWTH_STATE_PATH, window_days=WINDOW_DAYS):
+        self.state_path = state_path
+        self.window_days = window_days
+        self.series = {}  # series (e.g. tray) -> {metric: MetricStream}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read growth analytics state ({e}); starting fresh")
+            return
+        for series, metrics in state.get("series", {}).items():
+            self.series[series] = {name: MetricStream(self.window_days, values) for name, values in metrics.items()}
+
+    def save(self):
+        state = {"series": {series: {name: stream.to_state() for name, stream in metrics.items()}
+                            for series, metrics in self.series.items()}}
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+    def update(self, timestamp, metrics, series="default"):
+        """Fold one capture's metrics ({name: value}) into the running state.
+
+        Returns {metric: stats} and a list of alerts for this capture.
+        """
+        time_seconds = parse_timestamp(timestamp).timestamp()
+        with self._lock:
+            streams = self.series.setdefault(series, {})
+            results = {}
+            for name, value in metrics.items():
+                if value is None:
+                    continue
+                stream = streams.setdefault(name, MetricStream(self.window_days))
+                result = stream.update(time_seconds, float(value))
+                if result is not None:
+                    results[name] = result
+
+            alerts = [f"anomaly:{name}" for name, result in results.items() if result["anomaly"]]
+            stall = streams.get(STALL_METRIC)
+            if (STALL_METRIC in results and stall.count >= MIN_SAMPLES and stall.history_days >= STALL_MIN_DAYS
+                    and results[STALL_METRIC]["rate_per_day"] is not None
+                    and results[STALL_METRIC]["rate_per_day"] < STALL_RATE):
+                alerts.append("stalled_growth")
+
+            if results:
+                self.save()
+        return {"metrics": results, "alerts": alerts}
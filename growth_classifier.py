@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+
+# Table-driven growth-stage classifier.
+#
+# Each crop lists its stages in growth order. A plant is in the first stage whose
+# height, leaf count and leaf area thresholds are ALL above its measurements; the
+# last stage is the fallback (the same rule as the old classify_growth if/elif chain).
+# Because thresholds increase stage by stage, that rule reduces to one searchsorted
+# per metric over precomputed breakpoints, so whole arrays classify in one NumPy pass.
+
+GROWTH_STAGES_PATH = os.getenv(
+    "GROWTH_STAGES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "growth_stages.json")
+)
+STAGE_RELOAD_INTERVAL = 5.0  # Seconds between config mtime checks when hot reload is on
+
+METRICS = ("height", "leaves", "leaf_area")
+
+# Used when the config file is missing
+DEFAULT_STAGE_CONFIG = {
+    "default_crop": "default",
+    "crops": {
+        "default": {
+            "stages": [
+                {"name": "Seedling", "height": 5, "leaves": 4, "leaf_area": 15},
+                {"name": "Vegetative", "height": 15, "leaves": 8, "leaf_area": 50},
+                {"name": "Mature", "height": 25, "leaves": 12, "leaf_area": 100},
+            ]
+        }
+    },
+}
+
+
+class StageTable:
+    """Precomputed breakpoints for one crop."""
+
+    def __init__(self, crop, stages):
+        if not stages:
+            raise ValueError(f"ERROR: crop '{crop}' has no stages")
+        self.crop = crop
+        self.names = np.array([stage["name"] for stage in stages], dtype=object)
+
+        # The last stage is the fallback, so its thresholds are never compared against
+        self.breakpoints = np.array(
+            [[float(stage[metric]) for stage in stages[:-1]] for metric in METRICS], dtype=np.float64
+        ).reshape(len(METRICS), len(stages) - 1)
+
+        if np.any(np.diff(self.breakpoints, axis=1) < 0):
+            raise ValueError(f"ERROR: thresholds for crop '{crop}' must not decrease from stage to stage")
+
+    def classify(self, heights, leaf_counts, leaf_areas):
+        values = (heights, leaf_counts, leaf_areas)
+        stage_index = None
+        for breakpoints, value in zip(self.breakpoints, values):
+            # Index of the first stage whose threshold is strictly above the value
+            index = np.searchsorted(breakpoints, np.asarray(value, dtype=np.float64), side="right")
+            stage_index = index if stage_index is None else np.maximum(stage_index, index)
+        return stage_index
+
+
+class StageClassifier:
+    def __init__(self, config_path=GROWTH_STAGES_PATH, crop=None, hot_reload=False,
+                 reload_interval=STAGE_RELOAD_INTERVAL):
+        self.config_path = config_path
+        self.crop = crop
+        self.hot_reload = hot_reload
+        self.reload_interval = reload_interval
+
+        self.tables = {}
+        self.default_crop = None
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if self.config_path and os.path.exists(self.config_path):
+            mtime = os.path.getmtime(self.config_path)
+            with open(self.config_path, "r") as f:
+                config = json.load(f)
+        else:
+            print(f"WARNING: growth stage config not found at {self.config_path}, using built-in thresholds")
+            mtime = None
+            config = DEFAULT_STAGE_CONFIG
+
+        tables = {crop: StageTable(crop, spec["stages"]) for crop, spec in config["crops"].items()}
+        default_crop = config.get("default_crop") or next(iter(tables))
+        if default_crop not in tables:
+            raise ValueError(f"ERROR: default crop '{default_crop}' is not defined in {self.config_path}")
+
+        # Swap the whole table set at once so the capture loop never sees a half-loaded config
+        with self._lock:
+            self.tables = tables
+            self.default_crop = default_crop
+            self._mtime = mtime
+
+    # Reload thresholds if the config file changed; keeps the old tables on a bad edit
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check or not self.config_path:
+            return False
+        self._next_check = now + self.reload_interval
+
+        try:
+            mtime = os.path.getmtime(self.config_path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+
+        try:
+            self.load()
+        except (ValueError, KeyError, TypeError) as e:
+            self._mtime = mtime
+            print(f"Error reloading growth stages from {self.config_path}: {e}")
+            return False
+        print(f"Reloaded growth stage thresholds from {self.config_path}")
+        return True
+
+    def table(self, crop=None):
+        if self.hot_reload:
+            self.maybe_reload()
+        with self._lock:
+            crop = crop or self.crop or self.default_crop
+            if crop not in self.tables:
+                raise KeyError(f"ERROR: unknown crop '{crop}'")
+            return self.tables[crop]
+
+    # Stage indices for arrays of measurements (one NumPy pass)
+    def classify(self, heights, leaf_counts, leaf_areas, crop=None):
+        return self.table(crop).classify(heights, leaf_counts, leaf_areas)
+
+    # Stage names for arrays of measurements
+    def classify_names(self, heights, leaf_counts, leaf_areas, crop=None):
+        table = self.table(crop)
+        return table.names[table.classify(heights, leaf_counts, leaf_areas)]
+
+    # Stage name for a single plant
+    def classify_one(self, height, leaf_count, leaf_area, crop=None):
+        table = self.table(crop)
+        return str(table.names[int(table.classify(height, leaf_count, leaf_area))])
+
+    __call__ = classify_one
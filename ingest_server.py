@@ -0,0 +1,594 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+# Local aggregation server for many greenhouse nodes.
+#
+# Edge nodes POST batched detection records (and images) over keep-alive HTTP/1.1.
+# Records are bulk-inserted into SQLite by a single writer task; a bounded queue gives
+# backpressure (503 + Retry-After) and a per-node token bucket gives rate limiting (429).
+# A batch is validated whole before any record is queued. The 202 is sent once records
+# are queued, so a failed insert is retried, then spilled to a JSONL file that is loaded
+# at the next start; records are only dropped if the spill write fails too.
+# A forwarder periodically sends consolidated per-node data upstream (e.g. Firebase).
+#
+#   python ingest_server.py                 # serve
+#   python ingest_server.py loadtest 20 200 # 20 nodes x 200 batches against localhost
+
+BASE_DIR = "/home/Agrisense/Thesis"
+INGEST_HOST = os.getenv("INGEST_HOST", "127.0.0.1")
+INGEST_PORT = int(os.getenv("INGEST_PORT", "8750"))
+INGEST_DB_PATH = os.getenv("INGEST_DB_PATH", os.path.join(BASE_DIR, "ingest.sqlite3"))
+INGEST_IMAGE_DIR = os.getenv("INGEST_IMAGE_DIR", os.path.join(BASE_DIR, "Ingest"))
+INGEST_SPILL_PATH = os.getenv("INGEST_SPILL_PATH", os.path.join(BASE_DIR, "ingest_spill.jsonl"))
+
+INGEST_QUEUE_MAX = 20000  # Records waiting for the writer before clients get 503
+INGEST_BATCH_SIZE = 1000  # Max rows per INSERT transaction
+INGEST_FLUSH_INTERVAL = 0.2  # Seconds the writer waits to fill a batch
+INGEST_MAX_BODY = 8 * 1024 * 1024  # Bytes per request
+INGEST_WRITE_RETRIES = 3  # Insert attempts per batch before it is spilled to disk
+INGEST_RETRY_DELAY = 0.5  # Seconds before the first retry, doubling each time
+NODE_RATE_LIMIT = float(os.getenv("NODE_RATE_LIMIT", "200"))  # Records/second per node, 0 = unlimited
+NODE_RATE_BURST = 2000
+INGEST_MAX_RECORDS = NODE_RATE_BURST  # Records per request; a larger batch could never be admitted (413)
+FORWARD_INTERVAL = float(os.getenv("FORWARD_INTERVAL", "30"))  # Seconds between upstream pushes
+KEEPALIVE_TIMEOUT = 30  # Seconds an idle connection is kept open
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    node_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    growth_stage TEXT,
+    height_cm REAL,
+    leaf_count INTEGER,
+    leaf_area_cm2 REAL,
+    payload TEXT,
+    received_at REAL NOT NULL,
+    forwarded INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (node_id, timestamp)
+);
+CREATE INDEX IF NOT EXISTS idx_detections_forwarded ON detections (forwarded, id);
+CREATE TABLE IF NOT EXISTS images (
+    node_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (node_id, timestamp, kind)
+);
+"""
+
+HTTP_REASONS = {
+    200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    411: "Length Required", 413: "Payload Too Large", 429: "Too Many Requests", 503: "Service Unavailable",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class NodeStats:
+    """Per-node accounting plus a token bucket for rate limiting."""
+
+    def __init__(self, rate=NODE_RATE_LIMIT, burst=NODE_RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.requests = 0
+        self.records = 0
+        self.images = 0
+        self.bytes = 0
+        self.rejected = 0
+        self.last_seen = None
+
+    # Returns 0 if the node may send `count` records now, else seconds to wait
+    def admit(self, count):
+        if not self.rate:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if count <= self.tokens:
+            self.tokens -= count
+            return 0.0
+        return (count - self.tokens) / self.rate
+
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "records": self.records,
+            "images": self.images,
+            "bytes": self.bytes,
+            "rejected": self.rejected,
+            "last_seen": self.last_seen,
+        }
+
+
+class IngestServer:
+    def __init__(self, db_path=INGEST_DB_PATH, image_dir=INGEST_IMAGE_DIR, upstream=None,
+                 queue_max=INGEST_QUEUE_MAX, batch_size=INGEST_BATCH_SIZE, forward_interval=FORWARD_INTERVAL,
+                 node_rate=NODE_RATE_LIMIT, spill_path=INGEST_SPILL_PATH):
+        self.db_path = db_path
+        self.image_dir = image_dir
+        self.spill_path = spill_path
+        self.upstream = upstream
+        self.queue_max = queue_max
+        self.batch_size = batch_size
+        self.forward_interval = forward_interval
+        self.node_rate = node_rate
+        self.nodes = {}
+        self.totals = {"inserted": 0, "duplicates": 0, "forwarded": 0, "backpressure": 0, "connections": 0,
+                       "write_retries": 0, "spilled": 0, "dropped": 0}
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+
+        # Every SQLite call runs on this one thread, so transactions never interleave
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-db")
+        self.queue = None
+        self._server = None
+        self._tasks = []
+
+    async def _db_call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._db_executor, fn, *args)
+
+    def node(self, node_id):
+        if node_id not in self.nodes:
+            self.nodes[node_id] = NodeStats(self.node_rate)
+        return self.nodes[node_id]
+
+    # ---- HTTP plumbing -------------------------------------------------------------
+
+    async def _read_request(self, reader):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            return None
+        except asyncio.LimitOverrunError:
+            raise HttpError(400, "header too large")
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            raise HttpError(400, "malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        body = b""
+        if method == "POST":
+            if "content-length" not in headers:
+                raise HttpError(411, "Content-Length required")
+            length = headers["content-length"]
+            if not length.isdigit():
+                raise HttpError(400, "invalid Content-Length")
+            length = int(length)
+            if length > INGEST_MAX_BODY:
+                raise HttpError(413, "body too large")
+            body = await reader.readexactly(length)
+        return method, target, version, headers, body
+
+    @staticmethod
+    def _write_response(writer, status, payload, keep_alive, extra_headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        headers = [
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'OK')}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        for name, value in (extra_headers or {}).items():
+            headers.append(f"{name}: {value}")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+
+    async def _handle_connection(self, reader, writer):
+        self.totals["connections"] += 1
+        try:
+            while True:
+                keep_alive = True
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, target, version, headers, body = request
+                    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                    status, payload, extra = await self._route(method, target, headers, body)
+                except HttpError as e:
+                    status, payload, extra = e.status, {"error": str(e)}, e.headers
+                    if e.status in (400, 411, 413):
+                        keep_alive = False  # Request framing is unreliable; drop the connection
+                except (ValueError, KeyError, TypeError) as e:
+                    status, payload, extra = 400, {"error": f"bad request: {e}"}, {}
+                self._write_response(writer, status, payload, keep_alive, extra)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, target, headers, body):
+        url = urlsplit(target)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/v1/detections":
+            if method != "POST":
+                raise HttpError(405, "POST only")
+            return await self._ingest_detections(body)
+        if url.path == "/v1/images":
+            if method != "POST":
+                raise HttpError(405, "POST only")
+            return await self._ingest_image(query, body)
+        if url.path == "/v1/stats" and method == "GET":
+            return 200, self.stats(), {}
+        if url.path == "/healthz" and method == "GET":
+            return 200, {"status": "ok", "queued": self.queue.qsize()}, {}
+        raise HttpError(404, f"no route for {url.path}")
+
+    # ---- Ingest endpoints ----------------------------------------------------------
+
+    def _check_admission(self, node_id, count, nbytes):
+        stats = self.node(node_id)
+        stats.requests += 1
+        stats.bytes += nbytes
+        stats.last_seen = time.time()
+
+        if self.queue.qsize() + count > self.queue_max:
+            stats.rejected += count
+            self.totals["backpressure"] += 1
+            raise HttpError(503, "ingest queue full", {"Retry-After": 1})
+        wait = stats.admit(count)
+        if wait:
+            stats.rejected += count
+            raise HttpError(429, "node rate limit exceeded", {"Retry-After": max(1, round(wait))})
+        return stats
+
+    async def _ingest_detections(self, body):
+        data = json.loads(body)
+        node_id = str(data["node_id"])
+        records = data["records"]
+        if not isinstance(records, list):
+            raise HttpError(400, "records must be a list")
+        if len(records) > INGEST_MAX_RECORDS:
+            # The token bucket never holds more than the burst, so retrying this batch would never succeed
+            raise HttpError(413, f"batch of {len(records)} records exceeds the limit of {INGEST_MAX_RECORDS}",
+                            {"X-Max-Batch-Records": INGEST_MAX_RECORDS})
+
+        # Build every row first: one bad record rejects the batch before any of it is queued
+        now = time.time()
+        rows = []
+        for index, record in enumerate(records):
+            if not isinstance(record, dict) or record.get("timestamp") in (None, ""):
+                raise HttpError(400, f"record {index} must be an object with a timestamp")
+            rows.append((
+                node_id,
+                str(record["timestamp"]),
+                record.get("growth_stage"),
+                record.get("height_cm"),
+                record.get("leaf_count"),
+                record.get("leaf_area_cm2"),
+                json.dumps(record),
+                now,
+            ))
+
+        stats = self._check_admission(node_id, len(rows), len(body))
+        for row in rows:
+            self.queue.put_nowait(row)
+        stats.records += len(rows)
+        return 202, {"accepted": len(records)}, {}
+
+    async def _ingest_image(self, query, body):
+        node_id, timestamp, kind = query["node_id"], query["timestamp"], query.get("kind", "raw")
+        for value in (node_id, timestamp, kind):
+            if not value or "/" in value or value.startswith("."):
+                raise HttpError(400, "invalid node_id, timestamp or kind")
+        stats = self._check_admission(node_id, 1, len(body))
+
+        directory = os.path.join(self.image_dir, node_id)
+        path = os.path.join(directory, f"{timestamp}_{kind}.jpg")
+
+        def store_file():
+            os.makedirs(directory, exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(body)
+
+        def store_row():
+            with self.db:
+                self.db.execute("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?)",
+                                (node_id, timestamp, kind, path, len(body)))
+
+        await asyncio.to_thread(store_file)
+        await self._db_call(store_row)
+        stats.images += 1
+        return 202, {"stored": path}, {}
+
+    # ---- Background tasks ----------------------------------------------------------
+
+    def _insert_rows(self, rows):
+        before = self.db.total_changes
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO detections "
+                "(node_id, timestamp, growth_stage, height_cm, leaf_count, leaf_area_cm2, payload, received_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return self.db.total_changes - before
+
+    async def _writer(self):
+        while True:
+            rows = [await self.queue.get()]
+            deadline = time.monotonic() + INGEST_FLUSH_INTERVAL
+            while len(rows) < self.batch_size:
+                try:
+                    rows.append(self.queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    if time.monotonic() >= deadline:
+                        break
+                    await asyncio.sleep(0.01)
+            for attempt in range(INGEST_WRITE_RETRIES):
+                try:
+                    inserted = await self._db_call(self._insert_rows, rows)
+                except sqlite3.Error as e:
+                    print(f"Error inserting {len(rows)} detections (attempt {attempt + 1}): {e}")
+                    if attempt + 1 < INGEST_WRITE_RETRIES:
+                        self.totals["write_retries"] += 1
+                        await asyncio.sleep(INGEST_RETRY_DELAY * 2 ** attempt)
+                    continue
+                self.totals["inserted"] += inserted
+                self.totals["duplicates"] += len(rows) - inserted
+                break
+            else:
+                await asyncio.to_thread(self._spill, rows)
+
+    # Keep rows the database would not take; _load_spill() inserts them at the next start
+    def _spill(self, rows):
+        try:
+            with open(self.spill_path, "a") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            self.totals["dropped"] += len(rows)
+            print(f"Error spilling {len(rows)} detections, dropped: {e}")
+            return
+        self.totals["spilled"] += len(rows)
+        print(f"Spilled {len(rows)} detections to {self.spill_path}")
+
+    # Insert rows spilled by an earlier run; the file stays until they are committed
+    def _load_spill(self):
+        if not os.path.exists(self.spill_path):
+            return 0
+        with open(self.spill_path, "r") as f:
+            rows = []
+            for line in f:
+                try:
+                    rows.append(tuple(json.loads(line)))
+                except ValueError:
+                    break  # Torn final line
+        try:
+            inserted = self._insert_rows(rows)
+        except sqlite3.Error as e:
+            print(f"Error loading {len(rows)} spilled detections, kept in {self.spill_path}: {e}")
+            return 0
+        os.remove(self.spill_path)
+        self.totals["inserted"] += inserted
+        self.totals["duplicates"] += len(rows) - inserted
+        print(f"Loaded {len(rows)} spilled detections")
+        return len(rows)
+
+    # Latest record and counts per node since the last push
+    def _consolidate(self):
+        rows = self.db.execute(
+            "SELECT id, node_id, timestamp, growth_stage, height_cm, leaf_count, leaf_area_cm2 "
+            "FROM detections WHERE forwarded = 0 ORDER BY id LIMIT 50000"
+        ).fetchall()
+        nodes = {}
+        for row_id, node_id, timestamp, stage, height, leaf_count, leaf_area in rows:
+            node = nodes.setdefault(node_id, {"records": 0, "stages": {}})
+            node["records"] += 1
+            node["stages"][stage or "Unknown"] = node["stages"].get(stage or "Unknown", 0) + 1
+            node["latest"] = {
+                "timestamp": timestamp,
+                "growth_stage": stage,
+                "height_cm": height,
+                "leaf_count": leaf_count,
+                "leaf_area_cm2": leaf_area,
+            }
+        last_id = rows[-1][0] if rows else None
+        return nodes, last_id
+
+    def _mark_forwarded(self, last_id):
+        with self.db:
+            self.db.execute("UPDATE detections SET forwarded = 1 WHERE forwarded = 0 AND id <= ?", (last_id,))
+
+    async def _forwarder(self):
+        while True:
+            await asyncio.sleep(self.forward_interval)
+            if self.upstream is None:
+                continue
+            nodes, last_id = await self._db_call(self._consolidate)
+            if not nodes:
+                continue
+            try:
+                await asyncio.to_thread(self.upstream, nodes)
+            except Exception as e:
+                print(f"Error forwarding upstream, will retry: {e}")
+                continue
+            await self._db_call(self._mark_forwarded, last_id)
+            self.totals["forwarded"] += sum(node["records"] for node in nodes.values())
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize() if self.queue else 0,
+            "totals": dict(self.totals),
+            "nodes": {node_id: stats.to_dict() for node_id, stats in self.nodes.items()},
+        }
+
+    async def start(self, host=INGEST_HOST, port=INGEST_PORT):
+        self.queue = asyncio.Queue()
+        await self._db_call(self._load_spill)
+        self._tasks = [asyncio.create_task(self._writer()), asyncio.create_task(self._forwarder())]
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        print(f"Ingest server listening on http://{host}:{port}")
+        return self._server
+
+    async def serve_forever(self, host=INGEST_HOST, port=INGEST_PORT):
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+
+# Function to build an upstream forwarder that writes one consolidated update per push
+def firebase_forwarder(firebase, root="greenhouse"):
+    def forward(nodes):
+        update = {}
+        for node_id, node in nodes.items():
+            update[f"{node_id}/latest"] = node["latest"]
+            update[f"{node_id}/last_batch"] = {"records": node["records"], "stages": node["stages"]}
+        firebase.reference(root).update(update)
+    return forward
+
+
+class IngestClient:
+    """Edge-side client: one persistent keep-alive connection, retries on 429/503."""
+
+    def __init__(self, node_id, host=INGEST_HOST, port=INGEST_PORT, timeout=10, max_retries=5):
+        self.node_id = node_id
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._conn = None
+
+    def _request(self, path, body, content_type):
+        for attempt in range(self.max_retries + 1):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._conn.request("POST", path, body=body, headers={"Content-Type": content_type})
+                response = self._conn.getresponse()
+                payload = json.loads(response.read() or b"{}")
+            except (ConnectionError, http.client.HTTPException, OSError):
+                self.close()
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(min(2 ** attempt * 0.1, 5))
+                continue
+            if response.getheader("Connection", "").lower() == "close":
+                self.close()
+            if response.status in (429, 503) and attempt < self.max_retries:
+                time.sleep(float(response.getheader("Retry-After", "1")))
+                continue
+            return response.status, payload
+        return response.status, payload
+
+    # A backlog larger than the server's per-request limit goes up in several batches
+    def post_detections(self, records, max_records=INGEST_MAX_RECORDS):
+        accepted = 0
+        for start in range(0, max(len(records), 1), max_records):
+            body = json.dumps({"node_id": self.node_id, "records": records[start:start + max_records]}).encode("utf-8")
+            status, payload = self._request("/v1/detections", body, "application/json")
+            if status != 202:
+                return status, payload
+            accepted += payload.get("accepted", 0)
+        return 202, {"accepted": accepted}
+
+    def post_image(self, image_path, timestamp, kind="raw"):
+        with open(image_path, "rb") as f:
+            body = f.read()
+        path = f"/v1/images?node_id={self.node_id}&timestamp={timestamp}&kind={kind}"
+        return self._request(path, body, "image/jpeg")
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+# Function to load-test a local server: several nodes posting batches in parallel
+def run_load_test(nodes=10, batches=100, batch_size=20, host=INGEST_HOST, port=INGEST_PORT):
+    results = {"records": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def node_worker(node_index):
+        client = IngestClient(f"node{node_index:03d}", host, port)
+        for batch in range(batches):
+            records = [{
+                "timestamp": f"{batch:06d}_{i:04d}",
+                "growth_stage": "Vegetative",
+                "height_cm": 10.0,
+                "leaf_count": 6,
+                "leaf_area_cm2": 40.0,
+            } for i in range(batch_size)]
+            status, _ = client.post_detections(records)
+            with lock:
+                if status == 202:
+                    results["records"] += batch_size
+                else:
+                    results["errors"] += 1
+        client.close()
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=node_worker, args=(i,)) for i in range(nodes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+    print(f"Load test: {results['records']} records from {nodes} nodes in {elapsed:.2f}s "
+          f"({results['records'] / elapsed:.0f} records/s), {results['errors']} failed batches")
+    return results
+
+
+def main(argv):
+    # The shared client (firebase_client.py) also covers USE_FIREBASE_EMULATOR=1
+    from firebase_client import get_client
+    try:
+        upstream = firebase_forwarder(get_client())
+    except ValueError as e:
+        upstream = None
+        print(f"No upstream configured ({e}); records are kept locally only")
+
+    if argv and argv[0] == "loadtest":
+        nodes = int(argv[1]) if len(argv) > 1 else 10
+        batches = int(argv[2]) if len(argv) > 2 else 100
+        server = IngestServer(upstream=upstream, node_rate=0)
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(server.start())
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        run_load_test(nodes, batches)
+        time.sleep(INGEST_FLUSH_INTERVAL * 2)
+        print(json.dumps(server.stats()["totals"]))
+        return
+
+    try:
+        asyncio.run(IngestServer(upstream=upstream).serve_forever())
+    except KeyboardInterrupt:
+        print("Stopping ingest server")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,73 @@
+import os
+import numpy as np
+import cv2
+
+# Green-canopy segmentation: one vegetation mask per frame (Excess Green or HSV range,
+# computed on uint8 buffers), plus its integral image so the canopy pixel count inside
+# any detection box is four lookups. Leaf area is the calibrated ground area of the box
+# (camera_calibration.py) times the fraction of the box that is canopy, and leaf contours
+# come from the same mask instead of a separate grayscale threshold.
+
+SEGMENTATION_METHOD = os.getenv("SEGMENTATION_METHOD", "exg")  # "exg" or "hsv"
+EXG_THRESHOLD = 10  # On ExG/2 = G - (R + B) / 2, in grey levels
+# Plain ExG also passes cyan/blue surfaces (high G and B, low R); G must beat each channel too
+GREEN_MARGIN = 8
+HSV_LOWER = (30, 40, 30)  # OpenCV hue is 0-179; ~60-170° covers yellow-green to blue-green
+HSV_UPPER = (85, 255, 255)
+OPEN_KERNEL = np.ones((3, 3), np.uint8)  # Removes isolated green specks
+MIN_LEAF_AREA = 500  # Pixels; smaller blobs are not counted as leaves
+
+# Colour transform (rows of B, G, R weights) to [ExG/2, G - B, G - R]: saturating uint8, no float image
+EXG_TRANSFORM = np.array([[-0.5, 1.0, -0.5], [-1.0, 1.0, 0.0], [0.0, 1.0, -1.0]], dtype=np.float32)
+
+
+# Function to build a 0/255 vegetation mask from a BGR frame
+def green_mask(frame, method=SEGMENTATION_METHOD):
+    if method == "exg":
+        indices = cv2.transform(frame, EXG_TRANSFORM)  # Negative values saturate to 0
+        mask = cv2.inRange(indices, (EXG_THRESHOLD + 1, GREEN_MARGIN + 1, GREEN_MARGIN + 1), (255, 255, 255))
+    elif method == "hsv":
+        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(hsv, HSV_LOWER, HSV_UPPER)
+    else:
+        raise ValueError(f"ERROR: unknown SEGMENTATION_METHOD '{method}'")
+    return cv2.morphologyEx(mask, cv2.MORPH_OPEN, OPEN_KERNEL)
+
+
+class CanopyMask:
+    """Vegetation mask of one frame with O(1) per-box canopy queries."""
+
+    def __init__(self, frame, method=SEGMENTATION_METHOD):
+        self.mask = green_mask(frame, method)
+        self.height, self.width = self.mask.shape
+        # int32 sums of 0/255 values; 255 x 4096 x 2048 still fits
+        self.integral = cv2.integral(self.mask, sdepth=cv2.CV_32S)
+
+    def _clip_box(self, bbox):
+        x1 = min(max(int(bbox[0]), 0), self.width)
+        y1 = min(max(int(bbox[1]), 0), self.height)
+        x2 = min(max(int(bbox[2]), x1), self.width)
+        y2 = min(max(int(bbox[3]), y1), self.height)
+        return x1, y1, x2, y2
+
+    # Number of canopy pixels inside a box
+    def box_pixels(self, bbox):
+        x1, y1, x2, y2 = self._clip_box(bbox)
+        table = self.integral
+        return int(table[y2, x2] - table[y1, x2] - table[y2, x1] + table[y1, x1]) // 255
+
+    def box_fraction(self, bbox):
+        x1, y1, x2, y2 = self._clip_box(bbox)
+        total = (x2 - x1) * (y2 - y1)
+        return self.box_pixels(bbox) / total if total else 0.0
+
+    # Canopy area in cm²: the box's calibrated ground area scaled by its canopy fraction
+    def box_area_cm2(self, bbox, view):
+        return view.box_area_cm2(bbox) * self.box_fraction(bbox)
+
+    def canopy_fraction(self):
+        return float(self.integral[-1, -1]) / 255 / (self.width * self.height)
+
+    def leaf_contours(self, min_area=MIN_LEAF_AREA):
+        contours, _ = cv2.findContours(self.mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        return [c for c in contours if cv2.contourArea(c) > min_area]
@@ -0,0 +1,224 @@
+import math
+from collections import Counter
+
+# Tracking Constants
+TRACK_IOU_THRESHOLD = 0.3  # Minimum IoU to treat two boxes as the same plant
+TRACK_MAX_DISTANCE = 80  # Pixels, centroid fallback when boxes barely overlap
+TRACK_GRID_SIZE = 128  # Pixels per spatial-index cell (keep >= TRACK_MAX_DISTANCE)
+TRACK_MAX_MISSES = 5  # Captures a plant may go undetected before it is dropped
+EMA_ALPHA = 0.3  # Weight of the newest measurement in the smoothed state
+STAGE_CONFIRM_UPDATES = 2  # Consecutive updates a new stage must hold before it is reported
+
+
+# Function to compute intersection-over-union of two (x1, y1, x2, y2) boxes
+def box_iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(area_a + area_b - inter)
+
+
+def box_centroid(box):
+    return ((box[0] + box[2]) / 2.0, (box[1] + box[3]) / 2.0)
+
+
+# Exponential moving average; the first sample initialises the filter
+def ema(previous, value, alpha=EMA_ALPHA):
+    if previous is None or value is None:
+        return value if previous is None else previous
+    return previous + alpha * (value - previous)
+
+
+class PlantTrack:
+    """Rolling, smoothed state for one plant followed across captures."""
+
+    def __init__(self, track_id, bbox):
+        self.track_id = track_id
+        self.bbox = tuple(int(v) for v in bbox)
+        self.height = None
+        self.leaf_area = None
+        self.leaf_count = None
+        self.stage = None
+        self.hits = 0
+        self.misses = 0
+        self._candidate_stage = None
+        self._candidate_updates = 0
+
+    @property
+    def centroid(self):
+        return box_centroid(self.bbox)
+
+    def observe(self, bbox, height, leaf_area, leaf_count=None, alpha=EMA_ALPHA):
+        self.bbox = tuple(int(v) for v in bbox)
+        self.height = ema(self.height, height, alpha)
+        self.leaf_area = ema(self.leaf_area, leaf_area, alpha)
+        self.leaf_count = ema(self.leaf_count, leaf_count, alpha)
+        self.hits += 1
+        self.misses = 0
+
+    # Hysteresis: only switch the reported stage once the new one has held for a few updates
+    def propose_stage(self, stage, confirm_updates=STAGE_CONFIRM_UPDATES):
+        if self.stage is None or stage == self.stage:
+            self.stage = stage
+            self._candidate_stage = None
+            self._candidate_updates = 0
+            return
+        if stage == self._candidate_stage:
+            self._candidate_updates += 1
+        else:
+            self._candidate_stage = stage
+            self._candidate_updates = 1
+        if self._candidate_updates >= confirm_updates:
+            self.stage = stage
+            self._candidate_stage = None
+            self._candidate_updates = 0
+
+    def to_record(self):
+        return {
+            "bbox": list(self.bbox),
+            "height_cm": round(self.height, 2) if self.height is not None else None,
+            "leaf_area_cm2": round(self.leaf_area, 2) if self.leaf_area is not None else None,
+            "growth_stage": self.stage,
+            "hits": self.hits,
+        }
+
+
+class PlantTracker:
+    """Links detections across successive captures into plant identities.
+
+    classify(height, leaf_count, leaf_area) is called only for plants observed in the
+    current capture, on their filtered state, so the stage is updated incrementally
+    instead of being recomputed from the full history. If classify_many(heights,
+    leaf_counts, leaf_areas) is given, all of a capture's plants are classified in one call.
+    """
+
+    def __init__(self, classify=None, classify_many=None, iou_threshold=TRACK_IOU_THRESHOLD,
+                 max_distance=TRACK_MAX_DISTANCE, grid_size=TRACK_GRID_SIZE, max_misses=TRACK_MAX_MISSES,
+                 alpha=EMA_ALPHA, confirm_updates=STAGE_CONFIRM_UPDATES):
+        if classify is None and classify_many is None:
+            raise ValueError("ERROR: PlantTracker needs classify or classify_many")
+        self.classify = classify
+        self.classify_many = classify_many
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.grid_size = max(grid_size, max_distance)
+        self.max_misses = max_misses
+        self.alpha = alpha
+        self.confirm_updates = confirm_updates
+        self.tracks = {}
+        self._next_id = 1
+
+    def _cell(self, point):
+        return (int(point[0] // self.grid_size), int(point[1] // self.grid_size))
+
+    # Spatial index of live tracks: grid cell -> track ids
+    def _build_grid(self):
+        grid = {}
+        for track_id, track in self.tracks.items():
+            grid.setdefault(self._cell(track.centroid), []).append(track_id)
+        return grid
+
+    def _candidates(self, grid, point):
+        cx, cy = self._cell(point)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                yield from grid.get((cx + dx, cy + dy), ())
+
+    def _match(self, detections):
+        grid = self._build_grid()
+        pairs = []
+        for det_index, detection in enumerate(detections):
+            bbox = detection[0]
+            centroid = box_centroid(bbox)
+            for track_id in self._candidates(grid, centroid):
+                track = self.tracks[track_id]
+                iou = box_iou(bbox, track.bbox)
+                tcx, tcy = track.centroid
+                distance = math.hypot(centroid[0] - tcx, centroid[1] - tcy)
+                if iou >= self.iou_threshold or distance <= self.max_distance:
+                    # Prefer real overlap, then higher IoU, then closer centroids
+                    pairs.append(((iou >= self.iou_threshold, iou, -distance), det_index, track_id))
+
+        # Greedy assignment, best pairs first
+        pairs.sort(key=lambda pair: pair[0], reverse=True)
+        assigned_dets, assigned_tracks, matches = set(), set(), {}
+        for _, det_index, track_id in pairs:
+            if det_index in assigned_dets or track_id in assigned_tracks:
+                continue
+            matches[det_index] = track_id
+            assigned_dets.add(det_index)
+            assigned_tracks.add(track_id)
+        return matches
+
+    def update(self, detections):
+        """Feed one capture's detections.
+
+        detections: iterable of (bbox, height_cm, leaf_area_cm2[, leaf_count]).
+        Returns the PlantTrack for each detection, in the same order.
+        """
+        detections = [tuple(d) for d in detections]
+        matches = self._match(detections)
+
+        updated = []
+        for det_index, detection in enumerate(detections):
+            bbox, height, leaf_area = detection[:3]
+            leaf_count = detection[3] if len(detection) > 3 else None
+
+            track_id = matches.get(det_index)
+            if track_id is None:
+                track_id = self._next_id
+                self._next_id += 1
+                self.tracks[track_id] = PlantTrack(track_id, bbox)
+            track = self.tracks[track_id]
+            track.observe(bbox, height, leaf_area, leaf_count, self.alpha)
+            updated.append(track)
+
+        # Age out plants that were not seen this capture
+        seen = {track.track_id for track in updated}
+        for track_id in list(self.tracks):
+            if track_id not in seen:
+                self.tracks[track_id].misses += 1
+                if self.tracks[track_id].misses > self.max_misses:
+                    del self.tracks[track_id]
+
+        self._classify(updated)
+        return updated
+
+    def _classify(self, tracks):
+        if not tracks:
+            return
+        heights = [track.height for track in tracks]
+        leaf_counts = [round(track.leaf_count) if track.leaf_count is not None else 0 for track in tracks]
+        leaf_areas = [track.leaf_area for track in tracks]
+
+        if self.classify_many is not None:
+            stages = self.classify_many(heights, leaf_counts, leaf_areas)
+        else:
+            stages = [self.classify(*values) for values in zip(heights, leaf_counts, leaf_areas)]
+
+        for track, stage in zip(tracks, stages):
+            track.propose_stage(str(stage), self.confirm_updates)
+
+    def visible_tracks(self):
+        return [track for track in self.tracks.values() if track.misses == 0]
+
+    # Frame-level view of the smoothed per-plant state
+    def summary(self):
+        visible = self.visible_tracks()
+        if not visible:
+            return {"plant_count": 0, "height_cm": 0, "leaf_area_cm2": 0, "growth_stage": None}
+
+        stages = Counter(track.stage for track in visible)
+        return {
+            "plant_count": len(visible),
+            "height_cm": round(sum(track.height for track in visible) / len(visible), 2),
+            "leaf_area_cm2": round(sum(track.leaf_area for track in visible), 2),
+            "growth_stage": stages.most_common(1)[0][0],
+        }
+
+    def plant_records(self):
+        return {str(track.track_id): track.to_record() for track in self.visible_tracks()}
@@ -0,0 +1,204 @@
+import os
+import re
+import time
+from datetime import datetime, timedelta
+import cv2
+
+# Replay source: image directories, video files or an RTSP loopback played back through the
+# same read() / isOpened() / release() interface as the live cameras, so the whole pipeline
+# can be soak-tested on a dev machine.
+#
+# Every frame carries a deterministic timestamp (from the file name, the video position or
+# REPLAY_START + index * interval), and the source owns the clock: at speed 10 a recorded
+# minute passes in 6 seconds, at speed 0 frames are delivered as fast as they are read.
+# Image directories are treated as capture sequences (one image per read); paced video
+# skips ahead to the frame due on the replay clock, the way a live camera would.
+# Capture keys have one-second resolution, so video is decimated to at most one frame per
+# recorded second (the first frame of each second); two frames never share a key.
+
+CAPTURE_SOURCE = os.getenv("CAPTURE_SOURCE", "")  # Directory, video file or rtsp:// URL; empty = live camera
+REPLAY_SPEED = float(os.getenv("REPLAY_SPEED", "1"))  # 1 = recorded speed, 10 = 10x, 0 = max speed
+REPLAY_LOOP = os.getenv("REPLAY_LOOP") == "1"
+REPLAY_START = os.getenv("REPLAY_START", "2025-01-01T00:00:00")  # Clock start when names carry no time
+REPLAY_INTERVAL = float(os.getenv("REPLAY_INTERVAL", "60"))  # Seconds between undated images
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+# Annotated outputs that may sit next to the raw frames; they are not captures
+EXCLUDED_SUFFIXES = ("_contours",)
+EXCLUDED_PREFIXES = ("detected_", "retrieved_")
+# 20250315_181620 (Captured/Raw) and 2025-03-15_18-16-20 (Growth_Analysis) anywhere in a file name
+TIMESTAMP_PATTERNS = [
+    (re.compile(r"(\d{8}_\d{6})"), "%Y%m%d_%H%M%S"),
+    (re.compile(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})"), "%Y-%m-%d_%H-%M-%S"),
+]
+
+
+def timestamp_from_name(name):
+    for pattern, fmt in TIMESTAMP_PATTERNS:
+        match = pattern.search(name)
+        if match:
+            try:
+                return datetime.strptime(match.group(1), fmt)
+            except ValueError:
+                continue
+    return None
+
+
+def is_capture_file(name):
+    stem, extension = os.path.splitext(name.lower())
+    return (extension in IMAGE_EXTENSIONS and not stem.endswith(EXCLUDED_SUFFIXES)
+            and not stem.startswith(EXCLUDED_PREFIXES))
+
+
+class ReplaySource:
+    """cv2.VideoCapture-like frame source that replays recorded material on its own clock."""
+
+    def __init__(self, source, speed=REPLAY_SPEED, loop=REPLAY_LOOP, start=REPLAY_START, interval=REPLAY_INTERVAL):
+        self.source = source
+        self.speed = max(0.0, speed)
+        self.loop = loop
+        self.start = datetime.fromisoformat(start) if isinstance(start, str) else start
+        self.interval = interval
+        self.timestamp = None  # Recorded time of the last frame returned by read()
+        self.path = None  # Source file of the last frame (image directories only)
+        self.frames_read = 0
+        self._wall_start = None
+        self._first_timestamp = None
+        self._pass = 0
+        self._video = None
+        self._files = None
+        self._position = 0
+        self._last_file_timestamp = None
+        self._last_second = None
+
+        if os.path.isdir(source):
+            self._files = sorted(os.path.join(source, name) for name in os.listdir(source) if is_capture_file(name))
+            if not self._files:
+                raise ValueError(f"ERROR: no images found in {source}")
+        else:
+            self._open_video()
+
+    @property
+    def is_stream(self):
+        return "://" in self.source
+
+    def _open_video(self):
+        self._video = cv2.VideoCapture(self.source)
+        if not self._video.isOpened():
+            raise ValueError(f"ERROR: could not open replay source {self.source}")
+        self._fps = self._video.get(cv2.CAP_PROP_FPS) or 0
+        self._fps = self._fps if 0 < self._fps < 1000 else 30.0
+        self._position = 0
+
+    def isOpened(self):
+        return self._files is not None or (self._video is not None and self._video.isOpened())
+
+    # Compatibility with callers that configure a cv2.VideoCapture
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        return self._video.get(prop) if self._video is not None else 0
+
+    def _next_file(self):
+        if self._position >= len(self._files):
+            if not self.loop:
+                return None, None
+            self._position = 0
+            self._pass += 1
+        path = self._files[self._position]
+        index = self._position
+        self._position += 1
+        frame = cv2.imread(path)
+        if frame is None:
+            print(f"Skipping unreadable replay image {path}")
+            return self._next_file()
+        # Undated images follow the previous image by one interval
+        timestamp = timestamp_from_name(os.path.basename(path))
+        if timestamp is None:
+            previous = self._last_file_timestamp if index else None
+            timestamp = previous + timedelta(seconds=self.interval) if previous else self.start
+        self._last_file_timestamp = timestamp
+        self.path = path
+        return frame, timestamp
+
+    def _next_video_frame(self):
+        # Like a live camera, a paced video read returns the frame for "now" on the replay clock
+        if self.speed > 0 and self._wall_start is not None and not self.is_stream:
+            elapsed = (time.monotonic() - self._wall_start) * self.speed
+            if self._pass:
+                elapsed -= self._pass * (self._span() + timedelta(seconds=self.interval)).total_seconds()
+            due_index = int(elapsed * self._fps)
+            while self._position < due_index and self._video.grab():
+                self._position += 1
+        # Skip (without decoding) the rest of the second already delivered
+        while self._last_second is not None and int(self._position / self._fps) == self._last_second \
+                and self._video.grab():
+            self._position += 1
+        ok, frame = self._video.read()
+        if not ok:
+            if not self.loop or self.is_stream:
+                return None, None
+            self._video.release()
+            self._open_video()
+            self._pass += 1
+            self._last_second = None
+            ok, frame = self._video.read()
+            if not ok:
+                return None, None
+        # Frame index / fps rather than wall time, so the same file always yields the same stamps
+        second = int(self._position / self._fps)
+        self._position += 1
+        self._last_second = second
+        return frame, self.start + timedelta(seconds=second)
+
+    def read(self):
+        frame, timestamp = self._next_file() if self._files is not None else self._next_video_frame()
+        if frame is None:
+            return False, None
+
+        # Looped passes continue the clock instead of repeating timestamps
+        if self._pass and self._first_timestamp is not None:
+            timestamp += self._pass * (self._span() + timedelta(seconds=self.interval))
+
+        if self._first_timestamp is None:
+            self._first_timestamp = timestamp
+            self._wall_start = time.monotonic()
+        elif self.speed > 0 and not self.is_stream:
+            # Hold the frame until its recorded offset (divided by speed) has elapsed
+            due = self._wall_start + (timestamp - self._first_timestamp).total_seconds() / self.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        self.timestamp = timestamp
+        self.frames_read += 1
+        return True, frame
+
+    def _span(self):
+        if self._files is not None:
+            stamps = [timestamp_from_name(os.path.basename(path)) for path in (self._files[0], self._files[-1])]
+            if all(stamps):
+                return stamps[1] - stamps[0]
+            return timedelta(seconds=(len(self._files) - 1) * self.interval)
+        frame_count = self._video.get(cv2.CAP_PROP_FRAME_COUNT) or self._position
+        return timedelta(seconds=max(0, frame_count - 1) / self._fps)
+
+    # Replay-clock sleep: capture loops call this instead of time.sleep to keep the speed-up
+    def sleep(self, seconds):
+        if self.speed > 0:
+            time.sleep(seconds / self.speed)
+
+    def release(self):
+        if self._video is not None:
+            self._video.release()
+            self._video = None
+        self._files = None
+
+
+# Function to pick the capture source: CAPTURE_SOURCE replay if set, else the given live camera factory
+def open_capture_source(live_factory, source=CAPTURE_SOURCE):
+    if source:
+        print(f"Replaying {source} at {'max' if REPLAY_SPEED <= 0 else f'{REPLAY_SPEED:g}x'} speed")
+        return ReplaySource(source)
+    return live_factory()
@@ -0,0 +1,130 @@
+import os
+import time
+import threading
+import numpy as np
+import cv2
+
+# Runtime configuration for a shared Pi: explicit thread counts, optional per-stage CPU
+# affinity, a model warm-up pass, an upload concurrency limit and a resource governor
+# that backs off capture rate / inference resolution when the CPU runs hot or busy.
+
+CPU_COUNT = os.cpu_count() or 1
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", str(max(1, CPU_COUNT - 1))))  # Leave a core for capture/upload
+CV2_THREADS = int(os.getenv("CV2_THREADS", "1"))
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "2"))
+# e.g. STAGE_AFFINITY="inference=1,2,3;capture=0;upload=0"
+STAGE_AFFINITY = os.getenv("STAGE_AFFINITY", "")
+
+WARMUP_RUNS = 2
+WARMUP_IMGSZ = 640
+
+THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+TEMP_HIGH = 75.0  # °C: step down one level above this (the Pi firmware throttles at 80-85)
+TEMP_LOW = 65.0  # °C: step back up once below this
+LOAD_HIGH = 0.95  # 1-minute load average per core
+LOAD_LOW = 0.6
+GOVERNOR_COOLDOWN = 120  # Seconds a level must be held before stepping back up
+
+# (capture interval multiplier, inference resolution scale) per governor level
+GOVERNOR_LEVELS = [(1.0, 1.0), (1.5, 0.75), (2.0, 0.5)]
+
+# Limits how many uploads run at once so they do not starve inference of cores
+upload_slots = threading.BoundedSemaphore(UPLOAD_CONCURRENCY)
+
+
+# Function to pin library thread pools; call once, before the first inference
+def configure_threads(torch_threads=TORCH_THREADS, cv2_threads=CV2_THREADS):
+    cv2.setNumThreads(cv2_threads)
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # Already fixed once parallel work has started
+    except ImportError:
+        torch_threads = None
+    print(f"Threads: torch={torch_threads}, cv2={cv2_threads}, uploads={UPLOAD_CONCURRENCY}")
+
+
+def parse_affinity(spec=STAGE_AFFINITY):
+    stages = {}
+    for part in filter(None, (p.strip() for p in spec.split(";"))):
+        stage, cores = part.split("=")
+        stages[stage.strip()] = {int(core) for core in cores.split(",") if core.strip()}
+    return stages
+
+
+# Function to pin the calling thread to the cores configured for a stage (Linux only)
+def pin_stage(stage, spec=STAGE_AFFINITY):
+    cores = parse_affinity(spec).get(stage)
+    if not cores or not hasattr(os, "sched_setaffinity"):
+        return False
+    try:
+        os.sched_setaffinity(0, cores)  # pid 0 = calling thread
+    except OSError as e:
+        print(f"Could not pin {stage} to cores {sorted(cores)}: {e}")
+        return False
+    return True
+
+
+# Function to run dummy inferences so the first real frame is not paying for lazy init
+def warm_up(model, imgsz=WARMUP_IMGSZ, runs=WARMUP_RUNS):
+    dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model.predict(dummy, imgsz=imgsz, verbose=False)
+        timings.append(time.perf_counter() - start)
+    print(f"Model warm-up: {', '.join(f'{t * 1000:.0f}ms' for t in timings)}")
+    return timings
+
+
+def read_cpu_temperature(path=THERMAL_ZONE):
+    try:
+        with open(path, "r") as f:
+            return int(f.read().strip()) / 1000.0
+    except (OSError, ValueError):
+        return None
+
+
+def read_load_per_core():
+    try:
+        return os.getloadavg()[0] / CPU_COUNT
+    except OSError:
+        return None
+
+
+class ResourceGovernor:
+    """Steps capture rate and inference resolution down under heat or load, with hysteresis."""
+
+    def __init__(self, levels=GOVERNOR_LEVELS, read_temperature=read_cpu_temperature, read_load=read_load_per_core):
+        self.levels = levels
+        self.level = 0
+        self.read_temperature = read_temperature
+        self.read_load = read_load
+        self._level_since = time.monotonic()
+
+    def update(self):
+        temperature = self.read_temperature()
+        load = self.read_load()
+        hot = (temperature is not None and temperature > TEMP_HIGH) or (load is not None and load > LOAD_HIGH)
+        cool = (temperature is None or temperature < TEMP_LOW) and (load is None or load < LOAD_LOW)
+        now = time.monotonic()
+
+        if hot and self.level < len(self.levels) - 1:
+            self.level += 1
+            self._level_since = now
+            print(f"Governor: level {self.level} (temp={temperature}, load={load})")
+        elif cool and self.level > 0 and now - self._level_since >= GOVERNOR_COOLDOWN:
+            self.level -= 1
+            self._level_since = now
+            print(f"Governor: level {self.level} (temp={temperature}, load={load})")
+        return self.level
+
+    def interval(self, base_interval):
+        return base_interval * self.levels[self.level][0]
+
+    # Inference size scaled for the current level, kept a multiple of the YOLO stride
+    def imgsz(self, base_imgsz=640, stride=32):
+        return max(stride, int(base_imgsz * self.levels[self.level][1]) // stride * stride)
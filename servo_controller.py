@@ -0,0 +1,177 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+# Non-blocking servo / pan-tilt control. Moves run on a worker thread and return a
+# Future, so the camera can be repositioned while the previous frame is analysed.
+
+SERVO_PIN = 18
+PWM_FREQUENCY = 50  # Hz
+SERVO_RANGE = (0, 180)  # Degrees
+SERVO_SPEED = 300.0  # Degrees per second under load (SG90 is ~0.1 s / 60 deg unloaded)
+SETTLE_BASE_SECONDS = 0.15  # Fixed overhead: signal pickup plus damping of the camera mount
+SETTLE_UNKNOWN_SECONDS = 1.0  # First move, when the starting angle is unknown
+
+
+# Function to convert an angle to a 50 Hz duty cycle (same mapping as test_servo.py)
+def angle_to_duty(angle):
+    return 2 + (angle / 18)
+
+
+# Function to estimate how long a move takes to finish and settle
+def settle_time(from_angle, to_angle, speed=SERVO_SPEED, base=SETTLE_BASE_SECONDS):
+    if from_angle is None:
+        return SETTLE_UNKNOWN_SECONDS
+    return base + abs(to_angle - from_angle) / speed
+
+
+class MockPWM:
+    def __init__(self, gpio, pin, frequency):
+        self.gpio = gpio
+        self.pin = pin
+        self.frequency = frequency
+        self.duty_cycle = None
+
+    def start(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+        self.gpio.calls.append(("start", self.pin, duty_cycle))
+
+    def ChangeDutyCycle(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+        self.gpio.calls.append(("duty", self.pin, duty_cycle))
+
+    def stop(self):
+        self.gpio.calls.append(("stop", self.pin))
+
+
+class MockGPIO:
+    """Stand-in for RPi.GPIO for off-device runs; records every call."""
+
+    BCM = "BCM"
+    BOARD = "BOARD"
+    OUT = "OUT"
+    IN = "IN"
+
+    def __init__(self):
+        self.calls = []
+
+    def setwarnings(self, flag):
+        self.calls.append(("setwarnings", flag))
+
+    def setmode(self, mode):
+        self.calls.append(("setmode", mode))
+
+    def setup(self, pin, mode):
+        self.calls.append(("setup", pin, mode))
+
+    def PWM(self, pin, frequency):
+        return MockPWM(self, pin, frequency)
+
+    def cleanup(self):
+        self.calls.append(("cleanup",))
+
+
+# Function to pick the GPIO backend: real RPi.GPIO on the Pi, the mock elsewhere
+def load_gpio(use_mock=False):
+    if not use_mock:
+        try:
+            import RPi.GPIO as GPIO
+            return GPIO
+        except (ImportError, RuntimeError):
+            print("RPi.GPIO not available, using mock GPIO backend")
+    return MockGPIO()
+
+
+class ServoController:
+    def __init__(self, pin=SERVO_PIN, gpio=None, speed=SERVO_SPEED, settle_base=SETTLE_BASE_SECONDS,
+                 sleep=time.sleep):
+        self.pin = pin
+        self.gpio = gpio if gpio is not None else load_gpio()
+        self.speed = speed
+        self.settle_base = settle_base
+        self.angle = None  # Unknown until the first move completes
+        self._sleep = sleep
+
+        self.gpio.setwarnings(False)
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setup(self.pin, self.gpio.OUT)
+        self.pwm = self.gpio.PWM(self.pin, PWM_FREQUENCY)
+        self.pwm.start(0)
+
+        self._moves = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="servo", daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        while True:
+            item = self._moves.get()
+            if item is None:
+                return
+            angle, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                wait = settle_time(self.angle, angle, self.speed, self.settle_base)
+                self.pwm.ChangeDutyCycle(angle_to_duty(angle))
+                self._sleep(wait)
+                self.pwm.ChangeDutyCycle(0)  # Stop signal to avoid jitter
+                self.angle = angle
+                future.set_result(angle)
+            except Exception as e:
+                future.set_exception(e)
+
+    def move_to(self, angle):
+        """Queue a move; returns a Future that resolves once the servo has settled."""
+        low, high = SERVO_RANGE
+        if not low <= angle <= high:
+            raise ValueError(f"ERROR: angle {angle} outside servo range {SERVO_RANGE}")
+        future = Future()
+        self._moves.put((angle, future))
+        return future
+
+    def close(self):
+        self._moves.put(None)
+        self._worker.join()
+        self.pwm.stop()
+        self.gpio.cleanup()
+
+
+class ScanPlan:
+    """Visits several angles, capturing one frame per stop.
+
+    Each captured frame goes onto frame_queue as (angle, timestamp, frame) and the move
+    to the next stop starts straight away, so inference on the previous frame (done by
+    whoever consumes frame_queue) overlaps with the camera moving.
+    """
+
+    def __init__(self, angles, dwell=0.0):
+        self.angles = list(angles)
+        self.dwell = dwell  # Extra pause at each stop, e.g. for auto-exposure
+
+    def run(self, controller, capture, frame_queue, stop_event=None):
+        captured = 0
+        pending = controller.move_to(self.angles[0]) if self.angles else None
+        for i, angle in enumerate(self.angles):
+            pending.result()
+            if self.dwell:
+                time.sleep(self.dwell)
+
+            frame = capture(angle)
+
+            # Start the next move before handing the frame off
+            if i + 1 < len(self.angles):
+                pending = controller.move_to(self.angles[i + 1])
+            if frame is not None:
+                frame_queue.put((angle, time.time(), frame))
+                captured += 1
+            if stop_event is not None and stop_event.is_set():
+                break
+        return captured
+
+    def start(self, controller, capture, frame_queue, stop_event=None):
+        thread = threading.Thread(
+            target=self.run, args=(controller, capture, frame_queue, stop_event), name="scan", daemon=True
+        )
+        thread.start()
+        return thread
@@ -0,0 +1,332 @@
+import os
+import sys
+import json
+import time
+import queue
+import pickle
+import random
+import threading
+import subprocess
+from collections import Counter, defaultdict
+from plant_tracker import box_iou
+
+# Shadow (A/B) evaluation of a candidate weights file.
+#
+# A sampled fraction of frames is handed, after the production model has run, to a
+# separate worker process that runs the candidate model at idle CPU priority with a
+# single thread. Box agreement, stage agreement and latency are appended to a JSONL log
+# per frame, and summarize()/format_report() turn the log into a rollout report:
+#     python shadow_eval.py [log_path]
+
+BASE_DIR = "/home/Agrisense/Thesis"
+CANDIDATE_MODEL_PATH = os.getenv("CANDIDATE_MODEL_PATH", "")  # Empty = shadow mode off
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.1"))  # Fraction of frames evaluated
+SHADOW_LOG_PATH = os.getenv("SHADOW_LOG_PATH", os.path.join(BASE_DIR, "Shadow", "shadow_eval.jsonl"))
+SHADOW_THREADS = int(os.getenv("SHADOW_THREADS", "1"))  # Torch threads in the worker process
+# Also time the production model inside the worker, so the latency delta compares like with like.
+# It costs a second production inference, so only every SHADOW_PAIRED_EVERY-th evaluated frame pays it.
+SHADOW_PAIRED_LATENCY = os.getenv("SHADOW_PAIRED_LATENCY", "1") == "1"
+SHADOW_PAIRED_EVERY = max(1, int(os.getenv("SHADOW_PAIRED_EVERY", "5")))
+SHADOW_QUEUE_SIZE = 2  # Frames waiting for the worker; further samples are dropped
+MATCH_IOU = 0.5  # Minimum IoU for a candidate box to agree with a production box
+
+
+# Function to drop the calling process to idle scheduling (nice 19 where SCHED_IDLE is unavailable)
+def lower_priority():
+    try:
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+        return "idle"
+    except (AttributeError, OSError):
+        pass
+    try:
+        os.nice(19)
+        return "nice19"
+    except OSError:
+        return "normal"
+
+
+# Function to pair boxes greedily by IoU; returns [(production_index, candidate_index, iou)]
+def match_boxes(production_boxes, candidate_boxes, threshold=MATCH_IOU):
+    pairs = sorted(
+        ((box_iou(a, b), i, j) for i, a in enumerate(production_boxes) for j, b in enumerate(candidate_boxes)),
+        reverse=True,
+    )
+    used_production, used_candidate, matches = set(), set(), []
+    for iou, i, j in pairs:
+        if iou < threshold:
+            break
+        if i in used_production or j in used_candidate:
+            continue
+        used_production.add(i)
+        used_candidate.add(j)
+        matches.append((i, j, iou))
+    return matches
+
+
+def compare(production_boxes, candidate_boxes, production_stage, candidate_stage):
+    matches = match_boxes(production_boxes, candidate_boxes)
+    matched = len(matches)
+    precision = matched / len(candidate_boxes) if candidate_boxes else float(not production_boxes)
+    recall = matched / len(production_boxes) if production_boxes else float(not candidate_boxes)
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        "production_count": len(production_boxes),
+        "candidate_count": len(candidate_boxes),
+        "matched": matched,
+        "precision": round(precision, 4),
+        "recall": round(recall, 4),
+        "f1": round(f1, 4),
+        "mean_iou": round(sum(m[2] for m in matches) / matched, 4) if matched else None,
+        "production_stage": production_stage,
+        "candidate_stage": candidate_stage,
+        "stage_agree": production_stage == candidate_stage,
+    }
+
+
+def _boxes_from_results(results):
+    boxes = []
+    for result in results:
+        for bbox in result.boxes.xyxy:
+            boxes.append([int(v) for v in bbox.cpu().numpy()])
+    return boxes
+
+
+# Worker process: reads pickled (job_id, frame, imgsz, paired) jobs on stdin, writes results on stdout
+def _worker_main(candidate_path, production_path, conf, threads):
+    results_out = os.fdopen(os.dup(1), "wb")
+    os.dup2(2, 1)  # Anything the libraries print goes to stderr, not into the result stream
+    priority = lower_priority()
+
+    import torch
+    torch.set_num_threads(threads)
+    from ultralytics import YOLO
+    candidate = YOLO(candidate_path)
+    production = YOLO(production_path) if production_path else None
+    print(f"Shadow worker: {candidate_path} ({priority} priority, {threads} thread(s))", file=sys.stderr)
+
+    jobs_in = sys.stdin.buffer
+    while True:
+        try:
+            job_id, frame, imgsz, paired = pickle.load(jobs_in)
+        except EOFError:
+            break
+
+        start = time.perf_counter()
+        candidate_boxes = _boxes_from_results(candidate.predict(frame, imgsz=imgsz, conf=conf, verbose=False))
+        candidate_ms = (time.perf_counter() - start) * 1000
+        production_ms = None
+        if production is not None and paired:
+            start = time.perf_counter()
+            production.predict(frame, imgsz=imgsz, conf=conf, verbose=False)
+            production_ms = (time.perf_counter() - start) * 1000
+
+        pickle.dump((job_id, candidate_boxes, candidate_ms, production_ms), results_out)
+        results_out.flush()
+
+
+class ShadowEvaluator:
+    """Runs a candidate model on sampled frames in an idle-priority worker process.
+
+    submit() never blocks the capture loop: when the worker is behind, the sample is dropped.
+    stage_of(boxes) maps a box list to one frame-level stage and is applied to both models'
+    boxes, so stage agreement reflects the models rather than the tracker's smoothing.
+    """
+
+    def __init__(self, candidate_path=CANDIDATE_MODEL_PATH, production_path=None, sample_rate=SHADOW_SAMPLE_RATE,
+                 log_path=SHADOW_LOG_PATH, conf=0.5, threads=SHADOW_THREADS, paired_latency=SHADOW_PAIRED_LATENCY,
+                 queue_size=SHADOW_QUEUE_SIZE, seed=None):
+        self.candidate_path = candidate_path
+        self.production_path = production_path
+        self.sample_rate = sample_rate
+        self.log_path = log_path
+        self.conf = conf
+        self.threads = threads
+        self.paired_latency = paired_latency and bool(production_path)
+        self.stats = Counter()
+        self._random = random.Random(seed)
+        self._jobs = queue.Queue(maxsize=queue_size)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._next_id = 0
+        self._process = None
+        self._sender = None
+
+    @property
+    def enabled(self):
+        return bool(self.candidate_path) and self.sample_rate > 0
+
+    def start(self):
+        if not self.enabled or self._process is not None:
+            return self
+        if not os.path.exists(self.candidate_path):
+            raise ValueError(f"ERROR: candidate model not found at {self.candidate_path}")
+        os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+        self._process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker", self.candidate_path,
+             self.production_path if self.paired_latency else "", str(self.conf), str(self.threads)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+        self._sender = threading.Thread(target=self._send_loop, daemon=True)
+        self._sender.start()
+        threading.Thread(target=self._receive_loop, daemon=True).start()
+        print(f"Shadow evaluation: {self.candidate_path} on {self.sample_rate:.0%} of frames -> {self.log_path}")
+        return self
+
+    def submit(self, timestamp, frame, production_boxes, production_ms, imgsz, stage_of):
+        """Queue a frame for the candidate; the frame must not be modified afterwards."""
+        if self._process is None or self._random.random() >= self.sample_rate:
+            return False
+        with self._pending_lock:
+            job_id = self._next_id
+            self._next_id += 1
+            self._pending[job_id] = (timestamp, [[int(v) for v in box[:4]] for box in production_boxes],
+                                     production_ms, stage_of)
+        try:
+            paired = self.paired_latency and job_id % SHADOW_PAIRED_EVERY == 0
+            self._jobs.put_nowait((job_id, frame, imgsz, paired))
+        except queue.Full:
+            with self._pending_lock:
+                self._pending.pop(job_id, None)
+            self.stats["dropped"] += 1
+            return False
+        self.stats["submitted"] += 1
+        return True
+
+    def _send_loop(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                self._process.stdin.close()  # EOF ends the worker loop
+                break
+            try:
+                pickle.dump(job, self._process.stdin)
+                self._process.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                print(f"Shadow worker stopped accepting frames: {e}")
+                break
+
+    def _receive_loop(self):
+        while True:
+            try:
+                job_id, candidate_boxes, candidate_ms, worker_production_ms = pickle.load(self._process.stdout)
+            except (EOFError, OSError):
+                break
+            with self._pending_lock:
+                timestamp, production_boxes, production_ms, stage_of = self._pending.pop(job_id)
+            try:
+                record = {"timestamp": timestamp, "candidate_model": self.candidate_path}
+                record.update(compare(production_boxes, candidate_boxes,
+                                      stage_of(production_boxes), stage_of(candidate_boxes)))
+                record["production_ms"] = round(production_ms, 1)
+                record["candidate_ms"] = round(candidate_ms, 1)
+                if worker_production_ms is not None:
+                    record["paired_production_ms"] = round(worker_production_ms, 1)
+                    record["latency_delta_ms"] = round(candidate_ms - worker_production_ms, 1)
+                self._log(record)
+                self.stats["evaluated"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Error evaluating shadow frame {timestamp}: {e}")
+
+    def _log(self, record):
+        with self._log_lock, open(self.log_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def stop(self, timeout=10):
+        if self._process is None:
+            return
+        # Never block the caller on a full queue: drop the frames still waiting, then send EOF
+        while True:
+            try:
+                self._jobs.put_nowait(None)
+                break
+            except queue.Full:
+                try:
+                    job_id = self._jobs.get_nowait()[0]
+                except queue.Empty:
+                    continue
+                with self._pending_lock:
+                    self._pending.pop(job_id, None)
+                self.stats["dropped"] += 1
+        self._sender.join(timeout)
+        try:
+            self._process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+        self._process = None
+
+    def report(self):
+        return summarize(load_records(self.log_path))
+
+
+def load_records(log_path=SHADOW_LOG_PATH):
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(fraction * len(values)))], 1)
+
+
+def _mean(values):
+    return round(sum(values) / len(values), 4) if values else None
+
+
+def summarize(records):
+    confusion = defaultdict(Counter)
+    for record in records:
+        confusion[str(record["production_stage"])][str(record["candidate_stage"])] += 1
+    deltas = [r["latency_delta_ms"] for r in records if r.get("latency_delta_ms") is not None]
+    paired = [r["paired_production_ms"] for r in records if r.get("paired_production_ms") is not None]
+    return {
+        "frames": len(records),
+        "candidate_models": sorted({r["candidate_model"] for r in records}),
+        "box_f1": _mean([r["f1"] for r in records]),
+        "box_precision": _mean([r["precision"] for r in records]),
+        "box_recall": _mean([r["recall"] for r in records]),
+        "mean_iou": _mean([r["mean_iou"] for r in records if r["mean_iou"] is not None]),
+        "count_delta": _mean([r["candidate_count"] - r["production_count"] for r in records]),
+        "stage_agreement": _mean([float(r["stage_agree"]) for r in records]),
+        "stage_confusion": {stage: dict(counts) for stage, counts in confusion.items()},
+        "production_ms_p50": _percentile([r["production_ms"] for r in records], 0.5),
+        "paired_production_ms_p50": _percentile(paired, 0.5),
+        "paired_frames": len(paired),
+        "candidate_ms_p50": _percentile([r["candidate_ms"] for r in records], 0.5),
+        "candidate_ms_p95": _percentile([r["candidate_ms"] for r in records], 0.95),
+        "latency_delta_ms_mean": _mean(deltas),
+    }
+
+
+def format_report(summary):
+    lines = [
+        f"Shadow evaluation over {summary['frames']} frame(s): {', '.join(summary['candidate_models']) or '-'}",
+        f"  Boxes:   F1 {summary['box_f1']}  precision {summary['box_precision']}  recall {summary['box_recall']}"
+        f"  mean IoU {summary['mean_iou']}  count delta {summary['count_delta']}",
+        f"  Stages:  agreement {summary['stage_agreement']}",
+    ]
+    for production_stage, counts in sorted(summary["stage_confusion"].items()):
+        lines.append(f"           {production_stage} -> " + ", ".join(f"{s}: {n}" for s, n in sorted(counts.items())))
+    # Only the paired figures compare like with like; live production runs multi-threaded in the busy
+    # capture process, the candidate single-threaded at idle priority in the worker
+    lines.append(
+        f"  Latency: paired (worker, same frame) production p50 {summary['paired_production_ms_p50']}ms, "
+        f"delta {summary['latency_delta_ms_mean']}ms over {summary['paired_frames']} frame(s)"
+    )
+    lines.append(
+        f"           unpaired, not comparable: candidate p50 {summary['candidate_ms_p50']}ms "
+        f"p95 {summary['candidate_ms_p95']}ms (worker), production p50 {summary['production_ms_p50']}ms (live)"
+    )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        _worker_main(sys.argv[2], sys.argv[3], float(sys.argv[4]), int(sys.argv[5]))
+    else:
+        print(format_report(summarize(load_records(sys.argv[1] if len(sys.argv) > 1 else SHADOW_LOG_PATH))))
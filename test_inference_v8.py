@@ -1,109 +1,126 @@
 import os
+import time
 import base64
-import numpy as np
-import subprocess
 from datetime import datetime
-from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials, db
+from collections import Counter
+from firebase_client import get_client
 from ultralytics import YOLO  # YOLO model for inference
 import cv2  # OpenCV for processing
-
-# Load environment variables from .env
-dotenv_path = os.path.join(os.path.dirname(__file__), "venv/.env")
-load_dotenv(dotenv_path)
-
-# Retrieve Firebase credentials from .env
-FIREBASE_DB_URL = os.getenv("FIREBASE_DB_URL")
-SERVICE_ACCOUNT_PATH = os.getenv("SERVICE_ACCOUNT_PATH", "venv/serviceAccountKey.json")
-
-# Validate environment variables
-if not FIREBASE_DB_URL:
-    raise ValueError("ERROR: FIREBASE_DB_URL is missing from .env!")
-if not os.path.exists(SERVICE_ACCOUNT_PATH):
-    raise ValueError(f"ERROR: Service account key not found at {SERVICE_ACCOUNT_PATH}")
-
-# Initialize Firebase
-try:
-    firebase_admin.delete_app(firebase_admin.get_app())
-except ValueError:
-    pass  
-
-cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
-firebase_admin.initialize_app(cred, {"databaseURL": FIREBASE_DB_URL})
+from plant_tracker import PlantTracker
+from growth_classifier import StageClassifier
+from camera_calibration import CameraModel
+from leaf_segmentation import CanopyMask
+from frame_quality import FrameQualityGate
+from frame_archive import FrameArchive
+from edge_sync import EdgeSync
+from annotation_renderer import AnnotationRenderer
+from burst_capture import BURST_FRAMES, BurstCapture, open_camera_session
+from replay_source import CAPTURE_SOURCE, ReplaySource
+from capture_journal import CaptureJournal
+from runtime_config import configure_threads, warm_up, ResourceGovernor
+from detection_index import DetectionIndex
+from shadow_eval import ShadowEvaluator
+from growth_analytics import GrowthAnalytics, capture_metrics
+from adaptive_resolution import AdaptiveResolution
+
+# Firebase: one shared, pooled client per process (.env settings and USE_FIREBASE_EMULATOR=1 in firebase_client.py)
+firebase = get_client()
 
 # Ensure directory structure exists
 BASE_DIR = "/home/Agrisense/Thesis"
 CAPTURED_RAW_DIR = os.path.join(BASE_DIR, "Captured", "Raw")
+CAPTURED_REPLAY_DIR = os.path.join(BASE_DIR, "Captured", "Replay")  # Frames decoded from replayed video
 DETECTED_DIR = os.path.join(BASE_DIR, "Detected", "Detected")
 
 for directory in [CAPTURED_RAW_DIR, DETECTED_DIR]:
     os.makedirs(directory, exist_ok=True)
 
-# Load trained model
-model = YOLO("/home/Agrisense/Thesis/best.pt")
+# Local frame archive (retention, dedupe and disk cap; see frame_archive.py)
+archive = FrameArchive(os.path.join(BASE_DIR, "archive_index.jsonl"))
+
+# Local query index over detection history (detection_index.py)
+detection_index = DetectionIndex(os.path.join(BASE_DIR, "detections.sqlite3"))
+TRAY_ID = os.getenv("TRAY_ID", "tray1")
+
+# Write-ahead journal of each frame's pipeline state, replayed at start-up (capture_journal.py)
+journal = CaptureJournal("v8")
+
+# Running growth rates, anomaly z-scores and stall alerts, updated per capture (growth_analytics.py)
+growth = GrowthAnalytics(os.path.join(BASE_DIR, "growth_analytics_state.json"))
+
+# Upload mode: SYNC_MODE=immediate (default) or two_tier; see edge_sync.py
+edge_sync = EdgeSync(firebase)
+edge_sync.start()
+
+# Burst capture (BURST_FRAMES > 1): keep one camera session open and pick the best frame
+burst_camera = BurstCapture(open_camera_session(1024, 768)) if BURST_FRAMES > 1 and not CAPTURE_SOURCE else None
+
+# Replay (CAPTURE_SOURCE set): recorded frames on their own clock, no prompts; see replay_source.py
+replay = ReplaySource(CAPTURE_SOURCE) if CAPTURE_SOURCE else None
+
+# Load trained model (MODEL_PATH overrides the default weights)
+MODEL_PATH = os.getenv("MODEL_PATH", "/home/Agrisense/Thesis/best.pt")
+MODEL_VERSION = os.getenv("MODEL_VERSION", datetime.fromtimestamp(os.path.getmtime(MODEL_PATH)).strftime("best-%Y%m%d"))
+model = YOLO(MODEL_PATH)
+
+# Runtime setup: fixed thread pools, warm-up pass, and a governor for heat / load
+configure_threads()
+warm_up(model)
+governor = ResourceGovernor()
+
+# Per-frame imgsz: low first, escalated for small or uncertain boxes, remembered per tray
+resolution = AdaptiveResolution(state_path=os.path.join(BASE_DIR, "adaptive_resolution.json"), governor=governor)
+
+# Shadow evaluation: CANDIDATE_MODEL_PATH runs on SHADOW_SAMPLE_RATE of frames at idle priority
+shadow = ShadowEvaluator(production_path=MODEL_PATH).start()
 
 # Trigonometry Constants
 CAMERA_ANGLE = 45  
 CAMERA_HEIGHT = 30  
 FOCAL_LENGTH = 800  
 
-# Growth Stage Thresholds
-GROWTH_THRESHOLDS = {
-    "seedling": {"height": 5, "leaves": 4, "leaf_area": 15},
-    "vegetative": {"height": 15, "leaves": 8, "leaf_area": 50},
-    "mature": {"height": 25, "leaves": 12, "leaf_area": 100},
-}
-
-# Function to estimate height using trigonometry
-def estimate_height(bbox):
-    pixel_height = bbox[3] - bbox[1]
-    real_height = (CAMERA_HEIGHT * pixel_height) / FOCAL_LENGTH
-    real_height /= np.tan(np.radians(CAMERA_ANGLE))
-    return round(real_height, 2)
-
-# Function to estimate leaf area
-def estimate_leaf_area(bbox):
-    pixel_width = bbox[2] - bbox[0]
-    pixel_height = bbox[3] - bbox[1]
-    pixel_area = pixel_width * pixel_height  
-    scale_factor = 0.05  
-    real_area = pixel_area * scale_factor
-    return round(real_area, 2)
-
-# Improved Leaf Counting using Contours
-def count_leaves(image_path):
-    image = cv2.imread(image_path)
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2)
-    
-    kernel = np.ones((3,3), np.uint8)
-    thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=2)
+# Growth Stage Thresholds (per-crop tables in growth_stages.json, reloaded when edited)
+stage_classifier = StageClassifier(crop=os.getenv("CROP_TYPE"), hot_reload=True)
 
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    min_leaf_area = 500  
-    leaf_contours = [c for c in contours if cv2.contourArea(c) > min_leaf_area]
+# Camera model: checkerboard calibration if present (camera_calibration.py), else FOCAL_LENGTH
+camera_model = CameraModel.load(CAMERA_HEIGHT, CAMERA_ANGLE, FOCAL_LENGTH)
 
-    output = image.copy()
-    cv2.drawContours(output, leaf_contours, -1, (0, 255, 0), 2)
+# Function to estimate height from the per-pixel scale table
+def estimate_height(bbox, view):
+    return round(view.box_height_cm(bbox), 2)
 
-    processed_image_path = image_path.replace(".jpg", "_contours.jpg")
-    cv2.imwrite(processed_image_path, output)
+# Function to estimate leaf area: green canopy pixels in the box on the ground-plane area table
+def estimate_leaf_area(bbox, view, canopy):
+    return round(canopy.box_area_cm2(bbox, view), 2)
 
+# Leaf Counting using Contours of the canopy mask (drawing is left to the annotation renderer)
+def count_leaves(canopy):
+    leaf_contours = canopy.leaf_contours()
     leaf_count = len(leaf_contours)
-    print(f"Detected Leaves: {leaf_count} (Processed image saved at {processed_image_path})")
+    print(f"Detected Leaves: {leaf_count}")
     
-    return leaf_count, processed_image_path
+    return leaf_count, leaf_contours
 
 # Function to classify growth stage
 def classify_growth(height, leaf_count, leaf_area):
-    if height < GROWTH_THRESHOLDS["seedling"]["height"] and leaf_count < GROWTH_THRESHOLDS["seedling"]["leaves"] and leaf_area < GROWTH_THRESHOLDS["seedling"]["leaf_area"]:
-        return "Seedling"
-    elif height < GROWTH_THRESHOLDS["vegetative"]["height"] and leaf_count < GROWTH_THRESHOLDS["vegetative"]["leaves"] and leaf_area < GROWTH_THRESHOLDS["vegetative"]["leaf_area"]:
-        return "Vegetative"
-    else:
-        return "Mature"
+    return stage_classifier.classify_one(height, leaf_count, leaf_area)
+
+# Function to reduce a capture's boxes to one stage without tracker smoothing (shadow comparisons)
+def frame_stage(boxes, view, canopy, leaf_count):
+    if not boxes:
+        return None
+    stages = stage_classifier.classify_names([estimate_height(bbox, view) for bbox in boxes], [leaf_count] * len(boxes),
+                                             [estimate_leaf_area(bbox, view, canopy) for bbox in boxes])
+    return str(Counter(stages).most_common(1)[0][0])
+
+# Pre-inference gate for dark, blurred or empty frames (per-reason counts in quality_gate.stats)
+quality_gate = FrameQualityGate()
+
+# Annotated output: one reused buffer, rendered every ANNOTATE_EVERY_N captures
+renderer = AnnotationRenderer()
+
+# Per-plant tracking across captures (smooths height/area and the reported stage)
+tracker = PlantTracker(classify_many=stage_classifier.classify_names)
 
 
 # Function to Show Terminal-Based Preview Before Capturing
@@ -121,6 +138,9 @@ def show_preview():
 
 # Function to capture image
 def capture_image():
+    if replay is not None:
+        return replay_image()
+
     try:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         image_path = os.path.join(CAPTURED_RAW_DIR, f"{timestamp}.jpg")
@@ -134,7 +154,14 @@ def capture_image():
                 print("Capture canceled.")
                 return None, None
 
-        os.system(f"libcamera-jpeg -o {image_path} --width 1024 --height 768 --quality 85 --nopreview")
+        if burst_camera is not None:
+            # Best of a burst from the persistent session instead of one libcamera-jpeg shot
+            ok, frame = burst_camera.read()
+            if not ok:
+                raise RuntimeError("ERROR: burst capture returned no frames")
+            cv2.imwrite(image_path, frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        else:
+            os.system(f"libcamera-jpeg -o {image_path} --width 1024 --height 768 --quality 85 --nopreview")
 
         return image_path, timestamp
 
@@ -142,6 +169,20 @@ def capture_image():
         print(f"Error capturing image: {e}")
         return None, None
 
+# Function to take the next replayed frame, stamped with its recorded time
+def replay_image():
+    ok, frame = replay.read()
+    if not ok:
+        print(f"Replay finished after {replay.frames_read} frames")
+        return None, None
+    timestamp = replay.timestamp.strftime("%Y%m%d_%H%M%S")
+    if replay.path:
+        return replay.path, timestamp  # Replayed image files are read in place, never rewritten
+    os.makedirs(CAPTURED_REPLAY_DIR, exist_ok=True)
+    image_path = os.path.join(CAPTURED_REPLAY_DIR, f"{timestamp}.jpg")
+    cv2.imwrite(image_path, frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return image_path, timestamp
+
 # Function to upload images to Firebase
 def upload_image(image_path, image_type, timestamp):
     try:
@@ -149,12 +190,22 @@ def upload_image(image_path, image_type, timestamp):
             image_data = base64.b64encode(image_file.read()).decode('utf-8')
 
         firebase_path = f"detections/{timestamp}/{image_type}"
-        ref = db.reference(firebase_path)
+        ref = firebase.reference(firebase_path)
         ref.set(image_data)
         print(f"Uploaded {image_path} to Firebase under {firebase_path}")
     except Exception as e:
         print(f"Error uploading {image_path}: {e}")
 
+# Function to upload one capture's results and confirm they landed
+def upload_results(timestamp, parameters, images):
+    # Full detail now (immediate) or summary now + detail in off-peak batches (two_tier)
+    edge_sync.publish(timestamp, parameters, images=images)
+    journal.mark(timestamp, "uploaded")
+    print(f"Growth parameters for {timestamp} sent ({edge_sync.mode} sync)")
+
+    if edge_sync.verify(timestamp):
+        journal.mark(timestamp, "verified")
+
 # Function to process image and upload growth parameters
 def process_image(raw_image_path, timestamp):
     detected_image_path = os.path.join(DETECTED_DIR, f"{timestamp}.jpg")
@@ -164,48 +215,127 @@ def process_image(raw_image_path, timestamp):
         if image is None:
             raise FileNotFoundError(f"ERROR: Image file not found at {raw_image_path}")
 
-        results = model.predict(image, conf=0.5)
-        output_image = results[0].plot()
-
-        leaf_count, processed_image_path = count_leaves(raw_image_path)
-        total_leaf_area = 0
-        estimated_height = 0
-
+        # Frames that fail the quality gate get a small "skipped" record instead of inference and uploads
+        quality = quality_gate.check(image)
+        if not quality.ok:
+            firebase.reference("/").update(quality_gate.skipped_update(timestamp, quality))
+            journal.mark(timestamp, "skipped", reason=quality.reason)
+            print(f"Skipped {timestamp}: {quality.reason} {quality.metrics}")
+            return None
+
+        # Undistort once; the scale tables are built for undistorted pixels
+        view = camera_model.view(image.shape)
+        image = view.undistort(image)
+
+        governor.update()
+        start = time.perf_counter()
+        results, imgsz = resolution.predict(model, image, tray=TRAY_ID, conf=0.5)
+        inference_ms = (time.perf_counter() - start) * 1000
+
+        # One vegetation mask per frame serves leaf area (per box, O(1)) and leaf contours
+        canopy = CanopyMask(image)
+        leaf_count, leaf_contours = count_leaves(canopy)
+
+        detections = []
+        box_records = []
         for result in results:
-            for bbox in result.boxes.xyxy:
+            for bbox, conf, cls in zip(result.boxes.xyxy, result.boxes.conf, result.boxes.cls):
                 bbox = bbox.cpu().numpy().astype(int)
-
-                estimated_height = estimate_height(bbox)
-                leaf_area = estimate_leaf_area(bbox)
-                total_leaf_area += leaf_area
-
-                growth_stage = classify_growth(estimated_height, leaf_count, total_leaf_area)
-
-        firebase_path = f"detections/{timestamp}/growth_parameters"
-        ref = db.reference(firebase_path)
-        ref.set({
-            "height_cm": estimated_height,
+                detections.append((bbox, estimate_height(bbox, view), estimate_leaf_area(bbox, view, canopy), leaf_count))
+                box_records.append({"xyxy": bbox.tolist(), "conf": round(float(conf), 4), "cls": int(cls)})
+
+        # Sampled frames also go to the candidate model (dropped if the shadow worker is busy)
+        shadow.submit(timestamp, image, [detection[0] for detection in detections], inference_ms, imgsz,
+                      lambda boxes: frame_stage(boxes, view, canopy, leaf_count))
+
+        # Link boxes to plants seen in earlier captures and report their smoothed state
+        tracks = tracker.update(detections)
+        summary = tracker.summary()
+
+        # One annotated copy (boxes, stages and contours together), skipped on decimated cycles
+        images = {}
+        if renderer.should_render():
+            labels = [f"#{track.track_id} {track.stage} ({round(track.height, 2)}cm)" for track in tracks]
+            boxes = [detection[0] for detection in detections]
+            images["Detected"] = renderer.write(detected_image_path, image, boxes, labels, leaf_contours)
+        else:
+            detected_image_path = None
+
+        parameters = {
+            "height_cm": summary["height_cm"],
             "leaf_count": leaf_count,
-            "leaf_area_cm2": total_leaf_area,
-            "growth_stage": growth_stage
-        })
-        print(f"Growth parameters uploaded to {firebase_path}")
-
-        cv2.imwrite(detected_image_path, output_image)
-        upload_image(detected_image_path, "Detected", timestamp)
-
-        return detected_image_path, processed_image_path
+            "leaf_area_cm2": summary["leaf_area_cm2"],
+            "growth_stage": summary["growth_stage"],
+            "plants": tracker.plant_records()
+        }
+
+        # Fold the capture into the running trends so alerts go out with this record
+        metrics = capture_metrics(len(detections), summary["height_cm"], summary["leaf_area_cm2"], leaf_count)
+        trend = growth.update(timestamp, metrics, series=TRAY_ID)
+        parameters["growth_rate_per_day"] = {name: stats["rate_per_day"] for name, stats in trend["metrics"].items()}
+        parameters["growth_alerts"] = trend["alerts"]
+        if trend["alerts"]:
+            print(f"⚠️ Growth alerts: {', '.join(trend['alerts'])}")
+
+        # Index the record locally with its boxes and frame paths for history queries
+        detection_index.add(dict(
+            parameters,
+            timestamp=timestamp,
+            tray=TRAY_ID,
+            model_version=MODEL_VERSION,
+            boxes=box_records,
+            image_width=image.shape[1],
+            image_height=image.shape[0],
+        ), images={"raw": raw_image_path, **({"detected": detected_image_path} if detected_image_path else {})})
+
+        journal.mark(timestamp, "inferred", parameters=parameters, images=images)
+        upload_results(timestamp, parameters, images)
+
+        return detected_image_path
 
     except Exception as e:
         print(f"Error processing image: {e}")
-        return None, None
+        return None
+
+# Resume only the work a crash or power loss left unfinished; uploads are keyed by timestamp
+for entry in journal.recover():
+    try:
+        if entry["state"] == "captured":
+            if not os.path.exists(entry["raw"]):
+                journal.mark(entry["frame"], "dropped")
+                continue
+            process_image(entry["raw"], entry["frame"])
+        elif entry["state"] == "uploaded" and edge_sync.verify(entry["frame"]):
+            journal.mark(entry["frame"], "verified")
+        else:
+            upload_results(entry["frame"], entry["parameters"], entry["images"])
+    except Exception as e:
+        print(f"Error resuming {entry['frame']}: {e}")
+journal.sync()
 
 # Main loop for continuous image capture
 while True:
     raw_image_path, timestamp = capture_image()
+    if replay is not None and raw_image_path is None:
+        break
     if raw_image_path:
-        detected_image_path, processed_image_path = process_image(raw_image_path, timestamp)
-
+        journal.mark(timestamp, "captured", raw=raw_image_path)
+        detected_image_path = process_image(raw_image_path, timestamp)
+
+        # Register the cycle's frames (annotated copies become previews) and apply retention;
+        # replayed source images are not the archive's to prune
+        if not (replay is not None and raw_image_path == replay.path):
+            archive.add(raw_image_path, "raw")
+        if detected_image_path:
+            archive.add(detected_image_path, "detected")
+        archive.prune()
+
+    if replay is not None:
+        continue
     cont = input("\nPress Enter to capture again or type 'q' to quit: ")
     if cont.lower() == 'q':
         break
+
+shadow.stop()
+edge_sync.stop()  # Lets an in-flight off-peak batch finish and record its cursor
+journal.close()
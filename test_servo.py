@@ -1,26 +1,17 @@
-import RPi.GPIO as GPIO
-import time
+from servo_controller import ServoController
 
 SERVO_PIN = 18  # Update this if needed
 
-GPIO.setwarnings(False)
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(SERVO_PIN, GPIO.OUT)
-
-pwm = GPIO.PWM(SERVO_PIN, 50)  # 50Hz PWM
-pwm.start(0)
+# Moves run in the background; settle time scales with the angle travelled
+servo = ServoController(SERVO_PIN)
 
 def set_angle(angle):
-    """Move the servo to a specific angle."""
-    duty = 2 + (angle / 18)  # Convert angle to duty cycle
-    pwm.ChangeDutyCycle(duty)
-    time.sleep(1)
-    pwm.ChangeDutyCycle(0)  # Stop signal to avoid jitter
+    """Move the servo to a specific angle and wait for it to settle."""
+    return servo.move_to(angle).result()
 
 try:
     set_angle(45)  # Move servo to 315 degrees
     print("Servo set to 315 degrees")
 
 finally:
-    pwm.stop()
-    GPIO.cleanup()
+    servo.close()